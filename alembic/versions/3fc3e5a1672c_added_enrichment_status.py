@@ -0,0 +1,33 @@
+"""Added enrichment status to photos
+
+Revision ID: 3fc3e5a1672c
+Revises: 7cc9b79df0d5
+Create Date: 2026-10-18 09:12:41.204117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3fc3e5a1672c'
+down_revision: Union[str, None] = '7cc9b79df0d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing photos were enriched inline during upload, so they start out as done
+    op.add_column('photos', sa.Column('enrichment_status', sa.String(), nullable=False, server_default='done'))
+    op.add_column('photos', sa.Column('enrichment_error', sa.String(), nullable=True))
+    op.create_index(op.f('ix_photos_enrichment_status'), 'photos', ['enrichment_status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_photos_enrichment_status'), table_name='photos')
+    op.drop_column('photos', 'enrichment_error')
+    op.drop_column('photos', 'enrichment_status')
@@ -0,0 +1,34 @@
+"""Added stored files
+
+Revision ID: 4f1a9c6e2b80
+Revises: 8d3b6e1f4a27
+Create Date: 2026-10-18 19:05:41.382907
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4f1a9c6e2b80'
+down_revision: Union[str, None] = '8d3b6e1f4a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('stored_files',
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('file_path', sa.String(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('content_hash'),
+    sa.UniqueConstraint('file_path')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('stored_files')
@@ -0,0 +1,28 @@
+"""Added perceptual hash
+
+Revision ID: 5b8e0f3c2d61
+Revises: a41c7d2e9b05
+Create Date: 2026-10-18 14:21:40.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e0f3c2d61'
+down_revision: Union[str, None] = 'a41c7d2e9b05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('photos', sa.Column('perceptual_hash', sa.String(length=16), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('photos', 'perceptual_hash')
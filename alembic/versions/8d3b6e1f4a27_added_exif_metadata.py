@@ -0,0 +1,46 @@
+"""Added exif metadata
+
+Revision ID: 8d3b6e1f4a27
+Revises: c2f4a7d91e38
+Create Date: 2026-10-18 17:42:08.126533
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3b6e1f4a27'
+down_revision: Union[str, None] = 'c2f4a7d91e38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('photos', sa.Column('captured_at', sa.DateTime(), nullable=True))
+    op.add_column('photos', sa.Column('camera_make', sa.String(), nullable=True))
+    op.add_column('photos', sa.Column('camera_model', sa.String(), nullable=True))
+    op.add_column('photos', sa.Column('lens', sa.String(), nullable=True))
+    op.add_column('photos', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('photos', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('photos', sa.Column('geohash', sa.String(length=12), nullable=True))
+    op.create_index(op.f('ix_photos_camera_model'), 'photos', ['camera_model'], unique=False)
+    op.create_index(op.f('ix_photos_geohash'), 'photos', ['geohash'], unique=False)
+    op.create_index('ix_photos_captured_at_photo_id', 'photos', ['captured_at', 'photo_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_photos_captured_at_photo_id', table_name='photos')
+    op.drop_index(op.f('ix_photos_geohash'), table_name='photos')
+    op.drop_index(op.f('ix_photos_camera_model'), table_name='photos')
+    op.drop_column('photos', 'geohash')
+    op.drop_column('photos', 'longitude')
+    op.drop_column('photos', 'latitude')
+    op.drop_column('photos', 'lens')
+    op.drop_column('photos', 'camera_model')
+    op.drop_column('photos', 'camera_make')
+    op.drop_column('photos', 'captured_at')
@@ -0,0 +1,28 @@
+"""Added photo enrichment_claimed_at
+
+Revision ID: a5c9e2d7b314
+Revises: e3a8c1f56d42
+Create Date: 2026-10-18 23:20:52.640318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a5c9e2d7b314'
+down_revision: Union[str, None] = 'e3a8c1f56d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('photos', sa.Column('enrichment_claimed_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('photos', 'enrichment_claimed_at')
@@ -0,0 +1,37 @@
+"""Added pending deletions
+
+Revision ID: b7e2d5a90c13
+Revises: 4f1a9c6e2b80
+Create Date: 2026-10-18 21:12:07.514390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2d5a90c13'
+down_revision: Union[str, None] = '4f1a9c6e2b80'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('pending_deletions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('file_path', sa.String(), nullable=True),
+    sa.Column('content_hash', sa.String(length=64), nullable=True),
+    sa.Column('photo_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_photos_file_path'), 'photos', ['file_path'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_photos_file_path'), table_name='photos')
+    op.drop_table('pending_deletions')
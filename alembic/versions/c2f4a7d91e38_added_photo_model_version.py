@@ -0,0 +1,28 @@
+"""Added photo model version
+
+Revision ID: c2f4a7d91e38
+Revises: 5b8e0f3c2d61
+Create Date: 2026-10-18 16:05:12.774310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2f4a7d91e38'
+down_revision: Union[str, None] = '5b8e0f3c2d61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('photos', sa.Column('model_version', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('photos', 'model_version')
@@ -0,0 +1,30 @@
+"""Added photo perceptual_hash_at
+
+Revision ID: c4d7f1a8e925
+Revises: a5c9e2d7b314
+Create Date: 2026-10-18 23:58:14.502716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d7f1a8e925'
+down_revision: Union[str, None] = 'a5c9e2d7b314'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('photos', sa.Column('perceptual_hash_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_photos_perceptual_hash_at'), 'photos', ['perceptual_hash_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_photos_perceptual_hash_at'), table_name='photos')
+    op.drop_column('photos', 'perceptual_hash_at')
@@ -0,0 +1,27 @@
+"""Added share expiry index
+
+Revision ID: e3a8c1f56d42
+Revises: b7e2d5a90c13
+Create Date: 2026-10-18 22:03:29.117645
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a8c1f56d42'
+down_revision: Union[str, None] = 'b7e2d5a90c13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_share_photos_expires_at'), 'share_photos', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_share_photos_expires_at'), table_name='share_photos')
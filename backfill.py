@@ -0,0 +1,56 @@
+#backfill.py
+# Re-runs the AI models over photos whose stored results came from an older
+# MODEL_VERSION (new CATEGORIES, upgraded CLIP/BLIP checkpoints, another backend):
+#
+#   AI_BACKEND=torch-int8 python backfill.py --workers 4 --batch-size 32
+#
+# Progress is checkpointed after every page, so the same command resumes an
+# interrupted run and retries photos that failed. When only CATEGORIES changed, categories are re-derived from
+# the stored image embeddings and no image is decoded at all. Afterwards the
+# embedding index is compacted, dropping the rows of replaced and deleted
+# embeddings; --compact-only does just that.
+import argparse
+import logging
+import os
+from services.ai_utils import clip_batcher
+from services.backfill import Backfill
+from services.vector_index import embedding_index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-enrich photos produced by an older model version")
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per model call")
+    parser.add_argument("--workers", type=int, default=2, help="Batches decoded and inferred in parallel")
+    parser.add_argument("--page-size", type=int, default=None, help="Photos per keyset page and commit")
+    parser.add_argument("--checkpoint", default=".backfill_checkpoint.json", help="Progress file used to resume")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many photos")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--no-compact", action="store_true", help="Leave the embedding index uncompacted")
+    parser.add_argument("--compact-only", action="store_true", help="Only compact the embedding index")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    if args.compact_only:
+        print({"compacted": embedding_index.compact()})
+        return
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    # The backfill threads are the only CLIP callers in this process: let a whole
+    # --batch-size through in one call and flush once every worker is waiting
+    clip_batcher.configure(max_batch_size=max(args.batch_size, clip_batcher.max_batch_size), max_producers=args.workers)
+
+    stats = Backfill(
+        batch_size=args.batch_size,
+        workers=args.workers,
+        page_size=args.page_size,
+        checkpoint_path=args.checkpoint,
+        limit=args.limit,
+    ).run()
+    if not args.no_compact:
+        stats["compacted"] = embedding_index.compact()
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
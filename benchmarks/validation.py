@@ -0,0 +1,45 @@
+#benchmarks/validation.py
+# Compares the per-call cost of the local output validator with the Guardrails guards:
+#
+#   python -m benchmarks.validation --iterations 2000
+import argparse
+import time
+from services.ai_utils import CATEGORIES
+from services.ai_validation import VALIDATORS
+
+SAMPLE_DESCRIPTIONS = [
+    "a man riding a wave on top of a surfboard",
+    "a plate of food with broccoli and rice",
+    "a city skyline at night with lights reflecting on the water",
+]
+
+
+def bench(validator, iterations: int) -> dict:
+    started = time.perf_counter()
+    validator.load()
+    load_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    for i in range(iterations):
+        validator.category(CATEGORIES[i % len(CATEGORIES)])
+        validator.description(SAMPLE_DESCRIPTIONS[i % len(SAMPLE_DESCRIPTIONS)])
+    per_call_us = (time.perf_counter() - started) / iterations * 1e6
+    return {"load_ms": round(load_ms, 1), "per_photo_us": round(per_call_us, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the AI output validators")
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    for name, validator_class in VALIDATORS.items():
+        try:
+            result = bench(validator_class(CATEGORIES), args.iterations)
+        except Exception as e:
+            print(f"{name:<12} unavailable: {e}")
+            continue
+        print(f"{name:<12} load {result['load_ms']:>9} ms   {result['per_photo_us']:>9} us/photo")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 # database.py
 
-from sqlalchemy import create_engine
+import sqlite3
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from settings import settings
 Base = declarative_base()
@@ -15,6 +17,15 @@ else:
     connect_args = {}
     auto_create_tables = False
 
+# SQLite only honours the models' ON DELETE CASCADE with foreign keys switched on,
+# which bulk deletes (e.g. of a user and all their photos) rely on
+@event.listens_for(Engine, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
 # Set up SQLAlchemy engine and session
 engine = create_engine(DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
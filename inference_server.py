@@ -0,0 +1,72 @@
+#inference_server.py
+# Standalone inference process shared by every web worker, so the model
+# weights are loaded once per host instead of once per uvicorn worker:
+#
+#   AI_BACKEND=torch-int8 uvicorn inference_server:app --uds /tmp/photo-booth-ai.sock
+#
+# Web workers then run with AI_BACKEND=remote and AI_SERVER_SOCKET (or AI_SERVER_URL).
+import io
+from contextlib import asynccontextmanager
+from typing import List
+from fastapi import FastAPI, File, HTTPException, Response, UploadFile, status
+from PIL import Image
+from pydantic import BaseModel
+from services import ai_utils
+from settings import settings
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.AI_BACKEND == "remote":
+        raise RuntimeError("The inference server needs a local AI_BACKEND, not 'remote'")
+    # Output validation happens in the web workers, the server only runs the models
+    ai_utils.start_background_load(run_warmup=settings.AI_WARMUP, load_validator=False)
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+def _decode(upload: UploadFile) -> Image.Image:
+    try:
+        return Image.open(io.BytesIO(upload.file.read())).convert("RGB")
+    except Exception:
+        raise HTTPException(status_code=400, detail=f"Could not decode {upload.filename}")
+
+
+@app.get("/ready")
+def ready(response: Response):
+    state = ai_utils.model_state()
+    if state["status"] != "ready":
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return state
+
+
+@app.post("/classify")
+def classify(images: List[UploadFile] = File(...)):
+    # Goes through the micro-batcher, so requests from different web workers share forward passes
+    results = ai_utils.clip_batcher.submit_many([_decode(image) for image in images])
+    return {
+        "categories": [category for category, _ in results],
+        "embeddings": [embedding.tolist() for _, embedding in results],
+    }
+
+
+@app.post("/describe")
+def describe(image: UploadFile = File(...)):
+    return {"description": ai_utils._describe(_decode(image))}
+
+
+class TextQuery(BaseModel):
+    texts: List[str]
+
+
+@app.post("/encode-text")
+def encode_text(query: TextQuery):
+    ai_utils.load_models()
+    return {"embeddings": ai_utils.backend.encode_text(query.texts).tolist()}
+
+
+@app.get("/metrics")
+def metrics():
+    return {"clip_batching": ai_utils.clip_batcher.metrics()}
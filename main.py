@@ -1,4 +1,5 @@
 #main.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Depends, status
 from sqlalchemy.orm import Session
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
@@ -15,10 +16,32 @@ from routes.follow import router as follow_router
 from routes.rating import router as ratings_router
 from routes.likes import router as likes_router
 from routes.feed import router as feed_router
+from routes.ai import router as ai_router
+from services.enrichment import enrichment_queue
+from services.reaper import file_reaper
+from services.share_utils import share_expiry_sweeper
+from services.ai_utils import start_background_load
 from settings import settings
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Models load in the background so non-AI routes are served immediately
+    if settings.ENV != "testing" and settings.AI_PRELOAD:
+        start_background_load(run_warmup=settings.AI_WARMUP)
+    # Background AI enrichment workers
+    if settings.ENV != "testing":
+        enrichment_queue.start()
+        # Removes deleted photos' files after their deletes commit
+        file_reaper.start()
+        share_expiry_sweeper.start()
+    yield
+    enrichment_queue.stop()
+    file_reaper.stop()
+    share_expiry_sweeper.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Create tables
 if settings.ENV != "testing":
@@ -31,6 +54,7 @@ app.include_router(follow_router) # ROUTES FOP FOLLOW AND UNFOLLOW
 app.include_router(ratings_router) # CRUD OPERATIONS ON PHOTO AND PHOTOGRAPHER RATING
 app.include_router(likes_router) # LIKE AND DISLIKE PHOTOS
 app.include_router(feed_router) # GET USER FEED
+app.include_router(ai_router) # AI MODEL READINESS AND METRICS
 
 
 
@@ -0,0 +1,27 @@
+#migrate_storage.py
+# Moves photos stored in the old flat UPLOAD_DIR layout (<photo_id>.<ext>) into
+# the sharded, content-addressed one while the app keeps running:
+#
+#   python migrate_storage.py --page-size 500
+#
+# Each page of photos is committed on its own and old files are removed a grace
+# period later, so an interrupted run can simply be started again.
+import argparse
+import logging
+from services.storage import StorageMigration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move uploaded photos into the content-addressed store")
+    parser.add_argument("--page-size", type=int, default=500, help="Photos per keyset page and commit")
+    parser.add_argument("--grace", type=float, default=None, help="Seconds to keep old files after their rows move (default ACCESS_CACHE_TTL)")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many photos")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    stats = StorageMigration(page_size=args.page_size, grace=args.grace, limit=args.limit).run()
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey, Integer, String, JSON, UniqueConstraint , DateTime
+from sqlalchemy import Column, ForeignKey, Integer, String, JSON, UniqueConstraint , DateTime, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.mutable import MutableList
 from database import Base
@@ -10,7 +10,7 @@ class SharePhoto(Base):
     photo_id = Column(Integer, ForeignKey('photos.photo_id', ondelete='CASCADE'), primary_key=True, nullable=False)
     user_id = Column(Integer, ForeignKey('users.user_id', ondelete='CASCADE'), primary_key=True, nullable=False)
     shared_at = Column(DateTime , default=datetime.utcnow)
-    expires_at = Column(DateTime , nullable = True)
+    expires_at = Column(DateTime , nullable = True, index=True)  # for services.share_utils.ShareExpirySweeper
 
 
 class Follower(Base):
@@ -53,13 +53,13 @@ class User(Base):
     rating = Column(Integer, default=0)
 
 
-    photos = relationship("Photo", back_populates="owner", cascade="all, delete-orphan")
-    followers = relationship("Follower", foreign_keys=[Follower.user_id], cascade="all, delete")
-    following = relationship("Follower", foreign_keys=[Follower.follower_id], cascade="all, delete")
-    ratings = relationship("Rating", foreign_keys=[Rating.user_id], cascade="all, delete")
-    received_ratings = relationship("Rating", foreign_keys=[Rating.photographer_id], cascade="all, delete")
-    likes = relationship("Like", cascade="all, delete")
-    shared_photos = relationship("SharePhoto", foreign_keys=[SharePhoto.user_id], cascade="all, delete")
+    photos = relationship("Photo", back_populates="owner", cascade="all, delete-orphan", passive_deletes=True)
+    followers = relationship("Follower", foreign_keys=[Follower.user_id], cascade="all, delete", passive_deletes=True)
+    following = relationship("Follower", foreign_keys=[Follower.follower_id], cascade="all, delete", passive_deletes=True)
+    ratings = relationship("Rating", foreign_keys=[Rating.user_id], cascade="all, delete", passive_deletes=True)
+    received_ratings = relationship("Rating", foreign_keys=[Rating.photographer_id], cascade="all, delete", passive_deletes=True)
+    likes = relationship("Like", cascade="all, delete", passive_deletes=True)
+    shared_photos = relationship("SharePhoto", foreign_keys=[SharePhoto.user_id], cascade="all, delete", passive_deletes=True)
 
 
 class Photo(Base):
@@ -71,10 +71,63 @@ class Photo(Base):
     comments = Column(MutableList.as_mutable(JSON), default=lambda: [])
     tags = Column(String, default="")
     description = Column(String, default="")
-    file_path = Column(String, nullable=False)
+    file_path = Column(String, nullable=False, index=True)
+    enrichment_status = Column(String, nullable=False, default="pending", index=True)
+    enrichment_error = Column(String, nullable=True)
+    enrichment_claimed_at = Column(DateTime, nullable=True)  # when a worker set it processing
+    content_hash = Column(String(64), nullable=True, index=True)
+    perceptual_hash = Column(String(16), nullable=True)  # 64-bit dHash as hex
+    perceptual_hash_at = Column(DateTime, default=datetime.utcnow, index=True)  # last write of perceptual_hash, for near-duplicate sync
+    model_version = Column(String, nullable=True)  # MODEL_VERSION that produced tags/description
+
+    # EXIF metadata read at upload; geohash is the spatial index for bounding-box search
+    captured_at = Column(DateTime, nullable=True)
+    camera_make = Column(String, nullable=True)
+    camera_model = Column(String, nullable=True, index=True)
+    lens = Column(String, nullable=True)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String(12), nullable=True, index=True)
+
+    __table_args__ = (
+        # Keyset pagination over capture-date ranges
+        Index('ix_photos_captured_at_photo_id', 'captured_at', 'photo_id'),
+    )
 
 
     owner = relationship("User", back_populates="photos")
-    likes = relationship("Like", cascade="all, delete")
-    ratings = relationship("Rating", foreign_keys=[Rating.photo_id], cascade="all, delete")
-    shared_with = relationship("SharePhoto", foreign_keys=[SharePhoto.photo_id], cascade="all, delete")
+    likes = relationship("Like", cascade="all, delete", passive_deletes=True)
+    ratings = relationship("Rating", foreign_keys=[Rating.photo_id], cascade="all, delete", passive_deletes=True)
+    shared_with = relationship("SharePhoto", foreign_keys=[SharePhoto.photo_id], cascade="all, delete", passive_deletes=True)
+
+
+class StoredFile(Base):
+    __tablename__ = 'stored_files'
+
+    # One file per distinct content under UPLOAD_DIR, shared by every photo with these bytes
+    content_hash = Column(String(64), primary_key=True)
+    file_path = Column(String, nullable=False, unique=True)
+    ref_count = Column(Integer, nullable=False, default=0)
+
+
+class PendingDeletion(Base):
+    __tablename__ = 'pending_deletions'
+
+    # Journal of files to remove once the rows that used them are gone, written in
+    # the deleting transaction and worked off by services.reaper after it commits
+    id = Column(Integer, primary_key=True)
+    file_path = Column(String, nullable=True)
+    content_hash = Column(String(64), nullable=True)  # set when file_path is a stored file
+    photo_id = Column(Integer, nullable=True)  # whose renditions and embedding go too
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class AIResult(Base):
+    __tablename__ = 'ai_results'
+
+    # sha256 of the uploaded bytes, so identical files share one inference result
+    content_hash = Column(String(64), primary_key=True)
+    tags = Column(String, default="")
+    description = Column(String, default="")
+    model_version = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
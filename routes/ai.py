@@ -0,0 +1,19 @@
+from fastapi import APIRouter, Response, status
+from services.ai_utils import clip_batcher, model_state
+from schemas.ai import AIMetrics, ModelState
+
+router = APIRouter(
+    prefix="/ai",
+    tags=["AI"]
+)
+
+@router.get("/metrics", response_model=AIMetrics)
+def get_ai_metrics():
+    return {"clip_batching": clip_batcher.metrics()}
+
+@router.get("/ready", response_model=ModelState)
+def get_ai_readiness(response: Response):
+    state = model_state()
+    if state["status"] != "ready":
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return state
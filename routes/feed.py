@@ -5,6 +5,8 @@ from models import User, Photo, Follower, Like
 from dependencies import get_db
 from auth import get_current_user
 from schemas.feed import FeedResponse, FeedPhoto
+from services.access import check_photo_access
+from services.signed_urls import photo_urls, url_expiry
 
 router = APIRouter(
     prefix="/feed",
@@ -46,6 +48,8 @@ def get_user_feed(
         .group_by(Photo.photo_id,Photo.file_path)
     )
 
+    # Everything here is by someone the user follows, so it may be viewed
+    expires = url_expiry()
     feed_photos = [
         FeedPhoto(
             photo_id=row.photo_id,
@@ -54,7 +58,8 @@ def get_user_feed(
             tags=row.tags,
             description=row.description,
             average_rating=row.average_rating,
-            like_count=row.like_count
+            like_count=row.like_count,
+            **photo_urls(row.photo_id, row.file_path, expires)
         )
         for row in feed_photos_query.all()
     ]
@@ -88,6 +93,10 @@ def get_user_feed(
             average_rating=photo_of_day_query.average_rating,
             like_count=photo_of_day_query.like_count
         )
+        # Picked from all photos, so only linked if this user may see it
+        access = check_photo_access(db, current_user.user_id, photo_of_day.photo_id)
+        if access and access.allowed:
+            photo_of_day = photo_of_day.model_copy(update=photo_urls(photo_of_day.photo_id, photo_of_day.file_path, expires))
 
     return {
         "feed_photos": feed_photos,
@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 from dependencies import get_db
 from auth import get_current_user
 from models import User, Follower
+from services.access import access_cache
 from schemas.follow import FollowResponse , UnfollowResponse , FollowList , FollowedUser
 router = APIRouter(
     prefix="/follow",
@@ -33,6 +34,7 @@ def follow_user(user_id: int, db: Session = Depends(get_db), current_user: User
     follow = Follower(user_id=user_id, follower_id=current_user.user_id)
     db.add(follow)
     db.commit()
+    access_cache.invalidate_viewer(current_user.user_id)
     return {"detail": f"You are now following {target_user.username}."}
 
 
@@ -45,6 +47,7 @@ def unfollow_user(user_id: int, db: Session = Depends(get_db), current_user: Use
 
     db.delete(follow)
     db.commit()
+    access_cache.invalidate_viewer(current_user.user_id)
     return {"detail": "Successfully unfollowed."}
 
 @router.get("/following", response_model=FollowList)
@@ -1,17 +1,31 @@
 #photo.py
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, status , Query , BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, status , Query , Request
+from sqlalchemy import and_, or_, literal, select, true
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import os
+import time
 from dependencies import get_db
 from auth import get_current_user
-from models import User , Photo , SharePhoto , Follower
-from schemas.photo import PhotoUploadResponse, PhotoListItem
-from services.ai_utils import classify_image, describe_image
-from settings import UPLOAD_DIR
+from models import User , Photo , SharePhoto
+from schemas.photo import PhotoUploadResponse, BatchUploadResponse, PhotoListItem, PhotoEnrichmentStatus, PhotoHashLookup, SimilarPhoto, PhotoSearchPage, NearDuplicate, PhotoMetadataPage, SignedPhotoUrl, BulkShareRequest, BulkShareResponse
+from services.enrichment import enrichment_queue, apply_cached_result, apply_cached_results, PENDING
+from services.upload_utils import receive_upload
+from services import storage
+from services.storage import add_reference, dialect_insert, reference_existing, release, discard_unreferenced, storage_key, stored_key_path
+from services.signed_urls import signed_photo_url, photo_urls, verify_photo_url, url_expiry, content_hash_of
+from services.storage_backends import local_file_response
+from services.renditions import get_rendition, negotiate_format, rendition_path, FORMATS
+from services.http_cache import photo_etag, cache_headers, not_modified, not_modified_response, requested_range
+from services.vector_index import embedding_index
+from services.near_duplicates import near_duplicate_index, HammingIndex
+from services.access import visible_photos_clause, check_photo_access, access_cache
+from services.reaper import file_reaper
+from services.ai_utils import encode_text
+from services.exif import METADATA_FIELDS
+from services.geohash import covering_ranges, MAX_COVERING_CELLS
+from settings import UPLOAD_DIR, RENDITION_DIR, settings
 from datetime import datetime
-from services.share_utils import clean_expired_shares
 router = APIRouter(
     prefix="/photos",
     tags=["Photos"]
@@ -68,6 +82,7 @@ def share_photo(
     )
     db.add(share)
     db.commit()
+    access_cache.invalidate(user_id, photo_id)
 
     return {
         "message": "Photo shared successfully",
@@ -75,6 +90,59 @@ def share_photo(
         "expires_at": expiration_time.isoformat()
     }
 
+@router.post('/share', response_model=BulkShareResponse)
+def share_photos_bulk(
+    share: BulkShareRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    if current_user.role != 'Photographer':
+        raise HTTPException(status_code=403, detail="Only photographers can share photos")
+    photo_ids = sorted(set(share.photo_ids))
+    user_ids = sorted(set(share.user_ids))
+    if max(len(photo_ids), len(user_ids)) > settings.SHARE_BULK_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.SHARE_BULK_MAX_IDS} photo ids and user ids per request")
+
+    # Ownership of every photo in one query
+    owners = dict(db.query(Photo.photo_id, Photo.owner_id).filter(Photo.photo_id.in_(photo_ids)).all())
+    missing = [photo_id for photo_id in photo_ids if photo_id not in owners]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Photos not found: {missing}")
+    if any(owner_id != current_user.user_id for owner_id in owners.values()):
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    found = {row.user_id for row in db.query(User.user_id).filter(User.user_id.in_(user_ids)).all()}
+    missing = [user_id for user_id in user_ids if user_id not in found]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Users not found: {missing}")
+
+    expiration_time = datetime.utcnow() + timedelta(hours=share.hours)
+
+    # Every photo x user pair in one INSERT ... SELECT, so the statement's size (and bind
+    # parameters) grows with the ids rather than the pairs; existing shares get the new expiry
+    pairs = (
+        select(Photo.photo_id, User.user_id, literal(datetime.utcnow()), literal(expiration_time))
+        .select_from(Photo)
+        .join(User, true())
+        .where(Photo.photo_id.in_(photo_ids), User.user_id.in_(user_ids))
+    )
+    statement = dialect_insert(db)(SharePhoto).from_select(
+        ["photo_id", "user_id", "shared_at", "expires_at"], pairs
+    )
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[SharePhoto.photo_id, SharePhoto.user_id],
+        set_={"expires_at": statement.excluded.expires_at}
+    ))
+    db.commit()
+    # Per id on the shorter side rather than per pair; each only drops what is cached
+    if len(user_ids) <= len(photo_ids):
+        for user_id in user_ids:
+            access_cache.invalidate_viewer(user_id)
+    else:
+        for photo_id in photo_ids:
+            access_cache.invalidate_photo(photo_id)
+
+    return {"shared": len(photo_ids) * len(user_ids), "expires_at": expiration_time}
+
 @router.delete('/share/{photo_id}/{user_id}')
 def remove_share(
     photo_id : int,
@@ -92,6 +160,7 @@ def remove_share(
         raise HTTPException(status_code=400 , detail="No shared link present")
     db.delete(shared)
     db.commit()
+    access_cache.invalidate(user_id, photo_id)
     return {"message" : "Photo sharing revoked succesfully"}
 
 # @router.post("/upload", status_code=status.HTTP_201_CREATED, response_model=PhotoUploadResponse)
@@ -144,7 +213,7 @@ def remove_share(
 #     db.refresh(new_photo)
 
 #     return {"photo_id": new_photo.photo_id, "filename": file_name}
-@router.post("/upload", status_code=status.HTTP_201_CREATED, response_model=PhotoUploadResponse)
+@router.post("/upload", status_code=status.HTTP_202_ACCEPTED, response_model=PhotoUploadResponse)
 def upload_photo(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
@@ -153,91 +222,555 @@ def upload_photo(
     if current_user.role != 'Photographer':
         raise HTTPException(status_code=403, detail="Only Photographers can upload Photos")
 
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    if file_ext not in [".jpg", ".jpeg", ".png", ".gif"]:
-        raise HTTPException(status_code=400, detail="Invalid image format")
+    if enrichment_queue.full():
+        raise HTTPException(status_code=503, detail="Enrichment queue is full, try again later")
+
+    # Stream to a temp file and validate the image header before touching the DB;
+    # the stored extension comes from the detected format, not the client's filename
+    received = receive_upload(file, UPLOAD_DIR)
+
+    duplicate_of = _near_duplicate_of(db, current_user.user_id, received.perceptual_hash)
+    if duplicate_of is not None:
+        received.discard()
+        raise HTTPException(status_code=409, detail=f"Near-duplicate of photo {duplicate_of}")
 
-    # Create placeholder photo entry
+    # Create placeholder photo entry, AI fields are filled in by the enrichment workers
     new_photo = Photo(
         owner_id=current_user.user_id,
         comments=[],
         tags="",
         description="",
-        file_path=""
+        file_path="",
+        content_hash=received.content_hash,
+        perceptual_hash=received.perceptual_hash,
+        enrichment_status=PENDING,
+        **received.metadata
     )
-    db.add(new_photo)
-    db.flush()  # Assigns photo_id
-
-    # Construct filename and save path
-    file_name = f"{new_photo.photo_id}{file_ext}"
-    file_path = os.path.join(UPLOAD_DIR, file_name)
 
+    file_path = None
     try:
-        # Save image to disk
-        with open(file_path, "wb") as f:
-            f.write(file.file.read())
-
-        # Run AI models
-        predicted_tag = classify_image(file_path)
-        auto_description = describe_image(file_path)
+        # Stored under its content hash, so identical bytes share one file
+        file_path = add_reference(db, received.content_hash, received.ext)
+        received.move_to(file_path)
 
-        # Update photo with AI results
         new_photo.file_path = file_path
-        new_photo.tags = predicted_tag["category"]
-        new_photo.description = auto_description["description"]
+        db.add(new_photo)
+        return _finish_upload(db, new_photo, storage_key(file_path))
+
+    except Exception as e:
+        # Rollback DB changes, the placeholder row and its file reference go with it
+        db.rollback()
+
+        # Clean up any saved file no other photo uses
+        received.discard()
+        discard_unreferenced(db, file_path)
+
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+
+def _near_duplicate_of(db: Session, owner_id: int, perceptual_hash: Optional[str]) -> Optional[int]:
+    """
+    With NEAR_DUPLICATE_REJECT on, the id of the owner's closest photo to this upload, if any
+    """
+    if not settings.NEAR_DUPLICATE_REJECT or not perceptual_hash:
+        return None
+    matches = near_duplicate_index.find(db, owner_id, perceptual_hash, settings.NEAR_DUPLICATE_MAX_DISTANCE)
+    return matches[0][0] if matches else None
+
+
+def _finish_upload(db: Session, new_photo: Photo, file_name: str) -> dict:
+    # Identical bytes seen before reuse the stored AI result, everything else is queued
+    cached = apply_cached_result(db, new_photo)
+    db.commit()
+    db.refresh(new_photo)
+    near_duplicate_index.add(new_photo.owner_id, new_photo.photo_id, new_photo.perceptual_hash)
+
+    # If the queue filled up in the meantime the photo stays pending and is
+    # requeued on the next startup
+    if not cached:
+        enrichment_queue.submit(new_photo.photo_id)
+
+    return {
+        "photo_id": new_photo.photo_id,
+        "filename": file_name,
+        "enrichment_status": new_photo.enrichment_status
+    }
+
+
+@router.post("/upload/batch", status_code=status.HTTP_202_ACCEPTED, response_model=BatchUploadResponse)
+def upload_photos_batch(
+    files: List[UploadFile] = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Upload a whole shoot in one request. Files are validated one by one and
+    rejected individually; accepted ones are inserted together and enriched
+    in batches. Results are returned per file, in request order.
+    """
+    if current_user.role != 'Photographer':
+        raise HTTPException(status_code=403, detail="Only Photographers can upload Photos")
+
+    if len(files) > settings.BATCH_UPLOAD_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BATCH_UPLOAD_MAX_FILES} files per batch")
+
+    if enrichment_queue.full():
+        raise HTTPException(status_code=503, detail="Enrichment queue is full, try again later")
+
+    results = [{"filename": file.filename} for file in files]
+    received = []  # (result, ReceivedUpload) for files that passed validation
+    moved = []
+    batch_hashes = HammingIndex()  # Near-duplicates within this batch aren't in the shared index yet
 
+    try:
+        for position, (result, file) in enumerate(zip(results, files)):
+            try:
+                upload = receive_upload(file, UPLOAD_DIR)
+            except HTTPException as e:
+                result["error"] = e.detail
+                continue
+
+            if settings.NEAR_DUPLICATE_REJECT and upload.perceptual_hash:
+                duplicate_of = _near_duplicate_of(db, current_user.user_id, upload.perceptual_hash)
+                in_batch = batch_hashes.query(int(upload.perceptual_hash, 16), settings.NEAR_DUPLICATE_MAX_DISTANCE)
+                if duplicate_of is not None or in_batch:
+                    upload.discard()
+                    if duplicate_of is not None:
+                        result["error"] = f"Near-duplicate of photo {duplicate_of}"
+                    else:
+                        result["error"] = f"Near-duplicate of {files[in_batch[0][0]].filename} in this batch"
+                    continue
+                batch_hashes.add(position, int(upload.perceptual_hash, 16))
+
+            received.append((result, upload))
+
+        for _, upload in received:
+            file_path = add_reference(db, upload.content_hash, upload.ext)
+            upload.move_to(file_path)
+            moved.append(file_path)
+
+        photos = [
+            Photo(
+                owner_id=current_user.user_id,
+                comments=[],
+                tags="",
+                description="",
+                file_path=file_path,
+                content_hash=upload.content_hash,
+                perceptual_hash=upload.perceptual_hash,
+                enrichment_status=PENDING,
+                **upload.metadata
+            )
+            for (_, upload), file_path in zip(received, moved)
+        ]
+        if photos:
+            db.add_all(photos)
+            db.flush()  # One multi-row INSERT assigns every photo_id
+
+        # Identical bytes seen before reuse the stored AI result, everything else is queued
+        pending_ids = [photo.photo_id for photo in apply_cached_results(db, photos)]
+        for (result, _), photo in zip(received, photos):
+            result.update(photo_id=photo.photo_id, enrichment_status=photo.enrichment_status)
+        hashes = [(photo.photo_id, photo.perceptual_hash) for photo in photos]
         db.commit()
-        db.refresh(new_photo)
 
-        return {"photo_id": new_photo.photo_id, "filename": file_name}
+    except Exception as e:
+        db.rollback()
+        for _, upload in received:
+            upload.discard()
+        for file_path in moved:
+            discard_unreferenced(db, file_path)
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+    for photo_id, perceptual_hash in hashes:
+        near_duplicate_index.add(current_user.user_id, photo_id, perceptual_hash)
+
+    # Photos that don't fit in the queue stay pending and are requeued on the next startup
+    enrichment_queue.submit_batch(pending_ids)
+
+    return {
+        "uploaded": len(received),
+        "failed": len(files) - len(received),
+        "results": results
+    }
+
+
+@router.api_route("/hash/{content_hash}", methods=["GET", "HEAD"], response_model=PhotoHashLookup)
+def lookup_photo_by_hash(content_hash: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Lets clients check whether they already uploaded these bytes before sending them
+    """
+    photo = db.query(Photo).filter(
+        Photo.content_hash == content_hash.lower(),
+        Photo.owner_id == current_user.user_id
+    ).first()
+    if not photo:
+        raise HTTPException(status_code=404, detail="No photo with this content hash")
+    return {"content_hash": photo.content_hash, "photo_id": photo.photo_id}
+
 
+@router.post("/upload/hash/{content_hash}", status_code=status.HTTP_202_ACCEPTED, response_model=PhotoUploadResponse)
+def upload_photo_by_hash(content_hash: str, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    Create a new photo from bytes the caller has already uploaded, without sending them again
+    """
+    if current_user.role != 'Photographer':
+        raise HTTPException(status_code=403, detail="Only Photographers can upload Photos")
+
+    source = db.query(Photo).filter(
+        Photo.content_hash == content_hash.lower(),
+        Photo.owner_id == current_user.user_id
+    ).first()
+    if not source:
+        raise HTTPException(status_code=404, detail="No photo with this content hash")
+
+    new_photo = Photo(
+        owner_id=current_user.user_id,
+        comments=[],
+        tags="",
+        description="",
+        file_path="",
+        content_hash=source.content_hash,
+        perceptual_hash=source.perceptual_hash,
+        enrichment_status=PENDING,
+        **{field: getattr(source, field) for field in METADATA_FIELDS}
+    )
+
+    file_path = None
+    try:
+        # Shares the source's stored file
+        file_path = reference_existing(db, source)
+        new_photo.file_path = file_path
+        db.add(new_photo)
+        return _finish_upload(db, new_photo, storage_key(file_path))
+
+    except FileNotFoundError:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="No photo with this content hash")
     except Exception as e:
-        # Rollback DB changes
         db.rollback()
+        discard_unreferenced(db, file_path)
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
-        # Clean up any saved file
-        if os.path.exists(file_path):
-            os.remove(file_path)
 
-        # Clean up photo record (only needed if flushed ID already added a record)
-        db.query(Photo).filter(Photo.photo_id == new_photo.photo_id).delete()
-        db.commit()
+@router.get("/{photo_id}/enrichment", response_model=PhotoEnrichmentStatus)
+def get_enrichment_status(photo_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    photo = db.query(Photo).filter(Photo.photo_id == photo_id, Photo.owner_id == current_user.user_id).first()
+    if not photo:
+        raise HTTPException(status_code=404, detail="Photo not found or not authorized")
 
-        raise HTTPException(status_code=500, detail=f"Upload failed due to AI service error: {str(e)}")
+    return {
+        "photo_id": photo.photo_id,
+        "status": photo.enrichment_status,
+        "tags": photo.tags,
+        "description": photo.description,
+        "error": photo.enrichment_error
+    }
 
 
-@router.get("/{photo_id}/view")
+@router.api_route("/{photo_id}/view", methods=["GET", "HEAD"])
 def view_photo(
     photo_id: int,
-    background_tasks : BackgroundTasks,
+    request: Request,
+    size: Optional[int] = Query(None, description="Longest side in pixels, one of RENDITION_SIZES"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    background_tasks.add_task(clean_expired_shares,db)
-    photo = db.query(Photo).filter(Photo.photo_id == photo_id).first()
+    # Owner, share and follow checks in one query, and none while the decision is cached
+    photo = check_photo_access(db, current_user.user_id, photo_id)
     if not photo:
         raise HTTPException(status_code=404, detail="Photo not found")
+    if not photo.allowed:
+        raise HTTPException(status_code=403, detail="Access denied")
 
-    is_owner = photo.owner_id == current_user.user_id
+    return _serve_photo(request, photo_id, photo.file_path, photo.content_hash, size)
 
-    is_shared = db.query(SharePhoto).filter(
-        SharePhoto.photo_id == photo_id,
-        SharePhoto.user_id == current_user.user_id,
-        SharePhoto.expires_at > datetime.utcnow()  # Check expiry
-    ).first()
 
-    is_following = db.query(Follower).filter(
-        Follower.follower_id == current_user.user_id,
-        Follower.user_id == photo.owner_id
-    ).first()
-
-    if not is_owner and not is_shared and not is_following:
+@router.get("/{photo_id}/url", response_model=SignedPhotoUrl)
+def get_signed_photo_url(
+    photo_id: int,
+    size: Optional[int] = Query(None, description="Longest side in pixels, one of RENDITION_SIZES"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    A short-lived link to the photo that needs no token, e.g. for <img> tags
+    """
+    photo = check_photo_access(db, current_user.user_id, photo_id)
+    if not photo:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    if not photo.allowed:
         raise HTTPException(status_code=403, detail="Access denied")
+    if size is not None and size not in settings.RENDITION_SIZES:
+        raise HTTPException(status_code=400, detail=f"Size must be one of {settings.RENDITION_SIZES}")
 
-    if not os.path.exists(photo.file_path):
+    expires = url_expiry()
+    url = signed_photo_url(photo_id, photo.file_path, size, expires)
+    if url is None:
+        raise HTTPException(status_code=404, detail="No signed link until the photo is migrated into the store")
+    return {
+        "photo_id": photo_id,
+        "url": url,
+        "expires_at": datetime.utcfromtimestamp(expires)
+    }
+
+
+@router.api_route("/signed/{photo_id}/{key:path}", methods=["GET", "HEAD"])
+def view_signed_photo(
+    photo_id: int,
+    key: str,
+    request: Request,
+    expires: int = Query(...),
+    signature: str = Query(...),
+    size: Optional[int] = Query(None)
+):
+    """
+    Serve a URL issued by /photos/{photo_id}/url. The signature carries the
+    access decision and the file's location, so there is no token to decode
+    and no database access; a revoked share or follow applies to new URLs only.
+    """
+    # Only content-addressed keys inside UPLOAD_DIR, whatever was signed
+    file_path = stored_key_path(key)
+    if file_path is None or not verify_photo_url(photo_id, key, size, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired link")
+
+    # Browsers may keep it until the link expires, not beyond
+    max_age = max(0, expires - int(time.time()))
+    return _serve_photo(request, photo_id, file_path, content_hash_of(key), size, max_age)
+
+
+def _serve_photo(request: Request, photo_id: int, file_path: str, content_hash: Optional[str], size: Optional[int], max_age: Optional[int] = None):
+    if size is not None and size not in settings.RENDITION_SIZES:
+        raise HTTPException(status_code=400, detail=f"Size must be one of {settings.RENDITION_SIZES}")
+
+    # Conditional requests are answered before any file is opened or rendered.
+    # Past that, STORAGE_SERVE decides whether Python ships the bytes (FileResponse,
+    # or the object store given the Range, handles Range and If-Range against the
+    # same ETag) or hands them off to the web server or object store.
+    stat = storage.backend.stat
+    try:
+        if size is None:
+            etag = photo_etag(content_hash, file_path, stat=stat)
+            if not_modified(request, etag, file_path, stat=stat):
+                return not_modified_response(etag, file_path, stat=stat, max_age=max_age)
+            headers = cache_headers(etag, max_age=max_age)
+            return storage.backend.response(file_path, headers, byte_range=requested_range(request, etag))
+
+        fmt = negotiate_format(request.headers.get("accept"))
+        etag = photo_etag(content_hash, file_path, variant=f"{size}.{fmt}", stat=stat)
+        cached_path = rendition_path(photo_id, size, fmt)
+        if not_modified(request, etag, cached_path):
+            return not_modified_response(etag, cached_path, vary="Accept", max_age=max_age)
+
+        rendition = get_rendition(photo_id, file_path, size, fmt)
+        headers = cache_headers(etag, vary="Accept", max_age=max_age)
+        return local_file_response(rendition, RENDITION_DIR, settings.ACCEL_REDIRECT_RENDITION_PREFIX, headers, media_type=FORMATS[fmt][1])
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found")
 
-    return FileResponse(photo.file_path)
+
+@router.get("/{photo_id}/similar", response_model=List[SimilarPhoto])
+def similar_photos(
+    photo_id: int,
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    photo = db.query(Photo).filter(Photo.photo_id == photo_id, visible_photos_clause(current_user.user_id)).first()
+    if not photo:
+        raise HTTPException(status_code=404, detail="Photo not found")
+
+    vector = embedding_index.get(photo_id)
+    if vector is None:
+        raise HTTPException(status_code=404, detail="Photo has no embedding yet")
+
+    # Over-fetch from the index, then keep only what this user is allowed to see
+    candidates = embedding_index.search(vector, k=limit * settings.SIMILAR_OVERFETCH, exclude_ids=[photo_id])
+    scores = dict(candidates)
+    visible = db.query(Photo).filter(
+        Photo.photo_id.in_(scores.keys()),
+        visible_photos_clause(current_user.user_id)
+    ).all()
+    visible.sort(key=lambda p: scores[p.photo_id], reverse=True)
+
+    return [_scored_photo(p, scores[p.photo_id]) for p in visible[:limit]]
+
+
+@router.get("/search", response_model=PhotoSearchPage)
+def search_photos(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Free-text search over photo contents, ranked by CLIP similarity between the
+    query and each photo's image embedding. Only one page of candidates is held
+    at a time; follow next_cursor for more.
+    """
+    after = _parse_search_cursor(cursor) if cursor else None
+
+    try:
+        query = encode_text(q)
+    except RuntimeError:
+        raise HTTPException(status_code=503, detail="Search is not available right now")
+
+    results = []
+    next_cursor = None
+    batch_size = limit * settings.SIMILAR_OVERFETCH
+    while len(results) < limit:
+        candidates = embedding_index.search(query, k=batch_size, after=after)
+        if not candidates:
+            break
+
+        visible = {
+            p.photo_id: p
+            for p in db.query(Photo).filter(
+                Photo.photo_id.in_([photo_id for photo_id, _ in candidates]),
+                visible_photos_clause(current_user.user_id)
+            ).all()
+        }
+        for photo_id, score in candidates:
+            if photo_id in visible:
+                results.append(_scored_photo(visible[photo_id], score))
+                if len(results) == limit:
+                    next_cursor = f"{score!r}:{photo_id}"
+                    break
+
+        # Fewer candidates than asked for means the ranking is exhausted
+        if len(candidates) < batch_size:
+            break
+        last_id, last_score = candidates[-1]
+        after = (last_score, last_id)
+
+    return {"results": results, "next_cursor": next_cursor}
+
+
+@router.get("/search/geo", response_model=PhotoMetadataPage)
+def search_photos_geo(
+    bbox: str = Query(..., description="min_lon,min_lat,max_lon,max_lat; min_lon > max_lon crosses the antimeridian"),
+    taken_after: Optional[datetime] = None,
+    taken_before: Optional[datetime] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Visible photos taken inside a bounding box, newest upload first. The box
+    becomes a handful of range scans on the geohash index; the exact
+    coordinates only filter what those ranges return.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(value) for value in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be min_lon,min_lat,max_lon,max_lat")
+    if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise HTTPException(status_code=400, detail="bbox is out of range")
+
+    # A box across the antimeridian is two boxes
+    spans = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+    geohash_ranges = []
+    for west, east in spans:
+        for start, end in covering_ranges(min_lat, west, max_lat, east, MAX_COVERING_CELLS // len(spans)):
+            geohash_ranges.append(and_(Photo.geohash >= start, Photo.geohash < end) if end else Photo.geohash >= start)
+
+    query = db.query(Photo).filter(
+        or_(*geohash_ranges),
+        Photo.latitude.between(min_lat, max_lat),
+        or_(*[Photo.longitude.between(west, east) for west, east in spans]),
+        visible_photos_clause(current_user.user_id)
+    )
+    if taken_after:
+        query = query.filter(Photo.captured_at >= taken_after)
+    if taken_before:
+        query = query.filter(Photo.captured_at < taken_before)
+    if cursor:
+        try:
+            query = query.filter(Photo.photo_id < int(cursor))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    photos = query.order_by(Photo.photo_id.desc()).limit(limit + 1).all()
+    next_cursor = str(photos[limit - 1].photo_id) if len(photos) > limit else None
+    return {"results": photos[:limit], "next_cursor": next_cursor}
+
+
+@router.get("/search/date", response_model=PhotoMetadataPage)
+def search_photos_by_date(
+    taken_after: Optional[datetime] = None,
+    taken_before: Optional[datetime] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Visible photos by EXIF capture time, newest first, paged along the (captured_at, photo_id) index
+    """
+    query = db.query(Photo).filter(Photo.captured_at.isnot(None), visible_photos_clause(current_user.user_id))
+    if taken_after:
+        query = query.filter(Photo.captured_at >= taken_after)
+    if taken_before:
+        query = query.filter(Photo.captured_at < taken_before)
+    if cursor:
+        try:
+            captured_at, photo_id = cursor.rsplit("|", 1)
+            captured_at, photo_id = datetime.fromisoformat(captured_at), int(photo_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(or_(
+            Photo.captured_at < captured_at,
+            and_(Photo.captured_at == captured_at, Photo.photo_id < photo_id)
+        ))
+
+    photos = query.order_by(Photo.captured_at.desc(), Photo.photo_id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(photos) > limit:
+        last = photos[limit - 1]
+        next_cursor = f"{last.captured_at.isoformat()}|{last.photo_id}"
+    return {"results": photos[:limit], "next_cursor": next_cursor}
+
+
+def _parse_search_cursor(cursor: str):
+    try:
+        score, photo_id = cursor.split(":")
+        return float(score), int(photo_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _scored_photo(photo: Photo, score: float) -> dict:
+    return {
+        "photo_id": photo.photo_id,
+        "owner_id": photo.owner_id,
+        "tags": photo.tags,
+        "description": photo.description,
+        "score": round(score, 4)
+    }
+
+
+@router.get("/{photo_id}/near-duplicates", response_model=List[NearDuplicate])
+def near_duplicates(
+    photo_id: int,
+    max_distance: Optional[int] = Query(None, ge=0, le=32, description="Bits out of 64, defaults to NEAR_DUPLICATE_MAX_DISTANCE"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    The caller's other photos whose perceptual hash is within max_distance bits of this one
+    """
+    photo = db.query(Photo).filter(Photo.photo_id == photo_id, Photo.owner_id == current_user.user_id).first()
+    if not photo:
+        raise HTTPException(status_code=404, detail="Photo not found or not authorized")
+    if not photo.perceptual_hash:
+        raise HTTPException(status_code=404, detail="Photo has no perceptual hash yet")
+
+    if max_distance is None:
+        max_distance = settings.NEAR_DUPLICATE_MAX_DISTANCE
+    matches = near_duplicate_index.find(db, current_user.user_id, photo.perceptual_hash, max_distance, exclude_id=photo_id)
+    return [{"photo_id": match_id, "distance": distance} for match_id, distance in matches]
 
 
 @router.get("/", response_model=List[PhotoListItem])
@@ -246,6 +779,7 @@ def list_photos(skip: int = 0, limit: int = 10, db: Session = Depends(get_db) ,
         raise HTTPException(status_code=403 , detail="Only Photographers can view this route")
     photos = db.query(Photo).filter(Photo.owner_id == current_user.user_id).offset(skip).limit(limit).all()
     photo_list = []
+    expires = url_expiry()
     for photo in photos:
         photo_dict = {
             "photo_id": photo.photo_id,
@@ -253,7 +787,8 @@ def list_photos(skip: int = 0, limit: int = 10, db: Session = Depends(get_db) ,
             "tags": photo.tags,
             "description": photo.description,
             "average_rating": photo.average_rating,
-            "likes": len(photo.likes)
+            "likes": len(photo.likes),
+            **photo_urls(photo.photo_id, photo.file_path, expires)
         }
         photo_list.append(photo_dict)
 
@@ -266,12 +801,12 @@ def delete_photo(photo_id: int, db: Session = Depends(get_db), current_user: Use
     if not photo:
         raise HTTPException(status_code=404, detail="Photo not found or not authorized")
 
-    filepath = photo.file_path
-    
-
-    if os.path.exists(filepath):
-        os.remove(filepath)
+    # Its file, renditions and embedding are journaled and removed by the reaper once this commits
+    release(db, photo)
+    near_duplicate_index.remove(photo.photo_id)
 
     db.delete(photo)
     db.commit()
+    access_cache.invalidate_photo(photo_id)
+    file_reaper.wake()
     return
@@ -7,7 +7,10 @@ from schemas.user import UserCreate, UserOut , UserUpdate
 from dependencies import get_db
 from auth import get_current_user
 from utils import hash_password
-import os
+from services.near_duplicates import near_duplicate_index
+from services.access import access_cache
+from services.reaper import file_reaper
+from services.storage import release_photos
 router = APIRouter(
     prefix="/users",
     tags=["Users"]
@@ -87,19 +90,17 @@ def delete_user(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Fetch all photos owned by the user
-    user_photos = db.query(Photo).filter(Photo.owner_id == user_id).all()
+    # A constant number of statements however many photos they have: their files,
+    # renditions and embeddings are journaled for the reaper (files other
+    # photographers' copies still use are kept), and the database's ON DELETE
+    # CASCADE removes the photos with their likes, ratings and shares
+    release_photos(db, Photo.owner_id == user_id)
+    near_duplicate_index.remove_owner(user.user_id)
 
-    # Delete associated photo files from disk
-    for photo in user_photos:
-        if photo.file_path and os.path.exists(photo.file_path):
-            try:
-                os.remove(photo.file_path)
-            except Exception as e:
-                print(f"Error deleting file {photo.file_path}: {e}")
-
-    # Now delete the user (which cascades to photos, likes, etc.)
     db.delete(user)
     db.commit()
+    # Drops both their photos and their own access as a viewer
+    access_cache.clear()
+    file_reaper.wake()
     return None
 
@@ -0,0 +1,27 @@
+from pydantic import BaseModel
+from typing import Dict, Optional
+
+
+class BatchingMetrics(BaseModel):
+    max_batch_size: int
+    max_wait_ms: int
+    batches: int
+    items: int
+    failed_batches: int
+    queued: int
+    avg_batch_size: float
+    avg_wait_ms: float
+    batch_size_histogram: Dict[str, int]
+
+
+class AIMetrics(BaseModel):
+    clip_batching: BatchingMetrics
+
+
+class ModelState(BaseModel):
+    status: str  # not_loaded, loading, ready or failed
+    error: Optional[str] = None
+    load_seconds: Optional[float] = None
+    warmed_up: bool
+    backend: str
+    device: Optional[str] = None
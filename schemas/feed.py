@@ -9,6 +9,9 @@ class FeedPhoto(BaseModel):
     description: Optional[str]
     average_rating: float
     like_count: Optional[int] = 0
+    # Signed links that load without a token, see /photos/{photo_id}/url
+    url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
 class FeedResponse(BaseModel):
@@ -1,10 +1,35 @@
-from pydantic import BaseModel , ConfigDict
-from typing import Optional
+from pydantic import BaseModel , ConfigDict, Field
+from typing import List, Optional
+from datetime import datetime
 
 
 class PhotoUploadResponse(BaseModel):
     photo_id: int
     filename: str
+    enrichment_status: str
+
+class BatchUploadItem(BaseModel):
+    filename: Optional[str]
+    photo_id: Optional[int] = None
+    enrichment_status: Optional[str] = None
+    # Why this file was rejected; the rest of the batch is unaffected
+    error: Optional[str] = None
+
+class BatchUploadResponse(BaseModel):
+    uploaded: int
+    failed: int
+    results: List[BatchUploadItem]
+
+class PhotoHashLookup(BaseModel):
+    content_hash: str
+    photo_id: int
+
+class PhotoEnrichmentStatus(BaseModel):
+    photo_id: int
+    status: str
+    tags: Optional[str]
+    description: Optional[str]
+    error: Optional[str] = None
 
 class PhotoListItem(BaseModel):
     photo_id: int
@@ -13,7 +38,61 @@ class PhotoListItem(BaseModel):
     description: Optional[str]
     average_rating: int  
     likes: int           
+    # Signed links that load without a token, see /photos/{photo_id}/url
+    url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
 
 
     model_config = ConfigDict(from_attributes=True)
 
+
+
+class BulkShareRequest(BaseModel):
+    # Every photo is shared with every user, all until the same expiry
+    photo_ids: List[int] = Field(..., min_length=1)
+    user_ids: List[int] = Field(..., min_length=1)
+    hours: int = Field(..., ge=1)
+
+class BulkShareResponse(BaseModel):
+    shared: int
+    expires_at: datetime
+
+class SignedPhotoUrl(BaseModel):
+    photo_id: int
+    url: str
+    expires_at: datetime
+
+class SimilarPhoto(BaseModel):
+    photo_id: int
+    owner_id: int
+    tags: Optional[str]
+    description: Optional[str]
+    score: float
+
+class NearDuplicate(BaseModel):
+    photo_id: int
+    # Hamming distance between the perceptual hashes, in bits out of 64
+    distance: int
+
+class PhotoMetadata(BaseModel):
+    photo_id: int
+    owner_id: int
+    tags: Optional[str]
+    description: Optional[str]
+    captured_at: Optional[datetime] = None
+    camera_make: Optional[str] = None
+    camera_model: Optional[str] = None
+    lens: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class PhotoMetadataPage(BaseModel):
+    results: List[PhotoMetadata]
+    next_cursor: Optional[str] = None
+
+class PhotoSearchPage(BaseModel):
+    results: List[SimilarPhoto]
+    # Pass back as ?cursor= to get the next page; None once the ranking is exhausted
+    next_cursor: Optional[str] = None
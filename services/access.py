@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import or_, exists, func, select
+from sqlalchemy.orm import Session
+from models import Photo, SharePhoto, Follower
+from settings import settings
+
+
+def visible_photos_clause(user_id: int):
+    """
+    SQL filter for photos a user may see: their own, ones shared with them that
+    haven't expired, and ones by photographers they follow (same rules as view_photo)
+    """
+    return or_(
+        Photo.owner_id == user_id,
+        exists().where(
+            SharePhoto.photo_id == Photo.photo_id,
+            SharePhoto.user_id == user_id,
+            SharePhoto.expires_at > datetime.utcnow()
+        ),
+        exists().where(
+            Follower.user_id == Photo.owner_id,
+            Follower.follower_id == user_id
+        ),
+    )
+
+
+# What view_photo needs to decide on and serve a photo
+PhotoAccess = namedtuple("PhotoAccess", ["allowed", "owner_id", "file_path", "content_hash"])
+
+
+class AccessCache:
+    """
+    Per-process TTL cache of (viewer, photo) -> PhotoAccess, least recently
+    used entries evicted beyond `maxsize`. Routes that change visibility
+    invalidate what they touch; other workers catch up within the TTL.
+    """
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # (viewer_id, photo_id) -> (expires_at, PhotoAccess)
+        self._by_viewer = {}
+        self._by_photo = {}
+        self._lock = threading.Lock()
+
+    def get(self, viewer_id: int, photo_id: int) -> Optional[PhotoAccess]:
+        key = (viewer_id, photo_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, viewer_id: int, photo_id: int, access: PhotoAccess, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        key = (viewer_id, photo_id)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, access)
+            self._by_viewer.setdefault(viewer_id, set()).add(key)
+            self._by_photo.setdefault(photo_id, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        if self._entries.pop(key, None) is None:
+            return
+        for index, value in ((self._by_viewer, key[0]), (self._by_photo, key[1])):
+            keys = index.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[value]
+
+    def invalidate(self, viewer_id: int, photo_id: int):
+        with self._lock:
+            self._drop((viewer_id, photo_id))
+
+    def invalidate_viewer(self, viewer_id: int):
+        with self._lock:
+            for key in list(self._by_viewer.get(viewer_id, ())):
+                self._drop(key)
+
+    def invalidate_photo(self, photo_id: int):
+        with self._lock:
+            for key in list(self._by_photo.get(photo_id, ())):
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_viewer.clear()
+            self._by_photo.clear()
+
+
+access_cache = AccessCache(ttl=settings.ACCESS_CACHE_TTL, maxsize=settings.ACCESS_CACHE_SIZE)
+
+
+def check_photo_access(db: Session, viewer_id: int, photo_id: int) -> Optional[PhotoAccess]:
+    """
+    Whether a viewer may see a photo, plus what is needed to serve it; None if
+    the photo doesn't exist. One query on a cache miss, none on a hit.
+    """
+    access = access_cache.get(viewer_id, photo_id)
+    if access is not None:
+        return access
+
+    now = datetime.utcnow()
+    share_expires = select(func.max(SharePhoto.expires_at)).where(
+        SharePhoto.photo_id == Photo.photo_id,
+        SharePhoto.user_id == viewer_id,
+        SharePhoto.expires_at > now
+    ).scalar_subquery()
+    is_following = exists().where(
+        Follower.user_id == Photo.owner_id,
+        Follower.follower_id == viewer_id
+    )
+    row = db.query(
+        Photo.owner_id, Photo.file_path, Photo.content_hash,
+        share_expires.label("share_expires"), is_following.label("is_following")
+    ).filter(Photo.photo_id == photo_id).first()
+    if row is None:
+        return None
+
+    allowed = row.owner_id == viewer_id or bool(row.is_following) or row.share_expires is not None
+    access = PhotoAccess(allowed, row.owner_id, row.file_path, row.content_hash)
+
+    # Access that only comes from a share must not outlive it in the cache
+    ttl = None
+    if allowed and row.owner_id != viewer_id and not row.is_following:
+        ttl = (row.share_expires - now).total_seconds()
+    access_cache.put(viewer_id, photo_id, access, ttl)
+    return access
@@ -0,0 +1,364 @@
+# services/ai_backends.py
+
+import hashlib
+import io
+import os
+from typing import List, Tuple
+import numpy as np
+from PIL import Image
+from settings import settings
+
+
+class InferenceBackend:
+    """
+    Runs the image models behind classify_image/describe_image.
+    Heavy libraries are imported in load() so constructing a backend is free.
+    """
+    name = "base"
+    device = None
+
+    # Normalized category text embeddings, shape (len(categories), embedding_dim)
+    text_features = None
+
+    def __init__(self, categories: List[str], clip_model_name: str, blip_model_name: str, categories_key: str, embedding_dim: int = 512):
+        self.categories = categories
+        self.clip_model_name = clip_model_name
+        self.blip_model_name = blip_model_name
+        self.categories_key = categories_key
+        self.embedding_dim = embedding_dim
+
+    def load(self):
+        raise NotImplementedError
+
+    def embed_batch(self, images: List[Image.Image]) -> np.ndarray:
+        """
+        Normalized CLIP image embeddings as a float32 array of shape (len(images), embedding_dim)
+        """
+        raise NotImplementedError
+
+    def describe(self, image: Image.Image) -> str:
+        raise NotImplementedError
+
+    def describe_batch(self, images: List[Image.Image]) -> List[str]:
+        return [self.describe(image) for image in images]
+
+    def encode_text(self, texts: List[str]) -> np.ndarray:
+        """
+        Normalized CLIP text embeddings in the same space as embed_batch, shape (len(texts), embedding_dim)
+        """
+        raise NotImplementedError
+
+    def categorize(self, embeddings: np.ndarray) -> List[str]:
+        # Cosine similarity against the cached category embeddings; CLIP's logit
+        # scale and softmax are monotonic, so the argmax is unchanged
+        similarity = embeddings @ self.text_features.T
+        return [self.categories[i] for i in similarity.argmax(axis=1).tolist()]
+
+    def classify_embed_batch(self, images: List[Image.Image]) -> Tuple[List[str], np.ndarray]:
+        embeddings = self.embed_batch(images)
+        return self.categorize(embeddings), embeddings
+
+    def classify_batch(self, images: List[Image.Image]) -> List[str]:
+        return self.classify_embed_batch(images)[0]
+
+
+def _configure_torch_threads(torch):
+    if settings.AI_NUM_THREADS > 0:
+        torch.set_num_threads(settings.AI_NUM_THREADS)
+    if settings.AI_NUM_INTEROP_THREADS > 0:
+        try:
+            torch.set_num_interop_threads(settings.AI_NUM_INTEROP_THREADS)
+        except RuntimeError:
+            pass  # Can only be set once per process, before any parallel work
+
+
+def _quantize(model):
+    """
+    Dynamic int8 quantization of the Linear layers (weights int8, activations quantized on the fly)
+    """
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _projected(features):
+    """
+    CLIP's projected embeddings: a tensor up to transformers 4.x, the pooler_output of a model output from 5.0
+    """
+    return getattr(features, "pooler_output", features)
+
+
+class TorchBackend(InferenceBackend):
+    """
+    HuggingFace CLIP and BLIP in fp32, run under torch.inference_mode
+    """
+    name = "torch"
+
+    def load(self):
+        import torch
+        from transformers import (
+            BlipProcessor, BlipForConditionalGeneration,
+            CLIPProcessor, CLIPModel
+        )
+
+        _configure_torch_threads(torch)
+
+        # Device configuration
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+
+        self.clip_model = CLIPModel.from_pretrained(self.clip_model_name).to(self.device).eval()
+        self.clip_processor = CLIPProcessor.from_pretrained(self.clip_model_name)
+
+        self.blip_model = BlipForConditionalGeneration.from_pretrained(self.blip_model_name).to(self.device).eval()
+        self.blip_processor = BlipProcessor.from_pretrained(self.blip_model_name)
+
+        # The category prompts never change, so the text tower only runs once
+        self.text_features = self._load_text_features().float().cpu().numpy()
+
+    def _load_text_features(self):
+        """
+        Normalized CLIP text embeddings for the categories, cached on disk per model and category list
+        """
+        import torch
+
+        cache_name = f"clip_text_{self.clip_model_name.replace('/', '--')}_{self.categories_key}.pt"
+        cache_path = os.path.join(settings.MODEL_CACHE_DIR, cache_name)
+
+        if os.path.exists(cache_path):
+            return torch.load(cache_path, map_location=self.device, weights_only=True)
+
+        with torch.inference_mode():
+            text_inputs = self.clip_processor(text=self.categories, return_tensors="pt", padding=True).to(self.device)
+            text_features = self._text_features(text_inputs)
+            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+
+        # Write then rename so concurrent workers never read a partial file
+        os.makedirs(settings.MODEL_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        torch.save(text_features.cpu(), tmp_path)
+        os.replace(tmp_path, cache_path)
+        return text_features
+
+    def _text_features(self, inputs):
+        return _projected(self.clip_model.get_text_features(**inputs))
+
+    def embed_batch(self, images):
+        import torch
+
+        with torch.inference_mode():
+            inputs = self.clip_processor(images=images, return_tensors="pt").to(self.device)
+            image_features = _projected(self.clip_model.get_image_features(**inputs))
+            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+        return image_features.float().cpu().numpy()
+
+    def encode_text(self, texts):
+        import torch
+
+        with torch.inference_mode():
+            # CLIP's text tower only has 77 positions, longer queries are cut off
+            inputs = self.clip_processor(text=texts, return_tensors="pt", padding=True, truncation=True).to(self.device)
+            text_features = self._text_features(inputs)
+            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+        return text_features.float().cpu().numpy()
+
+    def describe(self, image):
+        import torch
+
+        with torch.inference_mode():
+            inputs = self.blip_processor(image, return_tensors="pt").to(self.device)
+            out = self.blip_model.generate(**inputs)
+        return self.blip_processor.decode(out[0], skip_special_tokens=True)
+
+    def describe_batch(self, images):
+        import torch
+
+        # One generate() call for the whole batch; captions are short, so padding waste is small
+        with torch.inference_mode():
+            inputs = self.blip_processor(images=images, return_tensors="pt").to(self.device)
+            out = self.blip_model.generate(**inputs)
+        return self.blip_processor.batch_decode(out, skip_special_tokens=True)
+
+
+class QuantizedTorchBackend(TorchBackend):
+    """
+    TorchBackend with dynamically int8-quantized CLIP and BLIP (CPU only)
+    """
+    name = "torch-int8"
+
+    def load(self):
+        super().load()
+        if self.device == "cpu":
+            self.clip_model = _quantize(self.clip_model)
+            self.blip_model = _quantize(self.blip_model)
+
+
+class OnnxBackend(TorchBackend):
+    """
+    CLIP's image tower runs in ONNX Runtime, exported once into MODEL_CACHE_DIR.
+    Only CLIP's text tower is loaded into torch, for the category prompts and
+    search queries. BLIP captioning is autoregressive generation, which stays
+    on int8 torch. Needs the packages in requirements-onnx.txt.
+    """
+    name = "onnx"
+
+    def load(self):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("The onnx backend requires onnxruntime (pip install -r requirements-onnx.txt)")
+        import torch
+        from transformers import (
+            BlipProcessor, BlipForConditionalGeneration,
+            CLIPProcessor, CLIPModel, CLIPTextModelWithProjection
+        )
+
+        _configure_torch_threads(torch)
+        self.device = "cpu"
+        self.clip_processor = CLIPProcessor.from_pretrained(self.clip_model_name)
+
+        onnx_path = os.path.join(settings.MODEL_CACHE_DIR, f"clip_vision_{self.clip_model_name.replace('/', '--')}.onnx")
+        if not os.path.exists(onnx_path):
+            # Only the first start needs the full model, and drops it after exporting
+            self._export_clip_vision(CLIPModel.from_pretrained(self.clip_model_name).eval(), onnx_path)
+
+        options = ort.SessionOptions()
+        if settings.AI_NUM_THREADS > 0:
+            options.intra_op_num_threads = settings.AI_NUM_THREADS
+        if settings.AI_NUM_INTEROP_THREADS > 0:
+            options.inter_op_num_threads = settings.AI_NUM_INTEROP_THREADS
+        self.clip_session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+        self.clip_text_model = CLIPTextModelWithProjection.from_pretrained(self.clip_model_name).eval()
+        self.blip_model = _quantize(BlipForConditionalGeneration.from_pretrained(self.blip_model_name).eval())
+        self.blip_processor = BlipProcessor.from_pretrained(self.blip_model_name)
+
+        self.text_features = self._load_text_features().float().cpu().numpy()
+
+    def _text_features(self, inputs):
+        return self.clip_text_model(**inputs).text_embeds
+
+    def _export_clip_vision(self, clip_model, onnx_path: str):
+        import torch
+
+        class ClipImageTower(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.clip_model = clip_model
+
+            def forward(self, pixel_values):
+                return _projected(self.clip_model.get_image_features(pixel_values=pixel_values))
+
+        size = self.clip_processor.image_processor.crop_size["height"]
+        dummy = torch.zeros(1, 3, size, size)
+
+        os.makedirs(settings.MODEL_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{onnx_path}.{os.getpid()}.tmp"
+        torch.onnx.export(
+            ClipImageTower().eval(), (dummy,), tmp_path,
+            input_names=["pixel_values"], output_names=["image_embeds"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+            opset_version=17,
+            dynamo=False,
+        )
+        os.replace(tmp_path, onnx_path)
+
+    def embed_batch(self, images):
+        pixel_values = self.clip_processor(images=images, return_tensors="np")["pixel_values"]
+        image_features = self.clip_session.run(None, {"pixel_values": pixel_values.astype(np.float32)})[0]
+        return image_features / np.linalg.norm(image_features, axis=-1, keepdims=True)
+
+
+class StubBackend(InferenceBackend):
+    """
+    Deterministic, model-free results derived from the pixels; for tests and local development
+    """
+    name = "stub"
+    device = "cpu"
+
+    def load(self):
+        self.text_features = np.stack([self._unit_vector(category.encode("utf-8")) for category in self.categories])
+
+    def _unit_vector(self, data: bytes) -> np.ndarray:
+        seed = int(hashlib.sha1(data).hexdigest()[:16], 16)
+        vector = np.random.default_rng(seed).standard_normal(self.embedding_dim).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def embed_batch(self, images):
+        return np.stack([self._unit_vector(image.tobytes()) for image in images])
+
+    def encode_text(self, texts):
+        return np.stack([self._unit_vector(text.encode("utf-8")) for text in texts])
+
+    def describe(self, image):
+        return f"a {image.width}x{image.height} photo"
+
+
+def encode_image(image: Image.Image) -> bytes:
+    # Lossless so the server sees exactly the pixels the client decoded; low
+    # compression because the bytes only cross a local socket
+    buf = io.BytesIO()
+    image.save(buf, format="PNG", compress_level=1)
+    return buf.getvalue()
+
+
+class RemoteBackend(InferenceBackend):
+    """
+    Client for inference_server.py, so web workers share one copy of the model weights.
+    A single httpx client keeps connections open across calls from every thread.
+    """
+    name = "remote"
+
+    def __init__(self, client=None, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client
+
+    def load(self):
+        import httpx
+
+        if self.client is None:
+            timeout = httpx.Timeout(settings.AI_SERVER_TIMEOUT, connect=5.0)
+            if settings.AI_SERVER_SOCKET:
+                transport = httpx.HTTPTransport(uds=settings.AI_SERVER_SOCKET, retries=1)
+                self.client = httpx.Client(transport=transport, base_url="http://inference", timeout=timeout)
+            else:
+                transport = httpx.HTTPTransport(retries=1)
+                self.client = httpx.Client(transport=transport, base_url=settings.AI_SERVER_URL, timeout=timeout)
+
+        response = self.client.get("/ready")
+        if response.status_code != 200:
+            raise RuntimeError(f"Inference server not ready: {response.text}")
+        self.device = response.json().get("device")
+
+    def classify_embed_batch(self, images):
+        files = [("images", (f"{i}.png", encode_image(image), "image/png")) for i, image in enumerate(images)]
+        response = self.client.post("/classify", files=files)
+        response.raise_for_status()
+        data = response.json()
+        return data["categories"], np.asarray(data["embeddings"], dtype=np.float32)
+
+    def embed_batch(self, images):
+        return self.classify_embed_batch(images)[1]
+
+    def encode_text(self, texts):
+        response = self.client.post("/encode-text", json={"texts": texts})
+        response.raise_for_status()
+        return np.asarray(response.json()["embeddings"], dtype=np.float32)
+
+    def describe(self, image):
+        files = {"image": ("image.png", encode_image(image), "image/png")}
+        response = self.client.post("/describe", files=files)
+        response.raise_for_status()
+        return response.json()["description"]
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (TorchBackend, QuantizedTorchBackend, OnnxBackend, StubBackend, RemoteBackend)
+}
+
+
+def get_backend(name: str, **kwargs) -> InferenceBackend:
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown AI backend '{name}', expected one of {sorted(BACKENDS)}")
+    return backend_class(**kwargs)
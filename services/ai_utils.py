@@ -45,13 +45,21 @@
 
 # services/ai_utils.py
 
-import torch
+import functools
+import hashlib
+import logging
+import threading
+import time
+from typing import Union
+import numpy as np
 from PIL import Image
-from transformers import (
-    BlipProcessor, BlipForConditionalGeneration,
-    CLIPProcessor, CLIPModel
-)
-from guardrails import Guard
+from services.ai_backends import get_backend
+from services.ai_validation import get_validator
+from services.batching import MicroBatcher
+from services.image_ingest import load_image
+from settings import settings
+
+logger = logging.getLogger(__name__)
 
 # Define valid photo categories
 CATEGORIES = [
@@ -59,51 +67,193 @@ CATEGORIES = [
     "sports", "fashion", "travel", "macro", "movies"
 ]
 
-# Device configuration
-device = "cuda" if torch.cuda.is_available() else "cpu"
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+BLIP_MODEL_NAME = "Salesforce/blip-image-captioning-base"
+EMBEDDING_DIM = 512  # CLIP ViT-B/32 projection size
+
+# With AI_BACKEND=remote the models actually run in the inference server
+INFERENCE_BACKEND = settings.AI_SERVER_BACKEND if settings.AI_BACKEND == "remote" else settings.AI_BACKEND
+
+# Identifies which models, categories and backend produced a stored result
+CATEGORIES_KEY = hashlib.sha1("\n".join(CATEGORIES).encode("utf-8")).hexdigest()[:12]
+MODEL_VERSION = f"{CLIP_MODEL_NAME}+{BLIP_MODEL_NAME}+{CATEGORIES_KEY}+{INFERENCE_BACKEND}"
+
+# The backend and validator are loaded on first use (or by start_background_load)
+# so that importing this module stays cheap for the web app and the test suite
+backend = get_backend(
+    settings.AI_BACKEND,
+    categories=CATEGORIES,
+    clip_model_name=CLIP_MODEL_NAME,
+    blip_model_name=BLIP_MODEL_NAME,
+    categories_key=CATEGORIES_KEY,
+    embedding_dim=EMBEDDING_DIM,
+)
+# Checks model output before it is stored; AI_VALIDATOR=guardrails uses the .rail guards instead
+validator = get_validator(settings.AI_VALIDATOR, CATEGORIES)
+
+_load_lock = threading.Lock()
+_state = {"status": "not_loaded", "error": None, "load_seconds": None, "warmed_up": False}
+
+
+def load_models():
+    """
+    Load the inference backend once; safe to call from any thread
+    """
+    if _state["status"] == "ready":
+        return
+
+    with _load_lock:
+        if _state["status"] == "ready":
+            return
+
+        _state.update(status="loading", error=None)
+        started = time.monotonic()
+        try:
+            backend.load()
+        except Exception as e:
+            _state.update(status="failed", error=str(e))
+            raise
+
+        _state.update(status="ready", load_seconds=round(time.monotonic() - started, 2))
+
+
+def warmup():
+    """
+    Push a blank image through both models so the first real upload doesn't pay for lazy initialisation
+    """
+    image = Image.new("RGB", (224, 224))
+    _classify_batch([image])
+    _describe(image)
+    _state["warmed_up"] = True
+
+
+def start_background_load(run_warmup: bool = False, load_validator: bool = True) -> threading.Thread:
+    """
+    Load (and optionally warm up) the models without blocking application startup
+    """
+    def _run():
+        try:
+            load_models()
+            if load_validator:
+                validator.load()
+            if run_warmup:
+                warmup()
+        except Exception:
+            logger.exception("Background model load failed")
+
+    thread = threading.Thread(target=_run, name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+
+def model_state() -> dict:
+    return {**_state, "backend": backend.name, "device": backend.device}
+
+
+def _classify_batch(images: list) -> list:
+    """
+    One CLIP pass over the batch, returning (category, image embedding) per image
+    """
+    load_models()
+    categories, embeddings = backend.classify_embed_batch(images)
+    return list(zip(categories, embeddings))
+
+# Concurrent classify_image calls are grouped into a single forward pass
+clip_batcher = MicroBatcher(
+    _classify_batch,
+    max_batch_size=settings.CLIP_BATCH_SIZE,
+    max_wait_ms=settings.CLIP_BATCH_WAIT_MS,
+    max_producers=settings.CLIP_BATCH_PRODUCERS or settings.ENRICHMENT_WORKERS,
+)
 
-# Load models
-clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32").to(device)
-clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
 
-blip_model = BlipForConditionalGeneration.from_pretrained("Salesforce/blip-image-captioning-base").to(device)
-blip_processor = BlipProcessor.from_pretrained("Salesforce/blip-image-captioning-base")
+def _describe(image) -> str:
+    load_models()
+    return backend.describe(image)
 
-# Load Guardrails RAIL definitions
-classification_guard = Guard.from_rail("guardrails_ai/classification.rail")
-description_guard = Guard.from_rail("guardrails_ai/description.rail")
 
-def classify_image(image_path: str) -> dict:
+@functools.lru_cache(maxsize=settings.SEARCH_QUERY_CACHE_SIZE)
+def _encode_query(query: str) -> np.ndarray:
+    load_models()
+    vector = backend.encode_text([query])[0]
+    vector.setflags(write=False)  # Shared by every caller of the cache
+    return vector
+
+
+def encode_text(query: str) -> np.ndarray:
+    """
+    Normalized CLIP text embedding for a search query; repeated queries are served from an LRU cache
+    """
+    try:
+        # CLIP's tokenizer lowercases anyway, so normalising first only improves the hit rate
+        return _encode_query(" ".join(query.lower().split()))
+    except Exception as e:
+        raise RuntimeError(f"Error encoding text: {str(e)}")
+
+
+def _as_image(image: Union[str, Image.Image]) -> Image.Image:
+    # Callers that run both models should decode once with load_image and pass the result
+    if isinstance(image, Image.Image):
+        return image
+    return load_image(image)
+
+
+def _validated_category(predicted_category: str, embedding) -> dict:
+    validated = validator.category(predicted_category)
+
+    # The image embedding feeds the similarity index
+    validated["embedding"] = embedding
+    return validated
+
+
+def _validated_description(description: str) -> dict:
+    return validator.description(description)
+
+
+def classify_image(image: Union[str, Image.Image]) -> dict:
     try:
-        image = Image.open(image_path).convert("RGB")
-        inputs = clip_processor(text=CATEGORIES, images=image, return_tensors="pt", padding=True).to(device)
-        outputs = clip_model(**inputs)
-        logits_per_image = outputs.logits_per_image
-        probs = logits_per_image.softmax(dim=1)
-        predicted_index = torch.argmax(probs, dim=1).item()
-        predicted_category = CATEGORIES[predicted_index]
-
-        # Guardrails validation
-        result = classification_guard.parse(f"category: {predicted_category}")
-        if result.validated_output:
-            return result.validated_output
-        else:
-            return {"category": predicted_category}  # fallback if validation fails
+        image = _as_image(image)
+        predicted_category, embedding = clip_batcher.submit(image)
+        return _validated_category(predicted_category, embedding)
     except Exception as e:
         raise RuntimeError(f"Error classifying image: {str(e)}")
 
-def describe_image(image_path: str) -> dict:
+def describe_image(image: Union[str, Image.Image]) -> dict:
     try:
-        image = Image.open(image_path).convert("RGB")
-        inputs = blip_processor(image, return_tensors="pt").to(device)
-        out = blip_model.generate(**inputs)
-        description = blip_processor.decode(out[0], skip_special_tokens=True)
-
-        # Guardrails validation
-        result = description_guard.parse(f"description: {description}")
-        if result.validated_output:
-            return result.validated_output
-        else:
-            return {"description": description}  # fallback if validation fails
+        image = _as_image(image)
+        return _validated_description(_describe(image))
     except Exception as e:
         raise RuntimeError(f"Error describing image: {str(e)}")
+
+def classify_images(images: list) -> list:
+    """
+    classify_image for many images at once; they go to the micro-batcher together
+    """
+    try:
+        images = [_as_image(image) for image in images]
+        return [_validated_category(category, embedding) for category, embedding in clip_batcher.submit_many(images)]
+    except Exception as e:
+        raise RuntimeError(f"Error classifying images: {str(e)}")
+
+def describe_images(images: list) -> list:
+    """
+    describe_image for many images at once, captioned in a single BLIP generate call
+    """
+    try:
+        images = [_as_image(image) for image in images]
+        load_models()
+        return [_validated_description(description) for description in backend.describe_batch(images)]
+    except Exception as e:
+        raise RuntimeError(f"Error describing images: {str(e)}")
+
+def categorize_embeddings(embeddings) -> list:
+    """
+    Re-derive categories from stored image embeddings, without touching the images;
+    enough when only CATEGORIES changed
+    """
+    try:
+        load_models()
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        return [_validated_category(category, embedding) for category, embedding in zip(backend.categorize(embeddings), embeddings)]
+    except Exception as e:
+        raise RuntimeError(f"Error categorizing embeddings: {str(e)}")
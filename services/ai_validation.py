@@ -0,0 +1,130 @@
+# services/ai_validation.py
+
+import logging
+import threading
+from typing import List
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Same limits as guardrails_ai/description.rail
+MAX_DESCRIPTION_LENGTH = 200
+
+
+class OutputValidator:
+    """
+    Checks model output before it is stored. category() and description()
+    return the same dicts the Guardrails guards used to produce.
+    """
+    name = "base"
+
+    def __init__(self, categories: List[str], max_description_length: int = MAX_DESCRIPTION_LENGTH):
+        self.categories = categories
+        self.max_description_length = max_description_length
+
+    def load(self):
+        pass
+
+    def category(self, predicted_category: str) -> dict:
+        raise NotImplementedError
+
+    def description(self, description: str) -> dict:
+        raise NotImplementedError
+
+
+class LocalValidator(OutputValidator):
+    """
+    The rules from guardrails_ai/*.rail implemented in-process: the category
+    must be one of CATEGORIES, descriptions are cut to max_description_length
+    and dropped if alt-profanity-check flags them.
+    """
+    name = "local"
+
+    def __init__(self, categories, max_description_length=MAX_DESCRIPTION_LENGTH, check_profanity: bool = True):
+        super().__init__(categories, max_description_length)
+        self.check_profanity = check_profanity
+        self._allowed = frozenset(categories)
+        self._predict_profanity = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if not self.check_profanity or self._predict_profanity is not None:
+            return
+        with self._lock:
+            if self._predict_profanity is not None:
+                return
+            try:
+                from profanity_check import predict
+            except ImportError:
+                logger.warning("alt-profanity-check is not installed, descriptions are not checked for profanity")
+                self.check_profanity = False
+                return
+            self._predict_profanity = predict
+
+    def category(self, predicted_category):
+        if predicted_category not in self._allowed:
+            raise ValueError(f"Invalid category '{predicted_category}'")
+        return {"category": predicted_category}
+
+    def description(self, description):
+        description = " ".join(description.split())
+        if len(description) > self.max_description_length:
+            # Cut at the last word boundary that fits
+            description = description[:self.max_description_length + 1].rsplit(" ", 1)[0][:self.max_description_length]
+
+        self.load()
+        if self.check_profanity and description and self._predict_profanity([description])[0]:
+            # Matches the rail's `filters="profanity"`: the value is dropped
+            description = ""
+        return {"description": description}
+
+
+class GuardrailsValidator(OutputValidator):
+    """
+    The original Guardrails guards built from guardrails_ai/*.rail. Falls back
+    to the raw model output when validation produces nothing.
+    """
+    name = "guardrails"
+
+    def __init__(self, categories, max_description_length=MAX_DESCRIPTION_LENGTH):
+        super().__init__(categories, max_description_length)
+        self.classification_guard = None
+        self.description_guard = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self.description_guard is not None:
+            return
+        with self._lock:
+            if self.description_guard is None:
+                from guardrails import Guard
+
+                self.classification_guard = Guard.from_rail("guardrails_ai/classification.rail")
+                self.description_guard = Guard.from_rail("guardrails_ai/description.rail")
+
+    def category(self, predicted_category):
+        self.load()
+        result = self.classification_guard.parse(f"category: {predicted_category}")
+        if result.validated_output:
+            return dict(result.validated_output)
+        return {"category": predicted_category}  # fallback if validation fails
+
+    def description(self, description):
+        self.load()
+        result = self.description_guard.parse(f"description: {description}")
+        if result.validated_output:
+            return dict(result.validated_output)
+        return {"description": description}  # fallback if validation fails
+
+
+VALIDATORS = {validator.name: validator for validator in (LocalValidator, GuardrailsValidator)}
+
+
+def get_validator(name: str, categories: List[str]) -> OutputValidator:
+    try:
+        validator_class = VALIDATORS[name]
+    except KeyError:
+        raise ValueError(f"Unknown AI validator '{name}', expected one of {sorted(VALIDATORS)}")
+    if validator_class is LocalValidator:
+        return LocalValidator(categories, check_profanity=settings.AI_PROFANITY_CHECK)
+    return validator_class(categories)
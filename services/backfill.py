@@ -0,0 +1,247 @@
+# services/backfill.py
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from sqlalchemy import insert, or_, update
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import Photo, AIResult
+from services import ai_utils
+from services.ai_utils import MODEL_VERSION, categorize_embeddings, classify_images, describe_images
+from services.enrichment import DONE
+from services.storage import load_stored_image
+from services.vector_index import embedding_index
+
+logger = logging.getLogger(__name__)
+
+
+def only_categories_changed(old_version: Optional[str], new_version: str = MODEL_VERSION) -> bool:
+    """
+    True when a row was produced by the same CLIP/BLIP checkpoints and backend
+    and only the category list differs, so its embedding and description still hold
+    """
+    if not old_version:
+        return False
+    old, new = old_version.split("+"), new_version.split("+")
+    return len(old) == len(new) == 4 and (old[0], old[1], old[3]) == (new[0], new[1], new[3])
+
+
+class Backfill:
+    """
+    Re-enriches every photo whose model_version isn't the current MODEL_VERSION.
+
+    The photos table is walked in photo_id order with keyset pagination. Each
+    page is split into batches that `workers` threads decode and run through
+    the models, and results are written back with bulk UPDATEs in one commit
+    per page. The last committed photo_id is checkpointed, so an interrupted
+    run resumes where it stopped. The checkpoint never passes a photo that
+    failed, so a rerun retries it; photos done since then are skipped by the
+    model_version filter.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        batch_size: int = 32,
+        workers: int = 2,
+        page_size: Optional[int] = None,
+        checkpoint_path: Optional[str] = None,
+        limit: Optional[int] = None,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.page_size = page_size or self.batch_size * self.workers * 4
+        self.checkpoint_path = checkpoint_path
+        self.limit = limit
+        self.stats = {"processed": 0, "recategorized": 0, "cached": 0, "failed": 0}
+        self._first_failed: Optional[int] = None
+
+    def _load_checkpoint(self) -> int:
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path) as f:
+            checkpoint = json.load(f)
+        # A checkpoint from a run towards another model version doesn't apply
+        if checkpoint.get("model_version") != MODEL_VERSION:
+            return 0
+        self.stats.update(checkpoint.get("stats", {}))
+        return checkpoint["last_photo_id"]
+
+    def _save_checkpoint(self, last_photo_id: int):
+        if not self.checkpoint_path:
+            return
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"model_version": MODEL_VERSION, "last_photo_id": last_photo_id, "stats": self.stats}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _next_page(self, db: Session, after_id: int):
+        return db.query(Photo.photo_id, Photo.file_path, Photo.content_hash, Photo.model_version, Photo.description).filter(
+            Photo.photo_id > after_id,
+            or_(Photo.model_version.is_(None), Photo.model_version != MODEL_VERSION)
+        ).order_by(Photo.photo_id).limit(self.page_size).all()
+
+    def run(self) -> dict:
+        last_photo_id = self._load_checkpoint()
+        db = self.session_factory()
+        started = time.monotonic()
+        seen = 0
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="backfill") as executor:
+                while self.limit is None or seen < self.limit:
+                    rows = self._next_page(db, last_photo_id)
+                    if self.limit is not None:
+                        rows = rows[:self.limit - seen]
+                    if not rows:
+                        break
+
+                    self._process_page(db, executor, rows)
+                    db.commit()
+                    seen += len(rows)
+                    last_photo_id = rows[-1].photo_id
+                    self._save_checkpoint(last_photo_id if self._first_failed is None else self._first_failed - 1)
+
+                    elapsed = time.monotonic() - started
+                    logger.info("Backfilled up to photo %s (%s photos, %.1f/s)", last_photo_id, seen, seen / elapsed if elapsed else 0)
+        finally:
+            db.close()
+
+        return self.stats
+
+    def _process_page(self, db: Session, executor: ThreadPoolExecutor, rows):
+        results: Dict[int, dict] = {}
+
+        # 1. Identical bytes already processed by the current models
+        hashes = {row.content_hash for row in rows if row.content_hash}
+        cached = {
+            result.content_hash: result
+            for result in db.query(AIResult).filter(
+                AIResult.content_hash.in_(hashes),
+                AIResult.model_version == MODEL_VERSION
+            ).all()
+        } if hashes else {}
+        remaining = []
+        for row in rows:
+            if row.content_hash in cached:
+                results[row.photo_id] = {"tags": cached[row.content_hash].tags, "description": cached[row.content_hash].description}
+                self.stats["cached"] += 1
+            else:
+                remaining.append(row)
+
+        # 2. Only the categories changed: re-derive them from the stored embeddings
+        remaining = self._recategorize(remaining, results)
+
+        # 3. Everything else goes through the models, one inference per distinct content
+        groups = {}
+        for row in remaining:
+            groups.setdefault(row.content_hash or f"photo:{row.photo_id}", []).append(row)
+        representatives = [group[0] for group in groups.values()]
+        batches = [representatives[i:i + self.batch_size] for i in range(0, len(representatives), self.batch_size)]
+
+        inferred = {}
+        for batch_results in executor.map(self._infer_batch, batches):
+            inferred.update(batch_results)
+        for group in groups.values():
+            for row in group:
+                results[row.photo_id] = inferred[group[0].photo_id]
+
+        self._write(db, rows, results)
+
+    def _recategorize(self, rows, results: Dict[int, dict]) -> list:
+        candidates = [row for row in rows if only_categories_changed(row.model_version)]
+        if not candidates:
+            return rows
+
+        ai_utils.load_models()
+        if ai_utils.backend.text_features is None:
+            return rows  # The remote backend only classifies images
+
+        embeddings = embedding_index.get_many(row.photo_id for row in candidates)
+        candidates = [row for row in candidates if row.photo_id in embeddings]
+        if not candidates:
+            return rows
+
+        predicted = categorize_embeddings([embeddings[row.photo_id] for row in candidates])
+        for row, predicted_tag in zip(candidates, predicted):
+            # Description stays as it is, only tags and the version stamp change; both go to ai_results
+            results[row.photo_id] = {"tags": predicted_tag["category"], "description": row.description or ""}
+        self.stats["recategorized"] += len(candidates)
+        done = {row.photo_id for row in candidates}
+        return [row for row in rows if row.photo_id not in done]
+
+    def _infer_batch(self, rows) -> Dict[int, dict]:
+        """
+        Runs on a worker thread: decode, classify and describe one batch
+        """
+        results = {}
+        images, decoded = [], []
+        for row in rows:
+            try:
+                images.append(load_stored_image(row.file_path))
+                decoded.append(row)
+            except Exception as e:
+                results[row.photo_id] = {"error": f"Could not read image: {e}"}
+        if not decoded:
+            return results
+
+        try:
+            predicted_tags = classify_images(images)
+            descriptions = describe_images(images)
+        except Exception as e:
+            logger.warning("Backfill batch starting at photo %s failed: %s", decoded[0].photo_id, e)
+            for row in decoded:
+                results[row.photo_id] = {"error": str(e)}
+            return results
+
+        for row, predicted_tag, auto_description in zip(decoded, predicted_tags, descriptions):
+            results[row.photo_id] = {
+                "tags": predicted_tag["category"],
+                "description": auto_description["description"],
+                "embedding": predicted_tag.get("embedding"),
+            }
+        return results
+
+    def _write(self, db: Session, rows, results: Dict[int, dict]):
+        photo_updates, ai_results = [], {}
+        for row in rows:
+            result = results[row.photo_id]
+            if "error" in result:
+                # Keeps its previous tags and stays unstamped, and the checkpoint stays before it, so a later run tries again
+                photo_updates.append({"photo_id": row.photo_id, "enrichment_error": result["error"]})
+                self.stats["failed"] += 1
+                if self._first_failed is None or row.photo_id < self._first_failed:
+                    self._first_failed = row.photo_id
+                continue
+
+            values = {"photo_id": row.photo_id, "tags": result["tags"], "model_version": MODEL_VERSION, "enrichment_status": DONE, "enrichment_error": None}
+            if "description" in result:
+                values["description"] = result["description"]
+            photo_updates.append(values)
+            self.stats["processed"] += 1
+
+            if result.get("embedding") is not None:
+                embedding_index.add(row.photo_id, result["embedding"])
+            if row.content_hash and "description" in result:
+                ai_results[row.content_hash] = {"content_hash": row.content_hash, "tags": result["tags"], "description": result["description"], "model_version": MODEL_VERSION}
+
+        # Bulk UPDATE by primary key, executed as one executemany per set of columns
+        if photo_updates:
+            db.execute(update(Photo), photo_updates)
+
+        if ai_results:
+            existing = {
+                row.content_hash
+                for row in db.query(AIResult.content_hash).filter(AIResult.content_hash.in_(ai_results.keys())).all()
+            }
+            updates = [values for content_hash, values in ai_results.items() if content_hash in existing]
+            inserts = [values for content_hash, values in ai_results.items() if content_hash not in existing]
+            if updates:
+                db.execute(update(AIResult), updates)
+            if inserts:
+                db.execute(insert(AIResult), inserts)
@@ -0,0 +1,142 @@
+# services/batching.py
+
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from itertools import count
+from typing import Any, Callable, List, Optional
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests and hands them to `process_batch` together.
+
+    A batch is flushed as soon as it holds `max_batch_size` items, the
+    oldest item has waited `max_wait_ms`, or `max_producers` callers (the
+    most that can ever submit at once, e.g. a fixed worker pool) are all
+    waiting, since nothing more can arrive. `process_batch` receives the list
+    of queued items and must return one result per item, in the same order.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]], max_batch_size: int, max_wait_ms: int, max_producers: Optional[int] = None):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0, max_wait_ms)
+        self.max_producers = max_producers if max_producers and max_producers > 0 else None
+
+        self._pending = []  # (item, future, enqueued_at, caller)
+        self._caller_ids = count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+        # Metrics
+        self._batches = 0
+        self._items = 0
+        self._failed_batches = 0
+        self._total_wait = 0.0
+        self._batch_sizes = Counter()
+
+    def configure(self, max_batch_size: Optional[int] = None, max_producers: Optional[int] = None):
+        """
+        Change the limits at runtime, e.g. for a CLI whose own threads are the only callers
+        """
+        with self._cond:
+            if max_batch_size is not None:
+                self.max_batch_size = max(1, max_batch_size)
+            if max_producers is not None:
+                self.max_producers = max_producers if max_producers > 0 else None
+            self._cond.notify()
+
+    def submit(self, item: Any) -> Any:
+        """
+        Queue an item and block until its batch has been processed
+        """
+        future = Future()
+        with self._cond:
+            self._ensure_started()
+            self._pending.append((item, future, time.monotonic(), next(self._caller_ids)))
+            self._cond.notify()
+        return future.result()
+
+    def submit_many(self, items: List[Any]) -> List[Any]:
+        """
+        Queue several items at once and block until all of them have been processed
+        """
+        futures = []
+        with self._cond:
+            self._ensure_started()
+            now = time.monotonic()
+            caller = next(self._caller_ids)
+            for item in items:
+                future = Future()
+                self._pending.append((item, future, now, caller))
+                futures.append(future)
+            self._cond.notify()
+        return [future.result() for future in futures]
+
+    def metrics(self) -> dict:
+        with self._cond:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "max_producers": self.max_producers,
+                "batches": self._batches,
+                "items": self._items,
+                "failed_batches": self._failed_batches,
+                "queued": len(self._pending),
+                "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+                "avg_wait_ms": round(self._total_wait * 1000 / self._items, 2) if self._items else 0.0,
+                "batch_size_histogram": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+            }
+
+    def _ensure_started(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+
+            # Wait for the batch to fill up, but never longer than the oldest item allows
+            deadline = self._pending[0][2] + self.max_wait_ms / 1000
+            while len(self._pending) < self.max_batch_size and not self._all_producers_waiting():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            return batch
+
+    def _all_producers_waiting(self) -> bool:
+        return self.max_producers is not None and len({entry[3] for entry in self._pending}) >= self.max_producers
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.monotonic()
+            items = [item for item, _, _, _ in batch]
+
+            try:
+                results = self.process_batch(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"Batch returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                with self._cond:
+                    self._failed_batches += 1
+                for _, future, _, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            with self._cond:
+                self._batches += 1
+                self._items += len(batch)
+                self._batch_sizes[len(batch)] += 1
+                self._total_wait += sum(started - enqueued_at for _, _, enqueued_at, _ in batch)
+
+            for (_, future, _, _), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,400 @@
+# services/enrichment.py
+
+import logging
+import queue
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import Photo, AIResult
+from typing import List, Tuple
+from services.ai_utils import classify_image, describe_image, classify_images, describe_images, MODEL_VERSION
+from services.storage import load_stored_image
+from services.near_duplicates import dhash, near_duplicate_index
+from services.renditions import generate_renditions
+from services.vector_index import embedding_index
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Photo.enrichment_status values
+PENDING = "pending"
+PROCESSING = "processing"
+DONE = "done"
+FAILED = "failed"
+
+
+def apply_cached_result(db: Session, photo: Photo) -> bool:
+    """
+    Fill in a photo's AI fields from a previous run on identical bytes.
+    Returns False when there is no result for the current models.
+    """
+    return not apply_cached_results(db, [photo])
+
+
+def _cached_results(db: Session, photos) -> dict:
+    # Results for the current models by content hash, one lookup for all photos
+    hashes = {photo.content_hash for photo in photos if photo.content_hash}
+    if not hashes:
+        return {}
+    return {
+        result.content_hash: result
+        for result in db.query(AIResult).filter(
+            AIResult.content_hash.in_(hashes),
+            AIResult.model_version == MODEL_VERSION
+        ).all()
+    }
+
+
+def apply_cached_results(db: Session, photos: List[Photo]) -> List[Photo]:
+    """
+    apply_cached_result for many photos with a single lookup; returns the photos still needing inference
+    """
+    cached = _cached_results(db, photos)
+
+    remaining = []
+    for photo in photos:
+        result = cached.get(photo.content_hash)
+        if not result:
+            remaining.append(photo)
+            continue
+        photo.tags = result.tags
+        photo.description = result.description
+        photo.model_version = result.model_version
+        photo.enrichment_status = DONE
+        photo.enrichment_error = None
+        vector = _duplicate_embedding(db, photo.photo_id, photo.content_hash)
+        if vector is not None:
+            embedding_index.add(photo.photo_id, vector)
+    return remaining
+
+
+def _duplicate_embedding(db: Session, photo_id: int, content_hash: str):
+    # Identical bytes have an identical embedding, reuse it from any earlier copy
+    duplicates = db.query(Photo.photo_id).filter(
+        Photo.content_hash == content_hash,
+        Photo.photo_id != photo_id
+    ).all()
+    for duplicate in duplicates:
+        vector = embedding_index.get(duplicate.photo_id)
+        if vector is not None:
+            return vector
+    return None
+
+
+def store_result(db: Session, content_hash: str, tags: str, description: str) -> None:
+    """
+    Remember an inference result for these bytes, replacing results from older models
+    """
+    db.merge(AIResult(
+        content_hash=content_hash,
+        tags=tags,
+        description=description,
+        model_version=MODEL_VERSION
+    ))
+
+
+def _claimable(now: datetime):
+    # Pending, or PROCESSING under a claim old enough that its worker must have died
+    stale = now - timedelta(seconds=settings.ENRICHMENT_CLAIM_TIMEOUT)
+    return or_(
+        Photo.enrichment_status == PENDING,
+        and_(
+            Photo.enrichment_status == PROCESSING,
+            or_(Photo.enrichment_claimed_at.is_(None), Photo.enrichment_claimed_at < stale)
+        )
+    )
+
+
+def claim(db: Session, photo_ids: List[int]) -> List[int]:
+    """
+    Mark photos PROCESSING and commit, returning the ids this worker got. Each
+    is a conditional UPDATE, so when several workers (in any process) reach
+    the same photo only one of them runs inference.
+    """
+    now = datetime.utcnow()
+    claimed = []
+    for photo_id in photo_ids:
+        updated = db.execute(
+            update(Photo)
+            .where(Photo.photo_id == photo_id, _claimable(now))
+            .values(enrichment_status=PROCESSING, enrichment_claimed_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if updated:
+            claimed.append(photo_id)
+    db.commit()
+    return claimed
+
+
+def _claimed_photos(db: Session, photo_ids: List[int]) -> list:
+    # Plain rows rather than ORM objects, so nothing held across inference is flushed or expired
+    return db.query(
+        Photo.photo_id, Photo.owner_id, Photo.file_path, Photo.content_hash, Photo.perceptual_hash
+    ).filter(Photo.photo_id.in_(photo_ids)).order_by(Photo.photo_id).all()
+
+
+def _done(tags: str, description: str) -> dict:
+    return {"tags": tags, "description": description, "model_version": MODEL_VERSION, "enrichment_status": DONE, "enrichment_error": None}
+
+
+def _finish(db: Session, results: List[Tuple[object, dict, object]]) -> None:
+    """
+    Write (photo, values, embedding) results with one UPDATE per photo that
+    only matches while it is still PROCESSING, and commit. A photo deleted
+    mid-inference is skipped rather than failing the commit, and only photos
+    whose row took the result go into the embedding and near-duplicate indexes.
+    """
+    written = []
+    for photo, values, embedding in results:
+        updated = db.execute(
+            update(Photo)
+            .where(Photo.photo_id == photo.photo_id, Photo.enrichment_status == PROCESSING)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if updated:
+            written.append((photo, values, embedding))
+        else:
+            logger.info("Photo %s was deleted or re-queued during enrichment, dropping its result", photo.photo_id)
+    db.commit()
+
+    for photo, values, embedding in written:
+        if embedding is not None:
+            embedding_index.add(photo.photo_id, embedding)
+        if values.get("perceptual_hash"):
+            near_duplicate_index.add(photo.owner_id, photo.photo_id, values["perceptual_hash"])
+
+
+def _inferred(photo, image, predicted_tag: dict, auto_description: dict) -> Tuple[object, dict, object]:
+    values = _done(predicted_tag["category"], auto_description["description"])
+    # Photos uploaded before perceptual hashing get one from the already decoded image
+    if not photo.perceptual_hash:
+        values["perceptual_hash"] = dhash(image)
+        values["perceptual_hash_at"] = datetime.utcnow()
+    return photo, values, predicted_tag.get("embedding")
+
+
+def _apply_cached(db: Session, photos: list) -> list:
+    """
+    apply_cached_results for claimed photos, written through _finish; returns the photos still needing inference
+    """
+    cached = _cached_results(db, photos)
+
+    results, remaining = [], []
+    for photo in photos:
+        result = cached.get(photo.content_hash)
+        if result:
+            results.append((photo, _done(result.tags, result.description), _duplicate_embedding(db, photo.photo_id, photo.content_hash)))
+        else:
+            remaining.append(photo)
+    if results:
+        _finish(db, results)
+    return remaining
+
+
+def run_enrichment(db: Session, photo_id: int) -> None:
+    """
+    Run the AI models for a single photo and store the results on its row
+    """
+    if not claim(db, [photo_id]):
+        return  # Deleted, already enriched, or another worker has it
+    for photo in _claimed_photos(db, [photo_id]):
+        _enrich(db, photo)
+
+
+def _enrich(db: Session, photo) -> None:
+    # Identical bytes were already processed, no inference needed
+    if not _apply_cached(db, [photo]):
+        return
+
+    try:
+        # Decode once and share the downsampled image between both models
+        image = load_stored_image(photo.file_path)
+        predicted_tag = classify_image(image)
+        auto_description = describe_image(image)
+    except Exception as e:
+        _finish(db, [(photo, {"enrichment_status": FAILED, "enrichment_error": str(e)}, None)])
+        logger.warning("Enrichment failed for photo %s: %s", photo.photo_id, e)
+        return
+
+    if photo.content_hash:
+        store_result(db, photo.content_hash, predicted_tag["category"], auto_description["description"])
+    _finish(db, [_inferred(photo, image, predicted_tag, auto_description)])
+
+
+def run_enrichment_batch(db: Session, photo_ids: List[int]) -> None:
+    """
+    Enrich several photos with one batched pass through each model. Photos
+    with identical bytes are only inferred once. If the batch fails, each
+    photo is retried on its own so one bad file can't fail the others.
+    """
+    photo_ids = claim(db, photo_ids)
+    if not photo_ids:
+        return
+    photos = _apply_cached(db, _claimed_photos(db, photo_ids))
+    if not photos:
+        return
+
+    # One decode and one inference per distinct content
+    groups = {}
+    for photo in photos:
+        groups.setdefault(photo.content_hash or f"photo:{photo.photo_id}", []).append(photo)
+
+    try:
+        images = [load_stored_image(group[0].file_path) for group in groups.values()]
+        predicted_tags = classify_images(images)
+        descriptions = describe_images(images)
+    except Exception as e:
+        logger.warning("Batch enrichment of %s photos failed, retrying one by one: %s", len(photos), e)
+        for photo in photos:
+            _enrich(db, photo)
+        return
+
+    results = []
+    for group, image, predicted_tag, auto_description in zip(groups.values(), images, predicted_tags, descriptions):
+        results.extend(_inferred(photo, image, predicted_tag, auto_description) for photo in group)
+        if group[0].content_hash:
+            store_result(db, group[0].content_hash, predicted_tag["category"], auto_description["description"])
+    _finish(db, results)
+
+
+class EnrichmentQueue:
+    """
+    Bounded queue of photo ids drained by a fixed pool of worker threads.
+    Each worker owns its own DB session, so uploads never wait on inference.
+    Uploads queue their photos directly; a poller thread picks up whatever
+    didn't fit, was left by a crashed worker, or was uploaded to another process.
+    """
+
+    def __init__(self, workers: int, maxsize: int, session_factory=SessionLocal):
+        self.workers = workers
+        self.session_factory = session_factory
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._poller = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"enrichment-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._poller = threading.Thread(target=self._poll, name="enrichment-poll", daemon=True)
+        self._poller.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        if self._poller:
+            self._poller.join(timeout)
+            self._poller = None
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def full(self) -> bool:
+        return self._queue.full()
+
+    def submit(self, photo_id: int) -> bool:
+        """
+        Queue a photo for enrichment. Returns False when the queue is full;
+        the photo then stays pending and is picked up by poll_pending().
+        """
+        try:
+            self._queue.put_nowait(photo_id)
+            return True
+        except queue.Full:
+            return False
+
+    def submit_batch(self, photo_ids: List[int]) -> bool:
+        """
+        Queue photos to be enriched together in chunks of ENRICHMENT_BATCH_SIZE.
+        Returns False if the queue filled up part way; the rest stay pending.
+        """
+        size = max(1, settings.ENRICHMENT_BATCH_SIZE)
+        for start in range(0, len(photo_ids), size):
+            try:
+                self._queue.put_nowait(list(photo_ids[start:start + size]))
+            except queue.Full:
+                return False
+        return True
+
+    def poll_pending(self) -> int:
+        """
+        Queue claimable photos (see claim()) when the queue has drained, as many
+        as fit; returns how many were queued. Photos queued twice, here or by
+        another process, are only inferred once.
+        """
+        if not self._queue.empty():
+            return 0
+        limit = (self._queue.maxsize or 1) * max(1, settings.ENRICHMENT_BATCH_SIZE)
+        db = self.session_factory()
+        try:
+            photo_ids = [
+                row.photo_id
+                for row in db.query(Photo.photo_id)
+                .filter(_claimable(datetime.utcnow()))
+                .order_by(Photo.photo_id)
+                .limit(limit)
+                .all()
+            ]
+        finally:
+            db.close()
+
+        self.submit_batch(photo_ids)
+        return len(photo_ids)
+
+    def _poll(self):
+        # First round straight away, for photos left by a previous run
+        while True:
+            try:
+                self.poll_pending()
+            except Exception:
+                logger.exception("Polling for pending photos failed")
+            if self._stopping.wait(settings.ENRICHMENT_POLL_INTERVAL):
+                return
+
+    def _pregenerate_renditions(self, db: Session, photo_id: int):
+        # Feed thumbnails are ready before the first view; failures just mean on-demand rendering later
+        photo = db.query(Photo.file_path).filter(Photo.photo_id == photo_id).first()
+        if not photo:
+            return
+        try:
+            generate_renditions(photo_id, photo.file_path)
+        except Exception as e:
+            logger.warning("Rendition generation failed for photo %s: %s", photo_id, e)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                # Single uploads queue a photo id, batch uploads a list of them
+                photo_ids = item if isinstance(item, list) else [item]
+                db = self.session_factory()
+                try:
+                    if len(photo_ids) == 1:
+                        run_enrichment(db, photo_ids[0])
+                    else:
+                        run_enrichment_batch(db, photo_ids)
+                    if settings.RENDITION_PREGENERATE:
+                        for photo_id in photo_ids:
+                            self._pregenerate_renditions(db, photo_id)
+                finally:
+                    db.close()
+            except Exception:
+                logger.exception("Enrichment worker crashed on photos %s", item)
+            finally:
+                self._queue.task_done()
+
+enrichment_queue = EnrichmentQueue(
+    workers=settings.ENRICHMENT_WORKERS,
+    maxsize=settings.ENRICHMENT_QUEUE_SIZE,
+)
@@ -0,0 +1,85 @@
+# services/exif.py
+
+from datetime import datetime
+from typing import Optional
+from PIL import Image
+from services.geohash import encode as geohash_encode
+
+# EXIF tag ids (Pillow's ExifTags.Base / ExifTags.GPS)
+DATETIME = 0x0132
+MAKE = 0x010F
+MODEL = 0x0110
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+DATETIME_ORIGINAL = 0x9003
+LENS_MODEL = 0xA434
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+
+# Photo columns filled from EXIF
+METADATA_FIELDS = ("captured_at", "camera_make", "camera_model", "lens", "latitude", "longitude", "geohash")
+
+# Longest camera/lens string we keep
+MAX_TEXT_LENGTH = 128
+
+
+def _text(value) -> Optional[str]:
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "ignore")
+    if not isinstance(value, str):
+        return None
+    value = value.strip("\x00 ").strip()
+    return value[:MAX_TEXT_LENGTH] or None
+
+
+def _datetime(value) -> Optional[datetime]:
+    value = _text(value)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+
+
+def _degrees(value, ref) -> Optional[float]:
+    try:
+        degrees, minutes, seconds = (float(part) for part in value)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    result = degrees + minutes / 60 + seconds / 3600
+    if _text(ref) in ("S", "W"):
+        result = -result
+    return result
+
+
+def extract_metadata(image: Image.Image) -> dict:
+    """
+    Capture time, camera, lens and GPS position from an opened image's EXIF,
+    as Photo column values. Only the header is read, never the pixels.
+    Missing or malformed fields are left out.
+    """
+    try:
+        exif = image.getexif()
+    except Exception:
+        return {}
+    if not exif:
+        return {}
+
+    exif_ifd = exif.get_ifd(EXIF_IFD)
+    metadata = {
+        "captured_at": _datetime(exif_ifd.get(DATETIME_ORIGINAL)) or _datetime(exif.get(DATETIME)),
+        "camera_make": _text(exif.get(MAKE)),
+        "camera_model": _text(exif.get(MODEL)),
+        "lens": _text(exif_ifd.get(LENS_MODEL)),
+    }
+
+    gps = exif.get_ifd(GPS_IFD)
+    latitude = _degrees(gps.get(GPS_LATITUDE), gps.get(GPS_LATITUDE_REF))
+    longitude = _degrees(gps.get(GPS_LONGITUDE), gps.get(GPS_LONGITUDE_REF))
+    if latitude is not None and longitude is not None and -90 <= latitude <= 90 and -180 <= longitude <= 180:
+        metadata.update(latitude=latitude, longitude=longitude, geohash=geohash_encode(latitude, longitude))
+
+    return {key: value for key, value in metadata.items() if value is not None}
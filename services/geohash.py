@@ -0,0 +1,94 @@
+# services/geohash.py
+
+from typing import List, Optional, Tuple
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+PRECISION = 12  # ~4cm cells, far finer than phone GPS
+
+# A bounding box query is split into at most this many geohash ranges
+MAX_COVERING_CELLS = 32
+
+
+def encode(latitude: float, longitude: float, precision: int = PRECISION) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        value, value_range = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            value_range[0] = mid
+        else:
+            bits = bits * 2
+            value_range[1] = mid
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """
+    (height in degrees latitude, width in degrees longitude) of a cell
+    """
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180 / 2 ** lat_bits, 360 / 2 ** lon_bits
+
+
+def upper_bound(prefix: str) -> Optional[str]:
+    """
+    Smallest geohash that sorts after every geohash starting with prefix, or
+    None if there is none. Stays within the base32 alphabet so the bound
+    compares the same way under any collation.
+    """
+    chars = list(prefix)
+    while chars:
+        position = BASE32.index(chars[-1])
+        if position + 1 < len(BASE32):
+            chars[-1] = BASE32[position + 1]
+            return "".join(chars)
+        chars.pop()
+    return None
+
+
+def covering_cells(min_lat: float, min_lon: float, max_lat: float, max_lon: float, max_cells: int = MAX_COVERING_CELLS) -> List[str]:
+    """
+    Geohash cells covering the box, at the finest precision that needs at most max_cells of them
+    """
+    best = [""]
+    for precision in range(1, PRECISION + 1):
+        height, width = cell_size(precision)
+        rows = int(180 / height)
+        columns = int(360 / width)
+        row_range = range(int((min_lat + 90) // height), min(rows - 1, int((max_lat + 90) // height)) + 1)
+        column_range = range(int((min_lon + 180) // width), min(columns - 1, int((max_lon + 180) // width)) + 1)
+        if len(row_range) * len(column_range) > max_cells:
+            break
+        best = [
+            encode(-90 + (row + 0.5) * height, -180 + (column + 0.5) * width, precision)
+            for row in row_range
+            for column in column_range
+        ]
+    return best
+
+
+def covering_ranges(min_lat: float, min_lon: float, max_lat: float, max_lon: float, max_cells: int = MAX_COVERING_CELLS) -> List[Tuple[str, Optional[str]]]:
+    """
+    The covering cells as [start, end) geohash ranges, with neighbours along the
+    Z-order curve merged, ready for range scans on an indexed geohash column
+    """
+    ranges = []
+    for cell in sorted(covering_cells(min_lat, min_lon, max_lat, max_lon, max_cells)):
+        if ranges and ranges[-1][1] == cell:
+            ranges[-1] = (ranges[-1][0], upper_bound(cell))
+        else:
+            ranges.append((cell, upper_bound(cell)))
+    return ranges
@@ -0,0 +1,84 @@
+# services/http_cache.py
+
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+from fastapi import Request, Response
+from settings import settings
+
+
+def photo_etag(content_hash: Optional[str], file_path: str, variant: str = "", stat=os.stat) -> str:
+    """
+    Strong ETag for a photo or one of its renditions. Uploads are never
+    modified in place, so the content hash identifies the bytes; photos
+    stored before hashing fall back to the file's mtime and size.
+    `stat` is the storage backend's for originals.
+    """
+    if content_hash:
+        tag = content_hash
+    else:
+        result = stat(file_path)
+        tag = f"{result.st_mtime_ns:x}-{result.st_size:x}"
+    return f'"{tag}{"-" + variant if variant else ""}"'
+
+
+def cache_headers(etag: str, vary: Optional[str] = None, max_age: Optional[int] = None) -> dict:
+    max_age = settings.PHOTO_CACHE_MAX_AGE if max_age is None else min(max_age, settings.PHOTO_CACHE_MAX_AGE)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={max_age}",
+    }
+    if vary:
+        headers["Vary"] = vary
+    return headers
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    candidates = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    return etag.removeprefix("W/") in candidates
+
+
+def not_modified(request: Request, etag: str, file_path: str, stat=os.stat) -> bool:
+    """
+    Whether the client's cached copy is current (RFC 9110 13.2.2: If-None-Match
+    takes precedence and If-Modified-Since is only checked without it)
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+            return int(stat(file_path).st_mtime) <= since
+        except (TypeError, ValueError, OSError):
+            return False
+    return False
+
+
+def requested_range(request: Request, etag: str) -> Optional[str]:
+    """
+    The Range header to honour, or None for the whole file: a range only
+    applies while an If-Range validator still matches (RFC 9110 13.1.5, strong
+    comparison, so only an ETag can match; a date never does here)
+    """
+    range_header = request.headers.get("range")
+    if not range_header:
+        return None
+    if_range = request.headers.get("if-range")
+    if if_range is not None and (etag.startswith("W/") or if_range.strip() != etag):
+        return None
+    return range_header
+
+
+def not_modified_response(etag: str, file_path: str, vary: Optional[str] = None, stat=os.stat, max_age: Optional[int] = None) -> Response:
+    headers = cache_headers(etag, vary, max_age)
+    try:
+        headers["Last-Modified"] = formatdate(stat(file_path).st_mtime, usegmt=True)
+    except OSError:
+        pass
+    return Response(status_code=304, headers=headers)
@@ -0,0 +1,29 @@
+# services/image_ingest.py
+
+from PIL import Image
+from settings import settings
+
+# Decoding anything bigger than uploads are allowed to be is treated as a decompression bomb
+Image.MAX_IMAGE_PIXELS = settings.MAX_IMAGE_PIXELS
+
+# Largest input any of our models needs (BLIP base runs at 384px, CLIP at 224px)
+MODEL_INPUT_SIZE = 384
+
+
+def load_image(source, min_side: int = MODEL_INPUT_SIZE) -> Image.Image:
+    """
+    Decode an image once for inference, shrinking it so its shorter side is
+    `min_side`. JPEGs are decoded in draft mode, which lets libjpeg scale by
+    1/2, 1/4 or 1/8 while decoding instead of materialising every pixel of a
+    full-resolution camera file.
+    """
+    with Image.open(source) as image:
+        image.draft("RGB", (min_side, min_side))
+        image = image.convert("RGB")
+
+    width, height = image.size
+    scale = min_side / min(width, height)
+    if scale < 1:
+        new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = image.resize(new_size, Image.Resampling.BICUBIC)
+    return image
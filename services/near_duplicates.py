@@ -0,0 +1,188 @@
+# services/near_duplicates.py
+
+import threading
+from datetime import datetime, timedelta
+from functools import lru_cache
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple, Union
+from PIL import Image
+from sqlalchemy.orm import Session
+from models import Photo
+from settings import settings
+
+
+def dhash(source: Union[str, Image.Image]) -> str:
+    """
+    64-bit difference hash as 16 hex digits. The image is shrunk to 9x8
+    greyscale and each bit records whether a pixel is brighter than its right
+    neighbour, so resized or re-encoded copies land within a few bits.
+    """
+    if isinstance(source, Image.Image):
+        small = source.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    else:
+        with Image.open(source) as image:
+            # JPEGs decode straight to a small greyscale draft
+            image.draft("L", (64, 64))
+            small = image.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+@lru_cache(maxsize=None)
+def _flip_masks(bits: int, radius: int) -> Tuple[int, ...]:
+    # Every mask with at most `radius` of the low `bits` bits set
+    return tuple(
+        sum(1 << position for position in positions)
+        for flipped in range(radius + 1)
+        for positions in combinations(range(bits), flipped)
+    )
+
+
+class HammingIndex:
+    """
+    Multi-index hashing over 64-bit hashes. Each hash is split into four
+    16-bit chunks with one lookup table per chunk. Two hashes within distance r
+    must agree to within r // 4 bits on at least one chunk, so a query only
+    probes chunk values near its own and then verifies those candidates.
+    """
+
+    CHUNKS = 4
+    CHUNK_BITS = 16
+
+    def __init__(self):
+        self._hashes: Dict[int, int] = {}
+        self._tables = [{} for _ in range(self.CHUNKS)]
+
+    def _chunks(self, value: int):
+        mask = (1 << self.CHUNK_BITS) - 1
+        return [(value >> (i * self.CHUNK_BITS)) & mask for i in range(self.CHUNKS)]
+
+    def add(self, item_id: int, value: int):
+        self.remove(item_id)
+        self._hashes[item_id] = value
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            table.setdefault(chunk, set()).add(item_id)
+
+    def remove(self, item_id: int):
+        value = self._hashes.pop(item_id, None)
+        if value is None:
+            return
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            bucket = table[chunk]
+            bucket.discard(item_id)
+            if not bucket:
+                del table[chunk]
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def query(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """
+        (item_id, distance) for every hash within max_distance bits, closest first
+        """
+        masks = _flip_masks(self.CHUNK_BITS, max_distance // self.CHUNKS)
+        candidates = set()
+        for table, chunk in zip(self._tables, self._chunks(value)):
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+
+        matches = []
+        for item_id in candidates:
+            distance = (self._hashes[item_id] ^ value).bit_count()
+            if distance <= max_distance:
+                matches.append((item_id, distance))
+        matches.sort(key=lambda match: (match[1], match[0]))
+        return matches
+
+
+class NearDuplicateIndex:
+    """
+    One HammingIndex per photographer, so lookups only ever touch the caller's
+    own library. Each process keeps its own copy: it is filled from the photos
+    table on first use, picks up hashes other workers wrote (new photos and
+    hashes filled in later) on every lookup by Photo.perceptual_hash_at, and
+    results are confirmed against the DB before being returned.
+    """
+
+    def __init__(self):
+        self._owners: Dict[int, HammingIndex] = {}
+        self._owner_of: Dict[int, int] = {}
+        self._synced_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def add(self, owner_id: int, photo_id: int, perceptual_hash: Optional[str]):
+        if not perceptual_hash:
+            return
+        with self._lock:
+            self._add(owner_id, photo_id, perceptual_hash)
+
+    def _add(self, owner_id: int, photo_id: int, perceptual_hash: str):
+        self._owners.setdefault(owner_id, HammingIndex()).add(photo_id, int(perceptual_hash, 16))
+        self._owner_of[photo_id] = owner_id
+
+    def remove(self, photo_id: int):
+        with self._lock:
+            owner_id = self._owner_of.pop(photo_id, None)
+            if owner_id is not None:
+                self._owners[owner_id].remove(photo_id)
+
+    def remove_owner(self, owner_id: int):
+        with self._lock:
+            index = self._owners.pop(owner_id, None)
+            for photo_id in list(index._hashes) if index else []:
+                self._owner_of.pop(photo_id, None)
+
+    def sync(self, db: Session):
+        """
+        Index hashes written since the last sync (all of them on first use).
+        Rows are read back from NEAR_DUPLICATE_SYNC_LOOKBACK seconds before the
+        newest stamp seen, so one committed after a later-stamped row still lands.
+        """
+        with self._lock:
+            query = db.query(Photo.photo_id, Photo.owner_id, Photo.perceptual_hash, Photo.perceptual_hash_at).filter(
+                Photo.perceptual_hash.isnot(None)
+            )
+            if self._synced_at is not None:
+                query = query.filter(Photo.perceptual_hash_at >= self._synced_at - timedelta(seconds=settings.NEAR_DUPLICATE_SYNC_LOOKBACK))
+            newest = self._synced_at or datetime.utcnow()
+            for row in query.yield_per(10000):
+                self._add(row.owner_id, row.photo_id, row.perceptual_hash)
+                if row.perceptual_hash_at and row.perceptual_hash_at > newest:
+                    newest = row.perceptual_hash_at
+            self._synced_at = newest
+
+    def find(self, db: Session, owner_id: int, perceptual_hash: str, max_distance: int, exclude_id: Optional[int] = None) -> List[Tuple[int, int]]:
+        """
+        (photo_id, distance) for the owner's photos within max_distance bits, closest first
+        """
+        self.sync(db)
+        value = int(perceptual_hash, 16)
+        with self._lock:
+            index = self._owners.get(owner_id)
+            matches = [match for match in index.query(value, max_distance) if match[0] != exclude_id] if index else []
+        if not matches:
+            return []
+
+        # Another worker may have deleted a photo this copy still knows about
+        current = {
+            row.photo_id: row.perceptual_hash
+            for row in db.query(Photo.photo_id, Photo.perceptual_hash).filter(
+                Photo.photo_id.in_([photo_id for photo_id, _ in matches]),
+                Photo.owner_id == owner_id
+            ).all()
+        }
+        return [
+            (photo_id, distance)
+            for photo_id, distance in matches
+            if current.get(photo_id) and (int(current[photo_id], 16) ^ value).bit_count() == distance
+        ]
+
+
+near_duplicate_index = NearDuplicateIndex()
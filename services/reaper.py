@@ -0,0 +1,253 @@
+# services/reaper.py
+
+import logging
+import os
+import threading
+import time
+from itertools import islice
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import PendingDeletion, Photo, StoredFile
+from services import renditions, storage
+from services.storage import content_hash_of, remove_local_file
+from services.vector_index import embedding_index
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Temp files of uploads, store imports and renditions; one this old was abandoned by a crash
+_TEMP_PREFIXES = (".upload-", ".store-", ".rendition-")
+
+
+def _reap_stored(db: Session, entries: List[PendingDeletion]) -> int:
+    """
+    Delete the stored files among `entries` that no photo references any more.
+    Every file gets a locked row first (a tombstone if it had none), so an
+    upload adding a reference to the same bytes either commits before the
+    check or waits until the file and row are both gone and writes it again.
+    """
+    paths = {entry.content_hash: entry.file_path for entry in entries}
+    if not paths:
+        return 0
+    tombstones = [{"content_hash": h, "file_path": p, "ref_count": 0} for h, p in sorted(paths.items())]
+    db.execute(storage.dialect_insert(db)(StoredFile).values(tombstones).on_conflict_do_nothing())
+
+    unused = db.query(StoredFile).filter(
+        StoredFile.content_hash.in_(paths),
+        StoredFile.ref_count <= 0
+    ).order_by(StoredFile.content_hash).with_for_update().all()
+    for stored in unused:
+        storage.backend.delete(stored.file_path)
+        db.delete(stored)
+    return len(unused)
+
+
+def reap(db: Session, batch_size: int) -> int:
+    """
+    Work off up to `batch_size` journal entries in one transaction; returns how many were handled
+    """
+    entries = db.query(PendingDeletion).order_by(PendingDeletion.id).limit(batch_size).with_for_update(skip_locked=True).all()
+    if not entries:
+        return 0
+
+    photo_ids = [entry.photo_id for entry in entries if entry.photo_id is not None]
+    for photo_id in photo_ids:
+        renditions.delete_renditions(photo_id)
+    embedding_index.remove_many(photo_ids)
+
+    _reap_stored(db, [entry for entry in entries if entry.file_path and entry.content_hash])
+
+    # Files from before content addressing, unless a photo still points at them
+    legacy = {entry.file_path for entry in entries if entry.file_path and not entry.content_hash}
+    if legacy:
+        in_use = {row.file_path for row in db.query(Photo.file_path).filter(Photo.file_path.in_(legacy)).all()}
+        for path in legacy - in_use:
+            remove_local_file(path)
+
+    for entry in entries:
+        db.delete(entry)
+    db.commit()
+    return len(entries)
+
+
+def _pages(items: Iterable, size: int) -> Iterable[list]:
+    items = iter(items)
+    while page := list(islice(items, size)):
+        yield page
+
+
+class OrphanSweep:
+    """
+    Reconciles the store with the photos table after crashes and failed
+    requests. Stored files no photo uses and stored_files rows left at zero
+    references are journaled for the reaper; counts below the number of photos
+    using a file are raised (never lowered: a count that is too high only keeps
+    a file around). Renditions of deleted photos and abandoned temp files are
+    removed directly. Files younger than `min_age` are left alone.
+    """
+
+    def __init__(self, session_factory=SessionLocal, min_age: Optional[float] = None, page_size: int = 1000):
+        self.session_factory = session_factory
+        self.min_age = settings.ORPHAN_MIN_AGE if min_age is None else min_age
+        self.page_size = max(1, page_size)
+        self.stats = {"repaired": 0, "orphans": 0, "renditions": 0, "temp_files": 0}
+
+    def run(self) -> dict:
+        db = self.session_factory()
+        try:
+            self._repair_ref_counts(db)
+            self._sweep_store(db)
+            self._sweep_renditions(db)
+        finally:
+            db.close()
+        return self.stats
+
+    def _old_enough(self, files: Iterable[Tuple[str, float]]) -> Iterable[str]:
+        cutoff = time.time() - self.min_age
+        for path, mtime in files:
+            if mtime > cutoff:
+                continue
+            if os.path.basename(path).startswith(_TEMP_PREFIXES):
+                remove_local_file(path)
+                self.stats["temp_files"] += 1
+                continue
+            yield path
+
+    def _repair_ref_counts(self, db: Session):
+        in_use = select(func.count()).where(Photo.file_path == StoredFile.file_path).scalar_subquery()
+        self.stats["repaired"] = db.execute(
+            update(StoredFile)
+            .where(StoredFile.ref_count < in_use)
+            .values(ref_count=in_use)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        # Tombstones whose journal entry was lost
+        unjournaled = db.query(StoredFile.content_hash, StoredFile.file_path).filter(
+            StoredFile.ref_count <= 0,
+            ~select(PendingDeletion.id).where(PendingDeletion.content_hash == StoredFile.content_hash).exists()
+        ).all()
+        db.add_all(PendingDeletion(file_path=row.file_path, content_hash=row.content_hash) for row in unjournaled)
+        db.commit()
+        self.stats["orphans"] += len(unjournaled)
+
+    def _sweep_store(self, db: Session):
+        # RENDITION_DIR may be configured inside UPLOAD_DIR
+        rendition_dir = os.path.join(os.path.abspath(renditions.RENDITION_DIR), "")
+        files = (
+            (path, mtime) for path, mtime in storage.backend.iter_files()
+            if not os.path.abspath(path).startswith(rendition_dir)
+        )
+        for page in _pages(self._old_enough(files), self.page_size):
+            known = set()
+            for column, query in (
+                (StoredFile.file_path, db.query(StoredFile.file_path)),
+                (Photo.file_path, db.query(Photo.file_path)),
+                (PendingDeletion.file_path, db.query(PendingDeletion.file_path)),
+            ):
+                known.update(row.file_path for row in query.filter(column.in_(page)).all())
+
+            orphans = [path for path in page if path not in known]
+            db.add_all(PendingDeletion(file_path=path, content_hash=content_hash_of(path)) for path in orphans)
+            db.commit()
+            self.stats["orphans"] += len(orphans)
+
+    def _sweep_renditions(self, db: Session):
+        root = renditions.RENDITION_DIR
+        files = []
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            try:
+                files.append((path, os.stat(path).st_mtime))
+            except FileNotFoundError:
+                continue
+
+        for page in _pages(self._old_enough(files), self.page_size):
+            # Named <photo_id>_<size>.<format>
+            by_photo = {}
+            for path in page:
+                photo_id = os.path.basename(path).split("_", 1)[0]
+                if photo_id.isdigit():
+                    by_photo.setdefault(int(photo_id), []).append(path)
+            existing = {row.photo_id for row in db.query(Photo.photo_id).filter(Photo.photo_id.in_(by_photo)).all()}
+            for photo_id, paths in by_photo.items():
+                if photo_id not in existing:
+                    for path in paths:
+                        remove_local_file(path)
+                    self.stats["renditions"] += len(paths)
+
+
+class FileReaper:
+    """
+    Background thread that removes the files of deleted photos once their
+    delete has committed, so deleting any number of photos returns as soon as
+    the rows are gone. Woken by wake() after a commit and every REAPER_INTERVAL
+    seconds otherwise; runs an OrphanSweep every ORPHAN_SWEEP_INTERVAL.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._next_sweep = 0.0
+
+    def start(self):
+        if self._thread:
+            return
+        self._stopping.clear()
+        self._next_sweep = time.monotonic() + settings.ORPHAN_SWEEP_INTERVAL
+        self._thread = threading.Thread(target=self._run, name="file-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if not self._thread:
+            return
+        self._stopping.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def wake(self):
+        """
+        Called after a delete commits, so its files go now rather than at the next interval
+        """
+        self._wake.set()
+
+    def run_once(self) -> int:
+        """
+        Work off the whole journal; returns how many entries were handled
+        """
+        batch_size = max(1, settings.REAPER_BATCH_SIZE)
+        handled = 0
+        db = self.session_factory()
+        try:
+            while not self._stopping.is_set():
+                count = reap(db, batch_size)
+                handled += count
+                if count < batch_size:
+                    break
+        finally:
+            db.close()
+        return handled
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(settings.REAPER_INTERVAL)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.run_once()
+                if settings.ORPHAN_SWEEP_INTERVAL > 0 and time.monotonic() >= self._next_sweep:
+                    self._next_sweep = time.monotonic() + settings.ORPHAN_SWEEP_INTERVAL
+                    logger.info("Orphan sweep: %s", OrphanSweep(self.session_factory).run())
+                    self._wake.set()
+            except Exception:
+                # Entries stay journaled and are retried on the next round
+                logger.exception("File reaper failed")
+
+
+file_reaper = FileReaper()
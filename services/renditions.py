@@ -0,0 +1,75 @@
+# services/renditions.py
+
+import glob
+import os
+import tempfile
+from PIL import Image, ImageOps
+from services import storage
+from settings import RENDITION_DIR, settings
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+
+
+def negotiate_format(accept: str) -> str:
+    """
+    Serve WebP to clients that advertise it, JPEG to everyone else
+    """
+    return "webp" if "image/webp" in (accept or "") else "jpeg"
+
+
+def rendition_path(photo_id: int, size: int, fmt: str) -> str:
+    return os.path.join(RENDITION_DIR, f"{photo_id}_{size}.{fmt}")
+
+
+def _render(source: str, size: int, fmt: str, dest_path: str):
+    with storage.backend.open(source) as f, Image.open(f) as image:
+        # Let libjpeg do most of the downscaling while decoding
+        image.draft("RGB", (size, size))
+        # Phones and cameras store the pixels as shot and record the rotation in EXIF
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+    pil_format, _ = FORMATS[fmt]
+    if fmt == "webp":
+        options = {"quality": settings.RENDITION_WEBP_QUALITY, "method": 4}
+    else:
+        options = {"quality": settings.RENDITION_JPEG_QUALITY, "optimize": True, "progressive": True}
+
+    # Write then rename so concurrent requests never serve a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path), prefix=".rendition-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, format=pil_format, **options)
+        os.replace(tmp_path, dest_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def get_rendition(photo_id: int, source: str, size: int, fmt: str) -> str:
+    """
+    Path of the cached rendition, generating it on first request
+    """
+    path = rendition_path(photo_id, size, fmt)
+    if not os.path.exists(path):
+        _render(source, size, fmt, path)
+    return path
+
+
+def generate_renditions(photo_id: int, source: str):
+    for size in settings.RENDITION_SIZES:
+        for fmt in FORMATS:
+            get_rendition(photo_id, source, size, fmt)
+
+
+def delete_renditions(photo_id: int):
+    # Glob rather than RENDITION_SIZES so sizes that were dropped from the settings go too
+    for path in glob.glob(os.path.join(RENDITION_DIR, f"{photo_id}_*")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
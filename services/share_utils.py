@@ -1,10 +1,82 @@
+import logging
+import threading
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import delete, select, tuple_
 from sqlalchemy.orm import Session
+from database import SessionLocal
 from models import SharePhoto
-from datetime import datetime
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def clean_expired_shares(db: Session, batch_size: Optional[int] = None, now: Optional[datetime] = None) -> int:
+    """
+    Delete shares that expired before `now`, one indexed DELETE and commit per
+    batch so no transaction holds more than batch_size row locks; returns how many went
+    """
+    batch_size = max(1, batch_size or settings.SHARE_SWEEP_BATCH_SIZE)
+    now = now or datetime.utcnow()
+    expired = (
+        select(SharePhoto.photo_id, SharePhoto.user_id)
+        .where(SharePhoto.expires_at < now)
+        .limit(batch_size)
+    )
+    deleted = 0
+    while True:
+        count = db.execute(
+            delete(SharePhoto)
+            .where(tuple_(SharePhoto.photo_id, SharePhoto.user_id).in_(expired))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+class ShareExpirySweeper:
+    """
+    Background thread deleting expired shares every SHARE_SWEEP_INTERVAL
+    seconds with its own DB session. Access checks already ignore expired
+    shares, so this only keeps the table small.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self.session_factory = session_factory
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread or settings.SHARE_SWEEP_INTERVAL <= 0:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="share-expiry", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if not self._thread:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def run_once(self) -> int:
+        db = self.session_factory()
+        try:
+            return clean_expired_shares(db)
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stopping.wait(settings.SHARE_SWEEP_INTERVAL):
+            try:
+                deleted = self.run_once()
+                if deleted:
+                    logger.info("Deleted %s expired shares", deleted)
+            except Exception:
+                logger.exception("Expired share sweep failed")
+
 
-def clean_expired_shares(db: Session):
-    now = datetime.utcnow()
-    expired = db.query(SharePhoto).filter(SharePhoto.expires_at < now).all()
-    for share in expired:
-        db.delete(share)
-    db.commit()
+share_expiry_sweeper = ShareExpirySweeper()
@@ -0,0 +1,77 @@
+# services/signed_urls.py
+
+import base64
+import hashlib
+import hmac
+import os
+import time
+from functools import lru_cache
+from typing import Optional
+from urllib.parse import quote, urlencode
+from auth import SECRET_KEY
+from services.storage import content_hash_of, is_stored_key, storage_key
+from settings import settings
+
+
+@lru_cache(maxsize=1)
+def _signing_key() -> bytes:
+    """
+    Derived from SECRET_KEY so these signatures can't be confused with
+    anything else it signs. Checked on first use rather than at import, so
+    only signing and verifying fail without it, not the whole app.
+    """
+    if not SECRET_KEY:
+        # Anyone could derive the signing key and mint links to any photo
+        raise RuntimeError("SECRET_KEY must be set to sign photo URLs")
+    return hashlib.sha256(b"signed-photo-url:" + SECRET_KEY.encode()).digest()
+
+
+def _signature(photo_id: int, key: str, size: Optional[int], expires: int) -> str:
+    message = f"{photo_id}\n{key}\n{size or ''}\n{expires}".encode()
+    digest = hmac.new(_signing_key(), message, hashlib.sha256).digest()[:16]
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def url_expiry(now: Optional[float] = None) -> int:
+    """
+    Expiry for URLs issued now. It is rounded to SIGNED_URL_TTL, so every URL
+    issued for the same photo within one window is identical and browsers
+    reuse their cached copy; each stays valid for one to two TTLs.
+    """
+    ttl = settings.SIGNED_URL_TTL
+    now = time.time() if now is None else now
+    return (int(now) // ttl + 2) * ttl
+
+
+def signed_photo_url(photo_id: int, file_path: str, size: Optional[int] = None, expires: Optional[int] = None) -> Optional[str]:
+    """
+    A URL serving the photo (or one of its renditions) to whoever holds it
+    until it expires. Only issue it to viewers who passed the access check.
+    None for files from before content addressing, which the signed route
+    doesn't serve; migrate_storage.py moves them into the store.
+    """
+    expires = url_expiry() if expires is None else expires
+    key = storage_key(file_path).replace(os.sep, "/")
+    if not is_stored_key(key):
+        return None
+    query = {"size": size} if size else {}
+    query.update(expires=expires, signature=_signature(photo_id, key, size, expires))
+    return f"/photos/signed/{photo_id}/{quote(key)}?{urlencode(query)}"
+
+
+def photo_urls(photo_id: int, file_path: str, expires: Optional[int] = None) -> dict:
+    """
+    Signed `url` and `thumbnail_url` (smallest rendition) fields for list responses
+    """
+    expires = url_expiry() if expires is None else expires
+    return {
+        "url": signed_photo_url(photo_id, file_path, None, expires),
+        "thumbnail_url": signed_photo_url(photo_id, file_path, min(settings.RENDITION_SIZES), expires),
+    }
+
+
+def verify_photo_url(photo_id: int, key: str, size: Optional[int], expires: int, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(_signature(photo_id, key, size, expires), signature)
+
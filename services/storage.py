@@ -0,0 +1,292 @@
+# services/storage.py
+
+import hashlib
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import DateTime, exists, func, insert, literal, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import PendingDeletion, Photo, StoredFile
+from services.image_ingest import load_image
+from services.storage_backends import get_storage_backend
+from settings import UPLOAD_DIR, settings
+
+logger = logging.getLogger(__name__)
+
+backend = get_storage_backend(settings.STORAGE_BACKEND, root=UPLOAD_DIR)
+
+_CONTENT_HASH = re.compile(r"[0-9a-f]{64}")
+# <h[:2]>/<h[2:4]>/<h>.<ext>, as laid out by shard_path
+_STORAGE_KEY = re.compile(r"([0-9a-f]{2})/([0-9a-f]{2})/([0-9a-f]{64})\.[a-z0-9]{1,5}")
+
+
+def shard_path(content_hash: str, ext: str) -> str:
+    """
+    Where the bytes with this sha256 live: two levels of 256 directories each,
+    so no directory grows past a few thousand files even at hundreds of millions
+    """
+    return os.path.join(UPLOAD_DIR, content_hash[:2], content_hash[2:4], f"{content_hash}{ext}")
+
+
+def storage_key(file_path: str) -> str:
+    """
+    A stored file's path relative to UPLOAD_DIR
+    """
+    return os.path.relpath(file_path, UPLOAD_DIR)
+
+
+def storage_path(key: str) -> str:
+    """
+    The file_path for a storage_key written with forward slashes
+    """
+    return os.path.join(UPLOAD_DIR, *key.split("/"))
+
+
+def is_stored_key(key: str) -> bool:
+    """
+    Whether a forward-slash key is a well-formed content-addressed storage key
+    """
+    match = _STORAGE_KEY.fullmatch(key)
+    return bool(match) and match.group(3).startswith(match.group(1) + match.group(2))
+
+
+def stored_key_path(key: str) -> Optional[str]:
+    """
+    The file_path for a storage key taken from a URL, or None unless it is a
+    content-addressed key that resolves (symlinks included) inside UPLOAD_DIR
+    """
+    if not is_stored_key(key):
+        return None
+    file_path = storage_path(key)
+    root = os.path.realpath(UPLOAD_DIR)
+    if os.path.commonpath([root, os.path.realpath(file_path)]) != root:
+        return None
+    return file_path
+
+
+def content_hash_of(key: str) -> Optional[str]:
+    """
+    The content hash in a content-addressed key or path
+    """
+    stem = os.path.splitext(os.path.basename(key))[0]
+    return stem if _CONTENT_HASH.fullmatch(stem) else None
+
+
+def file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(settings.UPLOAD_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def dialect_insert(db: Session):
+    """
+    insert() with on_conflict_do_update/do_nothing for the database in use
+    """
+    return postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+
+
+def add_reference(db: Session, content_hash: str, ext: str) -> str:
+    """
+    Count one more photo using these bytes and return the path they are stored
+    at. The caller places the file there (if it isn't already) before
+    committing; until then the row stays locked, so the reaper can't remove
+    the file of a released copy from under it.
+    """
+    statement = dialect_insert(db)(StoredFile).values(content_hash=content_hash, file_path=shard_path(content_hash, ext), ref_count=1)
+    # An existing row keeps its path, whatever extension this copy came with
+    return db.execute(statement.on_conflict_do_update(
+        index_elements=[StoredFile.content_hash],
+        set_={"ref_count": StoredFile.ref_count + 1}
+    ).returning(StoredFile.file_path)).scalar_one()
+
+
+def reference_existing(db: Session, photo: Photo) -> str:
+    """
+    add_reference for a new photo of an existing photo's bytes
+    """
+    file_path = add_reference(db, photo.content_hash, os.path.splitext(photo.file_path)[1].lower())
+    if photo.file_path != file_path:
+        # Stored before content addressing, so it is copied into the store first
+        backend.import_file(photo.file_path, file_path)
+    return file_path
+
+
+def load_stored_image(file_path: str):
+    """
+    load_image for a photo's file, wherever the storage backend keeps it
+    """
+    with backend.open(file_path) as f:
+        return load_image(f)
+
+
+def remove_local_file(file_path: str):
+    """
+    Remove a local file (from before content addressing, or a rendition), if it's still there
+    """
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning("Could not delete %s: %s", file_path, e)
+
+
+def release_photos(db: Session, criterion):
+    """
+    Drop the file references of every photo matching `criterion` before their
+    rows are deleted in the same transaction, and journal their files and
+    renditions for services.reaper. Two statements however many photos match,
+    and no file is touched until the transaction commits.
+    """
+    released = select(func.count()).where(Photo.file_path == StoredFile.file_path, criterion).scalar_subquery()
+    db.execute(
+        update(StoredFile)
+        .where(StoredFile.file_path.in_(select(Photo.file_path).where(criterion)))
+        .values(ref_count=StoredFile.ref_count - released)
+        .execution_options(synchronize_session=False)
+    )
+    # content_hash stays NULL for files from before content addressing, which are the photo's own
+    db.execute(insert(PendingDeletion).from_select(
+        ["file_path", "content_hash", "photo_id", "created_at"],
+        select(Photo.file_path, StoredFile.content_hash, Photo.photo_id, literal(datetime.utcnow(), DateTime))
+        .outerjoin(StoredFile, StoredFile.file_path == Photo.file_path)
+        .where(criterion)
+    ))
+
+
+def release(db: Session, photo: Photo):
+    """
+    release_photos for a single photo
+    """
+    release_photos(db, Photo.photo_id == photo.photo_id)
+
+
+def _drop_reference(db: Session, content_hash: str, file_path: str):
+    db.execute(
+        update(StoredFile)
+        .where(StoredFile.content_hash == content_hash)
+        .values(ref_count=StoredFile.ref_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.add(PendingDeletion(file_path=file_path, content_hash=content_hash))
+
+
+def discard_unreferenced(db: Session, file_path: Optional[str]):
+    """
+    Clean up after a rolled back upload: the reaper removes the file unless a committed photo uses it
+    """
+    if not file_path:
+        return
+    try:
+        db.add(PendingDeletion(file_path=file_path, content_hash=content_hash_of(file_path)))
+        db.commit()
+    except SQLAlchemyError as e:
+        # Most likely the same trouble that failed the upload; OrphanSweep finds the file later
+        db.rollback()
+        logger.warning("Could not journal %s for deletion: %s", file_path, e)
+
+
+class StorageMigration:
+    """
+    Moves photos from the old flat `<photo_id>.<ext>` layout into the sharded
+    content-addressed store while the app keeps serving.
+
+    Photos whose file_path isn't a stored file are walked in photo_id order,
+    one page per commit. Each file is imported into the storage backend (a
+    hard link on local disk) and the row is pointed at it; identical files
+    collapse into one with a reference per photo. The old files are only removed `grace` seconds
+    after their page commits, so views that still hold the old path (e.g. in
+    the access cache) keep working. A rerun picks up whatever is left.
+    """
+
+    def __init__(self, session_factory=SessionLocal, page_size: int = 500, grace: Optional[float] = None, limit: Optional[int] = None):
+        self.session_factory = session_factory
+        self.page_size = max(1, page_size)
+        self.grace = settings.ACCESS_CACHE_TTL if grace is None else grace
+        self.limit = limit
+        self.stats = {"migrated": 0, "missing": 0, "removed": 0}
+
+    def _next_page(self, db: Session, after_id: int):
+        return db.query(Photo.photo_id, Photo.file_path, Photo.content_hash).filter(
+            Photo.photo_id > after_id,
+            ~exists().where(StoredFile.file_path == Photo.file_path)
+        ).order_by(Photo.photo_id).limit(self.page_size).all()
+
+    def run(self) -> dict:
+        db = self.session_factory()
+        last_photo_id = 0
+        seen = 0
+        pending: List[Tuple[float, List[str]]] = []  # (remove after, old paths) per committed page
+
+        try:
+            while self.limit is None or seen < self.limit:
+                rows = self._next_page(db, last_photo_id)
+                if self.limit is not None:
+                    rows = rows[:self.limit - seen]
+                if not rows:
+                    break
+
+                old_paths = [path for path in (self._migrate(db, row) for row in rows) if path]
+                db.commit()
+                seen += len(rows)
+                last_photo_id = rows[-1].photo_id
+                pending.append((time.monotonic() + self.grace, old_paths))
+                self._remove_old(db, pending)
+                logger.info("Migrated up to photo %s (%s photos)", last_photo_id, seen)
+
+            if pending:
+                time.sleep(max(0.0, pending[-1][0] - time.monotonic()))
+                self._remove_old(db, pending)
+        finally:
+            db.close()
+
+        return self.stats
+
+    def _migrate(self, db: Session, row) -> Optional[str]:
+        """
+        Point one photo at its stored file; returns its old path, to be removed later
+        """
+        if not row.file_path or not os.path.exists(row.file_path):
+            self.stats["missing"] += 1
+            return None
+
+        content_hash = row.content_hash or file_sha256(row.file_path)
+        ext = os.path.splitext(row.file_path)[1].lower()
+        file_path = add_reference(db, content_hash, ext)
+        backend.import_file(row.file_path, file_path)
+
+        # The photo may have been deleted or moved since the page was read
+        updated = db.execute(
+            update(Photo)
+            .where(Photo.photo_id == row.photo_id, Photo.file_path == row.file_path)
+            .values(file_path=file_path, content_hash=content_hash)
+        ).rowcount
+        if not updated:
+            _drop_reference(db, content_hash, file_path)
+            return None
+
+        self.stats["migrated"] += 1
+        return row.file_path if row.file_path != file_path else None
+
+    def _remove_old(self, db: Session, pending: List[Tuple[float, List[str]]]):
+        now = time.monotonic()
+        while pending and pending[0][0] <= now:
+            _, old_paths = pending.pop(0)
+            old_paths = set(old_paths)
+            # Legacy copies can be shared by rows that haven't been migrated yet
+            still_used = {
+                row.file_path
+                for row in db.query(Photo.file_path).filter(Photo.file_path.in_(old_paths)).all()
+            } if old_paths else set()
+            for path in old_paths:
+                if path not in still_used:
+                    remove_local_file(path)
+                    self.stats["removed"] += 1
@@ -0,0 +1,284 @@
+# services/storage_backends.py
+
+import mimetypes
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from typing import BinaryIO, Iterator, Optional, Tuple
+from urllib.parse import quote
+from fastapi import Response
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from settings import settings
+
+
+def local_file_response(path: str, root: str, accel_prefix: str, headers: dict, media_type: Optional[str] = None) -> Response:
+    """
+    Serve a local file, or with STORAGE_SERVE=x-accel-redirect / x-sendfile
+    leave the copying to the web server in front of the app
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    media_type = media_type or mimetypes.guess_type(path)[0]
+
+    if settings.STORAGE_SERVE == "x-accel-redirect":
+        # nginx serves it from an `internal` location aliased to root
+        uri = f"{accel_prefix.rstrip('/')}/{quote(os.path.relpath(path, root).replace(os.sep, '/'))}"
+        return Response(headers={**headers, "X-Accel-Redirect": uri}, media_type=media_type)
+    if settings.STORAGE_SERVE == "x-sendfile":
+        return Response(headers={**headers, "X-Sendfile": os.path.abspath(path)}, media_type=media_type)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+
+class StorageBackend:
+    """
+    Where original photos are kept. Files are named by Photo.file_path, which
+    always has the UPLOAD_DIR layout; remote backends map it to an object key.
+    Photos from before content addressing are plain local files and don't go
+    through the backend.
+    """
+    name = "base"
+    serve_modes = ()
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def exists(self, file_path: str) -> bool:
+        raise NotImplementedError
+
+    def open(self, file_path: str) -> BinaryIO:
+        """
+        A seekable binary file object, for Pillow; raises FileNotFoundError
+        """
+        raise NotImplementedError
+
+    def stat(self, file_path: str):
+        """
+        st_size, st_mtime and st_mtime_ns, as used for ETags and Last-Modified
+        """
+        raise NotImplementedError
+
+    def put(self, local_path: str, file_path: str):
+        """
+        Move a finished local file (e.g. an upload's temp file) into the store
+        """
+        raise NotImplementedError
+
+    def import_file(self, local_path: str, file_path: str):
+        """
+        Copy a local file into the store, leaving the original in place
+        """
+        raise NotImplementedError
+
+    def delete(self, file_path: str):
+        """
+        Remove a stored file; one that is already gone is not an error
+        """
+        raise NotImplementedError
+
+    def iter_files(self) -> Iterator[Tuple[str, float]]:
+        """
+        (file_path, st_mtime) of everything in the store, for the orphan sweep
+        """
+        raise NotImplementedError
+
+    def response(self, file_path: str, headers: dict, byte_range: Optional[str] = None) -> Response:
+        """
+        The response for an authorized view of the file; raises FileNotFoundError.
+        `byte_range` is the request's Range header once If-Range has been checked.
+        """
+        raise NotImplementedError
+
+
+class LocalBackend(StorageBackend):
+    name = "local"
+    serve_modes = ("stream", "x-accel-redirect", "x-sendfile")
+
+    def exists(self, file_path):
+        return os.path.exists(file_path)
+
+    def open(self, file_path):
+        return open(file_path, "rb")
+
+    def stat(self, file_path):
+        return os.stat(file_path)
+
+    def put(self, local_path, file_path):
+        # Same filesystem, so this is an atomic rename: readers never see a partial
+        # file, and replacing a stored copy of the same bytes changes nothing for them
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        os.replace(local_path, file_path)
+
+    def import_file(self, local_path, file_path):
+        if os.path.exists(file_path):
+            return
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # A hard link when the store is on the same filesystem, otherwise a copy renamed into place
+        try:
+            os.link(local_path, file_path)
+            return
+        except FileExistsError:
+            return
+        except OSError:
+            pass
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), prefix=".store-")
+        try:
+            with os.fdopen(fd, "wb") as dest, open(local_path, "rb") as source:
+                shutil.copyfileobj(source, dest, settings.UPLOAD_CHUNK_SIZE)
+            os.replace(tmp_path, file_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete(self, file_path):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+    def iter_files(self):
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    yield path, os.stat(path).st_mtime
+                except FileNotFoundError:
+                    continue
+
+    def response(self, file_path, headers, byte_range=None):
+        # FileResponse reads Range and If-Range from the request itself
+        return local_file_response(file_path, self.root, settings.ACCEL_REDIRECT_UPLOAD_PREFIX, headers)
+
+
+class S3Backend(StorageBackend):
+    """
+    Any S3-compatible object store (AWS, MinIO, R2, ...). Credentials come from
+    the usual boto3 sources; the client is created on first use so boto3 is
+    only needed when this backend is selected.
+    """
+    name = "s3"
+    serve_modes = ("stream", "redirect")
+
+    def __init__(self, root: str, client=None, bucket: Optional[str] = None, prefix: Optional[str] = None):
+        super().__init__(root)
+        self._client = client
+        self.bucket = bucket or settings.S3_BUCKET
+        self.prefix = settings.S3_PREFIX if prefix is None else prefix
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=settings.S3_ENDPOINT_URL or None,
+                region_name=settings.S3_REGION or None,
+            )
+        return self._client
+
+    def key(self, file_path: str) -> str:
+        return self.prefix + os.path.relpath(file_path, self.root).replace(os.sep, "/")
+
+    def _call(self, method: str, file_path: str, **kwargs) -> dict:
+        from botocore.exceptions import ClientError
+
+        try:
+            return getattr(self.client, method)(Bucket=self.bucket, Key=self.key(file_path), **kwargs)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise FileNotFoundError(file_path) from e
+            raise
+
+    def exists(self, file_path):
+        try:
+            self._call("head_object", file_path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def open(self, file_path):
+        body = self._call("get_object", file_path)["Body"]
+        # Spooled to disk past a few chunks, so a big original doesn't sit in memory
+        spool = tempfile.SpooledTemporaryFile(max_size=4 * settings.UPLOAD_CHUNK_SIZE)
+        for chunk in iter(lambda: body.read(settings.UPLOAD_CHUNK_SIZE), b""):
+            spool.write(chunk)
+        spool.seek(0)
+        return spool
+
+    def stat(self, file_path):
+        head = self._call("head_object", file_path)
+        mtime = head["LastModified"].timestamp()
+        return SimpleNamespace(st_size=head["ContentLength"], st_mtime=mtime, st_mtime_ns=int(mtime * 1e9))
+
+    def import_file(self, local_path, file_path):
+        extra = {}
+        media_type = mimetypes.guess_type(file_path)[0]
+        if media_type:
+            # Served as-is by presigned redirects
+            extra["ContentType"] = media_type
+        self.client.upload_file(local_path, self.bucket, self.key(file_path), ExtraArgs=extra)
+
+    def put(self, local_path, file_path):
+        self.import_file(local_path, file_path)
+        os.remove(local_path)
+
+    def delete(self, file_path):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(file_path))
+
+    def iter_files(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                key = obj["Key"][len(self.prefix):]
+                yield os.path.join(self.root, *key.split("/")), obj["LastModified"].timestamp()
+
+    def response(self, file_path, headers, byte_range=None):
+        if settings.STORAGE_SERVE == "redirect":
+            url = self.client.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": self.bucket, "Key": self.key(file_path)},
+                ExpiresIn=settings.S3_PRESIGN_EXPIRES,
+            )
+            # The browser may reuse the redirect, but never past the URL's expiry
+            max_age = min(settings.PHOTO_CACHE_MAX_AGE, settings.S3_PRESIGN_EXPIRES // 2)
+            return RedirectResponse(url, status_code=302, headers={**headers, "Cache-Control": f"private, max-age={max_age}"})
+
+        from botocore.exceptions import ClientError
+
+        # The store answers a single range itself; multipart ranges get the whole object
+        kwargs = {}
+        if byte_range and byte_range.strip().startswith("bytes=") and "," not in byte_range:
+            kwargs["Range"] = byte_range.strip()
+        try:
+            obj = self._call("get_object", file_path, **kwargs)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "InvalidRange":
+                raise
+            size = self.stat(file_path).st_size
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+        body = obj["Body"]
+        response_headers = {**headers, "Content-Length": str(obj["ContentLength"]), "Accept-Ranges": "bytes"}
+        if obj.get("ContentRange"):
+            response_headers["Content-Range"] = obj["ContentRange"]
+        return StreamingResponse(
+            iter(lambda: body.read(settings.UPLOAD_CHUNK_SIZE), b""),
+            status_code=206 if obj.get("ContentRange") else 200,
+            media_type=obj.get("ContentType") or mimetypes.guess_type(file_path)[0],
+            headers=response_headers,
+        )
+
+BACKENDS = {backend.name: backend for backend in (LocalBackend, S3Backend)}
+
+
+def get_storage_backend(name: str, **kwargs) -> StorageBackend:
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown storage backend '{name}', expected one of {sorted(BACKENDS)}")
+    if settings.STORAGE_SERVE not in backend_class.serve_modes:
+        raise ValueError(f"STORAGE_SERVE={settings.STORAGE_SERVE} doesn't work with the {name} storage backend, expected one of {backend_class.serve_modes}")
+    return backend_class(**kwargs)
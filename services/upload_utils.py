@@ -0,0 +1,102 @@
+# services/upload_utils.py
+
+import hashlib
+import os
+import tempfile
+from fastapi import HTTPException, UploadFile
+from PIL import Image, UnidentifiedImageError
+from services.exif import extract_metadata
+from services.near_duplicates import dhash
+from services import storage
+from settings import settings
+
+# Formats we accept, keyed by what Pillow detects from the file header
+ALLOWED_FORMATS = {
+    "JPEG": ".jpg",
+    "PNG": ".png",
+    "GIF": ".gif",
+}
+
+
+class ReceivedUpload:
+    """
+    An upload that has been streamed to a temp file in UPLOAD_DIR and validated
+    """
+
+    def __init__(self, tmp_path: str, content_hash: str, size: int, image_format: str, width: int, height: int, perceptual_hash: str = None, metadata: dict = None):
+        self.tmp_path = tmp_path
+        self.content_hash = content_hash
+        self.perceptual_hash = perceptual_hash
+        self.metadata = metadata or {}  # EXIF fields as Photo column values
+        self.size = size
+        self.format = image_format
+        self.width = width
+        self.height = height
+
+    @property
+    def ext(self) -> str:
+        return ALLOWED_FORMATS[self.format]
+
+    def move_to(self, file_path: str):
+        storage.backend.put(self.tmp_path, file_path)
+        self.tmp_path = None
+
+    def discard(self):
+        if self.tmp_path and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.tmp_path = None
+
+
+def _check_image_header(path: str):
+    """
+    Identify the image and read its EXIF from the header without decoding any pixel data
+    """
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+            width, height = image.size
+            metadata = extract_metadata(image)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise HTTPException(status_code=400, detail="Invalid image format")
+
+    if image_format not in ALLOWED_FORMATS:
+        raise HTTPException(status_code=400, detail="Invalid image format")
+
+    if width * height > settings.MAX_IMAGE_PIXELS:
+        raise HTTPException(status_code=400, detail="Image dimensions too large")
+
+    return image_format, width, height, metadata
+
+
+def receive_upload(file: UploadFile, dest_dir: str) -> ReceivedUpload:
+    """
+    Stream an upload to disk in fixed-size chunks, hashing it on the way and
+    enforcing MAX_UPLOAD_BYTES, then validate the image header. Memory use is
+    one chunk regardless of the upload size.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    tmp = tempfile.NamedTemporaryFile(dir=dest_dir, prefix=".upload-", suffix=".part", delete=False)
+
+    try:
+        with tmp:
+            for chunk in iter(lambda: file.file.read(settings.UPLOAD_CHUNK_SIZE), b""):
+                size += len(chunk)
+                if size > settings.MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail="File too large")
+                hasher.update(chunk)
+                tmp.write(chunk)
+
+        image_format, width, height, metadata = _check_image_header(tmp.name)
+    except Exception:
+        os.remove(tmp.name)
+        raise
+
+    # Perceptual hash for near-duplicate detection; a file Pillow can't fully
+    # decode just goes without one and fails later in enrichment
+    try:
+        perceptual_hash = dhash(tmp.name)
+    except (OSError, ValueError):
+        perceptual_hash = None
+
+    return ReceivedUpload(tmp.name, hasher.hexdigest(), size, image_format, width, height, perceptual_hash, metadata)
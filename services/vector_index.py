@@ -0,0 +1,285 @@
+# services/vector_index.py
+
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from services.ai_utils import EMBEDDING_DIM
+from settings import settings
+
+
+class EmbeddingIndex:
+    """
+    Normalized image embeddings kept as an append-only float16 matrix on disk
+    (vectors.f16) with a parallel int64 photo id column (ids.i64), both
+    memory-mapped for search. Removing or replacing a photo's embedding
+    tombstones its old row by setting the id to -1; compact() later rewrites
+    both files without those rows.
+
+    Appends take an exclusive file lock, so several web workers can share one
+    directory. Each instance keeps a photo id -> row map of the live rows that
+    only reads the id column appended since its last write. Readers map the
+    files under a shared lock and re-map whenever they have grown or been
+    replaced by a compaction.
+    """
+
+    # Rows converted to float32 per matmul; bounds search memory to ~32MB at 512 dims
+    SEARCH_CHUNK_ROWS = 16384
+
+    def __init__(self, directory: str, dim: int):
+        self.directory = directory
+        self.dim = dim
+        self.vectors_path = os.path.join(directory, "vectors.f16")
+        self.ids_path = os.path.join(directory, "ids.i64")
+        self.lock_path = os.path.join(directory, ".lock")
+
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._ids = None
+        self._rows = 0
+        self._inode = None
+
+        # Live photo id -> row, covering the first _map_rows rows of the id file with inode _map_inode
+        self._row_of: Dict[int, int] = {}
+        self._map_rows = 0
+        self._map_inode = None
+
+    def _file_rows(self) -> int:
+        if not os.path.exists(self.vectors_path) or not os.path.exists(self.ids_path):
+            return 0
+        # The id is written last, so a row only counts once both halves are on disk
+        return min(os.path.getsize(self.vectors_path) // (self.dim * 2), os.path.getsize(self.ids_path) // 8)
+
+    def _ids_inode(self) -> Optional[int]:
+        try:
+            return os.stat(self.ids_path).st_ino
+        except FileNotFoundError:
+            return None
+
+    def _compact_path(self, path: str) -> str:
+        return path + ".compact"
+
+    def _mapped(self) -> Tuple[np.ndarray, np.ndarray]:
+        if os.path.exists(self._compact_path(self.ids_path)):
+            # A compaction is running or was interrupted; wait for it or finish it
+            with self._write_lock():
+                pass
+        with self._lock:
+            with self._file_lock(fcntl.LOCK_SH):
+                rows = self._file_rows()
+                inode = self._ids_inode()
+                if self._vectors is None or rows != self._rows or inode != self._inode:
+                    if rows == 0:
+                        self._vectors = np.zeros((0, self.dim), dtype=np.float16)
+                        self._ids = np.zeros(0, dtype=np.int64)
+                    else:
+                        # A mapping keeps the files it was made from, even once a compaction replaces them
+                        self._vectors = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(rows, self.dim))
+                        self._ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(rows,))
+                    self._rows = rows
+                    self._inode = inode
+            return self._vectors, self._ids
+
+    @contextmanager
+    def _file_lock(self, mode: int):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _write_lock(self):
+        with self._lock:
+            with self._file_lock(fcntl.LOCK_EX):
+                self._finish_compaction()
+                yield
+
+    def _finish_compaction(self):
+        """
+        Complete or roll back a compaction that crashed. The vectors file is
+        replaced first, so a lone ids.i64.compact means only the ids are left.
+        """
+        vectors_compact = self._compact_path(self.vectors_path)
+        ids_compact = self._compact_path(self.ids_path)
+        if not os.path.exists(ids_compact):
+            return
+        if os.path.exists(vectors_compact):
+            os.remove(vectors_compact)
+            os.remove(ids_compact)
+        else:
+            os.replace(ids_compact, self.ids_path)
+
+    def _sync_row_map(self, rows: int):
+        """
+        Bring the id -> row map up to date with rows appended by other
+        processes, reading only those rows; rebuilt after a compaction
+        """
+        inode = self._ids_inode()
+        if inode != self._map_inode or rows < self._map_rows:
+            self._row_of, self._map_rows, self._map_inode = {}, 0, inode
+        if rows == self._map_rows:
+            return
+        ids = np.fromfile(self.ids_path, dtype=np.int64, count=rows - self._map_rows, offset=self._map_rows * 8)
+        # Rows are in append order, so a later row for the same photo wins
+        for row, photo_id in enumerate(ids.tolist(), start=self._map_rows):
+            if photo_id >= 0:
+                self._row_of[photo_id] = row
+        self._map_rows = rows
+
+    def _tombstone(self, photo_ids: Iterable[int]):
+        # The map may still hold a row another process tombstoned; writing -1 there again is harmless,
+        # as rows are only reused by a compaction, which replaces the file and so the map
+        rows = [row for row in (self._row_of.pop(photo_id, None) for photo_id in photo_ids) if row is not None]
+        if not rows:
+            return
+        fd = os.open(self.ids_path, os.O_WRONLY)
+        try:
+            tombstone = np.int64(-1).tobytes()
+            for row in rows:
+                os.pwrite(fd, tombstone, row * 8)
+        finally:
+            os.close(fd)
+
+    def _normalize(self, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def add(self, photo_id: int, vector):
+        """
+        Store (or replace) the embedding for a photo
+        """
+        vector = self._normalize(vector).astype(np.float16)
+        with self._write_lock():
+            rows = self._file_rows()
+            self._sync_row_map(rows)
+            self._tombstone([photo_id])
+
+            # Write at explicit offsets so a half-written row from a crash is simply overwritten
+            for path, data, offset in (
+                (self.vectors_path, vector.tobytes(), rows * self.dim * 2),
+                (self.ids_path, np.int64(photo_id).tobytes(), rows * 8),
+            ):
+                fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    os.pwrite(fd, data, offset)
+                finally:
+                    os.close(fd)
+            self._row_of[photo_id] = rows
+            self._map_rows = rows + 1
+            self._map_inode = self._ids_inode()
+
+    def remove_many(self, photo_ids: Iterable[int]):
+        photo_ids = list(photo_ids)
+        if not photo_ids or self._file_rows() == 0:
+            return
+        with self._write_lock():
+            self._sync_row_map(self._file_rows())
+            self._tombstone(photo_ids)
+
+    def remove(self, photo_id: int):
+        self.remove_many([photo_id])
+
+    def compact(self) -> int:
+        """
+        Rewrite both files without tombstoned rows; returns how many rows were
+        dropped. Holds the write lock throughout, so appends wait, while
+        searches keep using the mapping they already have.
+        """
+        with self._write_lock():
+            rows = self._file_rows()
+            # Rebuilt from the file: the map misses ids other processes removed
+            self._map_inode = None
+            self._sync_row_map(rows)
+            keep = np.fromiter(sorted(self._row_of.values()), dtype=np.int64, count=len(self._row_of))
+            if len(keep) == rows:
+                return 0
+
+            vectors = np.memmap(self.vectors_path, dtype=np.float16, mode="r", shape=(rows, self.dim))
+            ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", shape=(rows,))
+            vectors_compact = self._compact_path(self.vectors_path)
+            ids_compact = self._compact_path(self.ids_path)
+            with open(vectors_compact, "wb") as vectors_file, open(ids_compact, "wb") as ids_file:
+                for start in range(0, len(keep), self.SEARCH_CHUNK_ROWS):
+                    chunk = keep[start:start + self.SEARCH_CHUNK_ROWS]
+                    vectors_file.write(np.ascontiguousarray(vectors[chunk]).tobytes())
+                    ids_file.write(np.ascontiguousarray(ids[chunk]).tobytes())
+                for f in (vectors_file, ids_file):
+                    f.flush()
+                    os.fsync(f.fileno())
+            del vectors, ids
+
+            # Vectors first: see _finish_compaction
+            os.replace(vectors_compact, self.vectors_path)
+            os.replace(ids_compact, self.ids_path)
+            self._row_of, self._map_rows, self._map_inode = {}, 0, None
+            return rows - len(keep)
+
+    def get(self, photo_id: int) -> Optional[np.ndarray]:
+        vectors, ids = self._mapped()
+        rows = np.flatnonzero(ids == photo_id)
+        if not len(rows):
+            return None
+        return np.asarray(vectors[rows[-1]], dtype=np.float32)
+
+    def get_many(self, photo_ids: Iterable[int]) -> Dict[int, np.ndarray]:
+        """
+        Embeddings for several photos with a single pass over the id column; missing ids are left out
+        """
+        vectors, ids = self._mapped()
+        rows = np.flatnonzero(np.isin(ids, np.fromiter(photo_ids, dtype=np.int64)))
+        # Rows are in append order, so a later row for the same photo wins
+        return {int(ids[row]): np.asarray(vectors[row], dtype=np.float32) for row in rows}
+
+    def __len__(self) -> int:
+        _, ids = self._mapped()
+        return int(np.count_nonzero(ids >= 0))
+
+    def iter_scores(self, query):
+        """
+        Yield (photo_ids, cosine scores) one chunk at a time; tombstoned rows are dropped
+        """
+        query = self._normalize(query)
+        vectors, ids = self._mapped()
+        for start in range(0, len(ids), self.SEARCH_CHUNK_ROWS):
+            chunk_ids = np.asarray(ids[start:start + self.SEARCH_CHUNK_ROWS])
+            scores = np.asarray(vectors[start:start + self.SEARCH_CHUNK_ROWS], dtype=np.float32) @ query
+            live = chunk_ids >= 0
+            yield chunk_ids[live], scores[live]
+
+    def search(self, query, k: int, exclude_ids: Iterable[int] = (), after: Optional[Tuple[float, int]] = None) -> List[Tuple[int, float]]:
+        """
+        Top-k (photo_id, score) pairs by cosine similarity, best first; ties are
+        broken by photo id so the order is total. `after` is the (score, photo_id)
+        of the last result already seen, for paging through the ranking.
+        """
+        exclude = np.fromiter(exclude_ids, dtype=np.int64)
+        best_ids = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0, dtype=np.float32)
+
+        for chunk_ids, scores in self.iter_scores(query):
+            keep = np.ones(len(chunk_ids), dtype=bool)
+            if len(exclude):
+                keep &= ~np.isin(chunk_ids, exclude)
+            if after is not None:
+                keep &= (scores < after[0]) | ((scores == after[0]) & (chunk_ids > after[1]))
+            if k and len(best_scores) == k:
+                # Nothing below the current k-th best can make it in
+                keep &= scores >= best_scores[-1]
+            if not keep.any():
+                continue
+
+            # Merge this chunk's candidates with the running top-k
+            best_ids = np.concatenate([best_ids, chunk_ids[keep]])
+            best_scores = np.concatenate([best_scores, scores[keep]])
+            order = np.lexsort((best_ids, -best_scores))[:k]
+            best_ids, best_scores = best_ids[order], best_scores[order]
+
+        return [(int(photo_id), float(score)) for photo_id, score in zip(best_ids, best_scores)]
+
+embedding_index = EmbeddingIndex(settings.EMBEDDING_INDEX_DIR, EMBEDDING_DIM)
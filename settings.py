@@ -1,12 +1,137 @@
 #setings.py
 from pydantic_settings import BaseSettings
 import os
+from typing import List
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploaded_photos")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Resized copies served by /photos/{id}/view?size=, safe to delete at any time
+RENDITION_DIR = os.getenv("RENDITION_DIR", "rendition_cache")
+os.makedirs(RENDITION_DIR, exist_ok=True)
 
 class Settings(BaseSettings):
     ENV: str = "development"
 
+    # Uploads are streamed to disk in chunks of this many bytes; anything larger
+    # than MAX_UPLOAD_BYTES or MAX_IMAGE_PIXELS is rejected before any inference
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    MAX_UPLOAD_BYTES: int = 50 * 1024 * 1024
+    MAX_IMAGE_PIXELS: int = 100_000_000
+
+    # Perceptual-hash distance (in bits, out of 64) at which two photos count as near-duplicates;
+    # with NEAR_DUPLICATE_REJECT uploads close to one of the photographer's photos get a 409
+    NEAR_DUPLICATE_MAX_DISTANCE: int = 6
+    NEAR_DUPLICATE_REJECT: bool = False
+    # Each process's index re-reads hashes written this many seconds before the newest it has seen,
+    # covering transactions that commit out of order and clock skew between workers
+    NEAR_DUPLICATE_SYNC_LOOKBACK: float = 60.0
+
+    # Where originals are kept: "local" (UPLOAD_DIR) or "s3" (any S3-compatible store;
+    # run migrate_storage.py first, photos from before content addressing stay local)
+    STORAGE_BACKEND: str = "local"
+    # How view_photo ships the bytes once access is checked: "stream" them through
+    # Python, hand local files to nginx ("x-accel-redirect") or Apache/lighttpd
+    # ("x-sendfile"), or "redirect" to a presigned URL with the s3 backend
+    STORAGE_SERVE: str = "stream"
+    # nginx `internal` locations aliased to UPLOAD_DIR and RENDITION_DIR
+    ACCEL_REDIRECT_UPLOAD_PREFIX: str = "/_protected/uploads"
+    ACCEL_REDIRECT_RENDITION_PREFIX: str = "/_protected/renditions"
+    S3_BUCKET: str = ""
+    S3_PREFIX: str = ""
+    S3_ENDPOINT_URL: str = ""  # e.g. a MinIO server; empty for AWS
+    S3_REGION: str = ""
+    S3_PRESIGN_EXPIRES: int = 300
+
+    # Signed photo URLs handed out in feed and list responses stay valid for one to
+    # two of these windows (seconds); they are not revoked by unsharing or unfollowing
+    SIGNED_URL_TTL: int = 300
+
+    # Per-process cache of view_photo access decisions; routes that change
+    # visibility invalidate it locally, other workers within ACCESS_CACHE_TTL seconds
+    ACCESS_CACHE_TTL: float = 30.0
+    ACCESS_CACHE_SIZE: int = 100_000
+
+    # Deleted photos' files are removed by a background reaper after the delete
+    # commits, REAPER_BATCH_SIZE journal entries per transaction; it also looks
+    # for entries left by other workers every REAPER_INTERVAL seconds
+    REAPER_BATCH_SIZE: int = 500
+    REAPER_INTERVAL: float = 30.0
+    # Every ORPHAN_SWEEP_INTERVAL seconds (0 turns it off) stored files no photo
+    # uses are journaled too; younger than ORPHAN_MIN_AGE they may be uploads in flight
+    ORPHAN_SWEEP_INTERVAL: float = 6 * 3600
+    ORPHAN_MIN_AGE: float = 3600
+
+    # Expired shares are deleted every SHARE_SWEEP_INTERVAL seconds (0 turns it off),
+    # SHARE_SWEEP_BATCH_SIZE rows per transaction; until then access checks ignore them
+    SHARE_SWEEP_INTERVAL: float = 300.0
+    SHARE_SWEEP_BATCH_SIZE: int = 1000
+    # Photo ids, and separately user ids, accepted by one bulk share request
+    SHARE_BULK_MAX_IDS: int = 1000
+
+    # Browsers may reuse a viewed photo for this long without revalidating; private
+    # because access depends on the viewer and shares expire
+    PHOTO_CACHE_MAX_AGE: int = 3600
+
+    # Longest-side pixel sizes offered as renditions, pre-generated after enrichment
+    RENDITION_SIZES: List[int] = [256, 1024]
+    RENDITION_PREGENERATE: bool = True
+    RENDITION_JPEG_QUALITY: int = 85
+    RENDITION_WEBP_QUALITY: int = 80
+
+    # Memory-mapped CLIP image embeddings backing /photos/{id}/similar
+    EMBEDDING_INDEX_DIR: str = "embedding_index"
+    # Similar-photo search pulls limit * this many candidates before visibility filtering
+    SIMILAR_OVERFETCH: int = 5
+    # Encoded /photos/search queries kept in memory per worker
+    SEARCH_QUERY_CACHE_SIZE: int = 1024
+
+    # Load AI models in the background at startup (otherwise on first use),
+    # optionally followed by a warmup inference
+    AI_PRELOAD: bool = True
+    AI_WARMUP: bool = False
+
+    # Inference backend: torch, torch-int8, onnx (requirements-onnx.txt), stub or remote; 0 threads keeps the library default
+    AI_BACKEND: str = "torch"
+    AI_NUM_THREADS: int = 0
+    AI_NUM_INTEROP_THREADS: int = 0
+
+    # How model output is validated: local (in-process rules) or guardrails (the .rail guards)
+    AI_VALIDATOR: str = "local"
+    # Drop descriptions flagged by alt-profanity-check (local validator only)
+    AI_PROFANITY_CHECK: bool = True
+
+    # Shared inference server used by AI_BACKEND=remote. AI_SERVER_SOCKET (a Unix
+    # socket path) takes precedence over AI_SERVER_URL; AI_SERVER_BACKEND is the
+    # backend the server itself runs and only feeds into MODEL_VERSION here
+    AI_SERVER_URL: str = "http://127.0.0.1:8001"
+    AI_SERVER_SOCKET: str = ""
+    AI_SERVER_BACKEND: str = "torch"
+    AI_SERVER_TIMEOUT: float = 60.0
+
+    # AI enrichment worker pool (inference runs outside the upload request)
+    ENRICHMENT_WORKERS: int = 2
+    ENRICHMENT_QUEUE_SIZE: int = 100
+    # Photos that didn't fit the queue are found by polling every ENRICHMENT_POLL_INTERVAL
+    # seconds; one left PROCESSING for ENRICHMENT_CLAIM_TIMEOUT seconds is assumed
+    # abandoned by a dead worker and retried, so keep it above the slowest inference
+    ENRICHMENT_POLL_INTERVAL: float = 10.0
+    ENRICHMENT_CLAIM_TIMEOUT: float = 600.0
+    # Batch uploads are enriched this many photos per model pass
+    ENRICHMENT_BATCH_SIZE: int = 16
+    BATCH_UPLOAD_MAX_FILES: int = 500
+
+    # CLIP micro-batching: flush after this many images or this many milliseconds, or
+    # once all CLIP_BATCH_PRODUCERS possible callers are waiting (0 means
+    # ENRICHMENT_WORKERS, the only callers in the web app). Single uploads therefore batch
+    # at most ENRICHMENT_WORKERS images, so raise both together; batch uploads fill
+    # CLIP_BATCH_SIZE on their own. inference_server.py should set CLIP_BATCH_PRODUCERS
+    # to the number of requests it serves at once.
+    CLIP_BATCH_SIZE: int = 8
+    CLIP_BATCH_WAIT_MS: int = 20
+    CLIP_BATCH_PRODUCERS: int = 0
+
+    # On-disk cache for derived model artifacts (e.g. CLIP category embeddings)
+    MODEL_CACHE_DIR: str = ".model_cache"
+
     @property
     def DATABASE_URL(self):
         if self.ENV == "testing":
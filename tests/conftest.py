@@ -1,3 +1,10 @@
+import os
+
+# Set before the app is imported: auth reads these at import time
+os.environ.setdefault("ENV", "testing")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ALGORITHM", "HS256")
+
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -48,4 +55,13 @@ def client(db):
     app.dependency_overrides[get_db] = override_get_db
     with TestClient(app) as test_client:
         yield test_client
-    app.dependency_overrides.clear()
\ No newline at end of file
+    app.dependency_overrides.clear()
+
+# SQLite hands out the same ids again after each test's rollback, so cached
+# access decisions must not carry over
+@pytest.fixture(autouse=True)
+def clear_access_cache():
+    from services.access import access_cache
+    access_cache.clear()
+    yield
+    access_cache.clear()
@@ -0,0 +1,176 @@
+import sys
+import numpy as np
+import pytest
+from unittest.mock import patch
+from PIL import Image
+from services.ai_backends import get_backend
+from settings import settings
+
+
+def test_app_import_does_not_load_models():
+    """Test importing the app leaves torch and the models unloaded"""
+    import services.ai_utils as ai_utils
+    assert ai_utils.model_state()["status"] == "not_loaded"
+    assert "torch" not in sys.modules
+
+
+def test_ready_reports_not_loaded(client):
+    """Test readiness is 503 until the models are loaded"""
+    response = client.get("/ai/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "not_loaded"
+
+
+@patch.dict("services.ai_utils._state", {"status": "ready", "load_seconds": 1.5})
+def test_ready_reports_loaded(client):
+    response = client.get("/ai/ready")
+    assert response.status_code == 200
+    assert response.json()["load_seconds"] == 1.5
+
+
+def test_ai_metrics(client):
+    response = client.get("/ai/metrics")
+    assert response.status_code == 200
+    assert response.json()["clip_batching"]["max_batch_size"] >= 1
+
+
+def make_backend(name, clip_model_name="clip", blip_model_name="blip"):
+    return get_backend(
+        name,
+        categories=["portrait", "landscape", "food"],
+        clip_model_name=clip_model_name,
+        blip_model_name=blip_model_name,
+        categories_key="test"
+    )
+
+
+@pytest.fixture(scope="module")
+def tiny_models(tmp_path_factory):
+    """
+    Randomly initialised CLIP and BLIP a few layers wide, saved like hub
+    checkpoints so the torch backends load them through from_pretrained
+    """
+    pytest.importorskip("transformers")
+    import torch
+    from transformers import (
+        BertTokenizer, BlipConfig, BlipForConditionalGeneration, BlipImageProcessor, BlipProcessor,
+        CLIPConfig, CLIPImageProcessor, CLIPModel, CLIPProcessor, CLIPTokenizer
+    )
+
+    torch.manual_seed(0)
+    root = tmp_path_factory.mktemp("models")
+    layers = dict(hidden_size=32, intermediate_size=37, num_hidden_layers=1, num_attention_heads=2)
+    vision = dict(layers, image_size=32, patch_size=16)
+
+    clip_path = str(root / "clip")
+    CLIPModel(CLIPConfig(
+        text_config=dict(layers, vocab_size=64, bos_token_id=0, eos_token_id=1, pad_token_id=2),
+        vision_config=vision,
+        projection_dim=512
+    )).save_pretrained(clip_path)
+    CLIPProcessor(
+        image_processor=CLIPImageProcessor(size={"shortest_edge": 32}, crop_size={"height": 32, "width": 32}),
+        tokenizer=CLIPTokenizer()
+    ).save_pretrained(clip_path)
+
+    blip_path = str(root / "blip")
+    tokens = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "[DEC]", "a", "photo"]
+    BlipForConditionalGeneration(BlipConfig(
+        text_config=dict(layers, vocab_size=64, bos_token_id=5, sep_token_id=3, eos_token_id=3, pad_token_id=0),
+        vision_config=vision
+    )).save_pretrained(blip_path)
+    BlipProcessor(
+        image_processor=BlipImageProcessor(size={"height": 32, "width": 32}),
+        tokenizer=BertTokenizer(vocab={token: i for i, token in enumerate(tokens)})
+    ).save_pretrained(blip_path)
+    return clip_path, blip_path
+
+
+def load_tiny_backend(name, tiny_models, cache_dir):
+    backend = make_backend(name, *tiny_models)
+    with patch.object(settings, "MODEL_CACHE_DIR", str(cache_dir)):
+        backend.load()
+    return backend
+
+
+@pytest.mark.parametrize("name", ["torch", "torch-int8"])
+def test_torch_backends_run_tiny_models(name, tiny_models, tmp_path):
+    """Test the torch backends classify, embed, caption and encode queries, caching the category prompts"""
+    backend = load_tiny_backend(name, tiny_models, tmp_path)
+    images = [Image.new("RGB", (64, 48), color="red"), Image.new("RGB", (40, 40), color="blue")]
+
+    categories, embeddings = backend.classify_embed_batch(images)
+    assert len(categories) == 2 and all(category in backend.categories for category in categories)
+    assert embeddings.shape == (2, 512)
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1, atol=1e-4)
+    assert backend.text_features.shape == (3, 512)
+    assert backend.encode_text(["red car"]).shape == (1, 512)
+
+    captions = backend.describe_batch(images)
+    assert len(captions) == 2 and all(isinstance(caption, str) for caption in captions)
+    assert isinstance(backend.describe(images[0]), str)
+
+    # A second load reads the category embeddings from MODEL_CACHE_DIR
+    assert len(list(tmp_path.glob("clip_text_*.pt"))) == 1
+    assert np.allclose(load_tiny_backend(name, tiny_models, tmp_path).text_features, backend.text_features)
+
+
+def test_onnx_backend_matches_torch(tiny_models, tmp_path):
+    """Test the exported ONNX image tower and the text tower on its own give what torch does, and later loads skip the full CLIP"""
+    pytest.importorskip("onnxruntime")
+    images = [Image.new("RGB", (64, 48), color="red"), Image.new("RGB", (40, 40), color="blue")]
+    torch_backend = load_tiny_backend("torch", tiny_models, tmp_path / "torch")
+
+    backend = load_tiny_backend("onnx", tiny_models, tmp_path / "onnx")
+    assert len(list((tmp_path / "onnx").glob("clip_vision_*.onnx"))) == 1
+    assert np.allclose(backend.embed_batch(images), torch_backend.embed_batch(images), atol=1e-4)
+    assert np.allclose(backend.text_features, torch_backend.text_features, atol=1e-4)
+    assert np.allclose(backend.encode_text(["red car"]), torch_backend.encode_text(["red car"]), atol=1e-4)
+    assert len(backend.classify_batch(images)) == 2
+    assert isinstance(backend.describe(images[0]), str)
+
+    with patch("transformers.CLIPModel.from_pretrained", side_effect=AssertionError("full CLIP loaded")):
+        reloaded = load_tiny_backend("onnx", tiny_models, tmp_path / "onnx")
+    assert np.allclose(reloaded.embed_batch(images), torch_backend.embed_batch(images), atol=1e-4)
+
+
+def test_stub_backend_is_deterministic():
+    """Test the stub backend gives stable results without loading any model"""
+    backend = make_backend("stub")
+    backend.load()
+    red = Image.new("RGB", (64, 48), color="red")
+    blue = Image.new("RGB", (64, 48), color="blue")
+
+    first = backend.classify_batch([red, blue])
+    assert first == backend.classify_batch([red, blue])
+    assert all(category in backend.categories for category in first)
+    assert backend.describe(red) == "a 64x48 photo"
+
+
+def test_encode_text_caches_queries():
+    """Test search queries are normalised and only encoded once"""
+    import services.ai_utils as ai_utils
+    backend = make_backend("stub")
+    backend.load()
+    ai_utils._encode_query.cache_clear()
+    with patch("services.ai_utils.backend", backend), \
+         patch.dict("services.ai_utils._state", {"status": "ready"}), \
+         patch.object(backend, "encode_text", wraps=backend.encode_text) as encode:
+        first = ai_utils.encode_text("Red  Car")
+        second = ai_utils.encode_text("red car")
+
+    assert encode.call_count == 1
+    assert first is second
+    assert first.shape == (512,)
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        make_backend("tpu")
+
+
+@patch("services.ai_utils.backend", make_backend("stub"))
+@patch("services.ai_utils._state", {"status": "ready", "error": None, "load_seconds": 0, "warmed_up": False})
+def test_ready_reports_backend(client):
+    response = client.get("/ai/ready")
+    assert response.json()["backend"] == "stub"
@@ -0,0 +1,42 @@
+import xml.etree.ElementTree as ET
+import json
+import pytest
+from services.ai_utils import CATEGORIES
+from services.ai_validation import LocalValidator, MAX_DESCRIPTION_LENGTH, get_validator
+
+
+def rail_field(path):
+    return ET.parse(path).getroot().find("output/string")
+
+
+def test_local_rules_match_rail_files():
+    """Test the in-process rules stay in sync with the Guardrails definitions"""
+    classification = rail_field("guardrails_ai/classification.rail")
+    description = rail_field("guardrails_ai/description.rail")
+    assert json.loads(classification.get("valid-choices")) == CATEGORIES
+    assert int(description.get("max-length")) == MAX_DESCRIPTION_LENGTH
+
+
+def test_category_must_be_known():
+    validator = LocalValidator(CATEGORIES, check_profanity=False)
+    assert validator.category("food") == {"category": "food"}
+    with pytest.raises(ValueError):
+        validator.category("abstract")
+
+
+def test_long_description_is_cut_at_a_word():
+    validator = LocalValidator(CATEGORIES, max_description_length=20, check_profanity=False)
+    result = validator.description("a dog  running on the beach at sunset")
+    assert result == {"description": "a dog running on the"}
+
+
+def test_profane_description_is_dropped():
+    validator = LocalValidator(CATEGORIES)
+    validator._predict_profanity = lambda texts: [int("darn" in text) for text in texts]
+    assert validator.description("a darn cat") == {"description": ""}
+    assert validator.description("a cat") == {"description": "a cat"}
+
+
+def test_unknown_validator_is_rejected():
+    with pytest.raises(ValueError):
+        get_validator("regex", CATEGORIES)
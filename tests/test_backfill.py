@@ -0,0 +1,98 @@
+import json
+import numpy as np
+from unittest.mock import patch
+from PIL import Image
+from models import AIResult, Photo, User
+from services.ai_utils import MODEL_VERSION
+from services.backfill import Backfill, only_categories_changed
+from services.vector_index import EmbeddingIndex
+
+
+def fake_classify(images):
+    return [{"category": "food", "embedding": np.ones(512, dtype=np.float32)} for _ in images]
+
+
+def fake_describe(images):
+    return [{"description": f"photo {i}"} for i, _ in enumerate(images)]
+
+
+def make_photos(db, tmp_path, versions):
+    owner = User(username="backfiller", password="x", role="Photographer")
+    db.add(owner)
+    db.flush()
+    image_path = str(tmp_path / "photo.jpg")
+    Image.new("RGB", (64, 64), color="red").save(image_path)
+
+    photos = [
+        Photo(owner_id=owner.user_id, file_path=image_path, tags="old", description="old", model_version=version)
+        for version in versions
+    ]
+    db.add_all(photos)
+    db.commit()
+    return photos
+
+
+@patch("services.backfill.describe_images", side_effect=fake_describe)
+@patch("services.backfill.classify_images", side_effect=fake_classify)
+def test_backfill_updates_stale_rows_and_resumes(mock_classify, mock_describe, db, tmp_path):
+    """Test only stale rows are re-enriched, failures stay unstamped and a rerun resumes from the checkpoint, retrying failures"""
+    stale, current, broken = make_photos(db, tmp_path, [None, MODEL_VERSION, "old+version+a+torch"])
+    broken.file_path = str(tmp_path / "missing.jpg")
+    db.commit()
+    ids = [photo.photo_id for photo in (stale, current, broken)]
+
+    checkpoint = tmp_path / "checkpoint.json"
+    index = EmbeddingIndex(str(tmp_path / "index"), dim=512)
+    with patch("services.backfill.embedding_index", index):
+        stats = Backfill(session_factory=lambda: db, batch_size=1, workers=2, checkpoint_path=str(checkpoint)).run()
+
+    assert (stats["processed"], stats["failed"]) == (1, 1)
+    stale, current, broken = (db.get(Photo, photo_id) for photo_id in ids)
+    assert (stale.tags, stale.description, stale.model_version) == ("food", "photo 0", MODEL_VERSION)
+    assert current.tags == "old"
+    assert broken.model_version == "old+version+a+torch" and "Could not read image" in broken.enrichment_error
+    assert index.get(stale.photo_id) is not None
+    # Held before the failed row, which is the last one
+    assert json.loads(checkpoint.read_text())["last_photo_id"] == broken.photo_id - 1
+
+    # Resuming retries the failed row and nothing already done
+    broken.file_path = stale.file_path
+    db.commit()
+    mock_classify.reset_mock()
+    with patch("services.backfill.embedding_index", index):
+        stats = Backfill(session_factory=lambda: db, checkpoint_path=str(checkpoint)).run()
+    assert mock_classify.call_count == 1
+    assert db.get(Photo, ids[2]).model_version == MODEL_VERSION
+    assert json.loads(checkpoint.read_text())["last_photo_id"] == ids[2]
+
+
+def test_backfill_recategorizes_from_stored_embeddings(db, tmp_path):
+    """Test a category-only change re-derives tags without decoding any image and caches them for the content"""
+    clip, blip, _, backend = MODEL_VERSION.split("+")
+    (photo,) = make_photos(db, tmp_path, [f"{clip}+{blip}+oldcategories+{backend}"])
+    photo.content_hash = "a" * 64
+    db.commit()
+    index = EmbeddingIndex(str(tmp_path / "index"), dim=512)
+    photo_id = photo.photo_id
+    index.add(photo_id, np.ones(512, dtype=np.float32))
+
+    with patch("services.backfill.embedding_index", index), \
+         patch("services.backfill.ai_utils.load_models"), \
+         patch("services.backfill.ai_utils.backend.text_features", np.ones((1, 512))), \
+         patch("services.backfill.categorize_embeddings", return_value=[{"category": "travel"}]), \
+         patch("services.backfill.classify_images") as mock_classify:
+        stats = Backfill(session_factory=lambda: db).run()
+
+    mock_classify.assert_not_called()
+    assert stats["recategorized"] == 1
+    photo = db.get(Photo, photo_id)
+    assert (photo.tags, photo.description, photo.model_version) == ("travel", "old", MODEL_VERSION)
+    cached = db.get(AIResult, "a" * 64)
+    assert (cached.tags, cached.description, cached.model_version) == ("travel", "old", MODEL_VERSION)
+
+
+def test_only_categories_changed():
+    clip, blip, categories, backend = MODEL_VERSION.split("+")
+    assert only_categories_changed(f"{clip}+{blip}+other+{backend}")
+    assert not only_categories_changed(f"{clip}+new-blip+other+{backend}")
+    assert not only_categories_changed(None)
@@ -0,0 +1,73 @@
+import threading
+import time
+import pytest
+from services.batching import MicroBatcher
+
+
+def test_concurrent_requests_share_a_batch():
+    """Test concurrent submits are grouped and each caller gets its own result"""
+    seen_batches = []
+
+    def process(items):
+        seen_batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=200)
+    results = {}
+
+    def call(n):
+        results[n] = batcher.submit(n)
+
+    threads = [threading.Thread(target=call, args=(n,)) for n in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {0: 0, 1: 2, 2: 4, 3: 6}
+    assert len(seen_batches) == 1
+    metrics = batcher.metrics()
+    assert metrics["batches"] == 1
+    assert metrics["items"] == 4
+    assert metrics["batch_size_histogram"] == {"4": 1}
+
+
+def test_single_request_flushes_after_wait_window():
+    """Test a lone request is not held back once the wait window expires"""
+    batcher = MicroBatcher(lambda items: [item.upper() for item in items], max_batch_size=8, max_wait_ms=10)
+    assert batcher.submit("a") == "A"
+    assert batcher.metrics()["avg_batch_size"] == 1.0
+
+
+def test_batch_failure_is_raised_to_every_caller():
+    """Test an exception in the batch function reaches the waiting caller"""
+    def process(items):
+        raise ValueError("bad batch")
+
+    batcher = MicroBatcher(process, max_batch_size=2, max_wait_ms=5)
+    with pytest.raises(ValueError):
+        batcher.submit(1)
+    assert batcher.metrics()["failed_batches"] == 1
+
+
+def test_batch_flushes_once_every_producer_is_waiting():
+    """Test a batch goes out as soon as all possible callers have submitted, without waiting for it to fill"""
+    batcher = MicroBatcher(lambda items: items, max_batch_size=8, max_wait_ms=5000, max_producers=2)
+    started = time.monotonic()
+    threads = [threading.Thread(target=batcher.submit, args=(n,)) for n in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert time.monotonic() - started < 1
+    assert batcher.metrics()["batch_size_histogram"] == {"2": 1}
+
+
+def test_configure_raises_limits_at_runtime():
+    """Test a larger max_batch_size set later lets a whole submit_many through as one batch"""
+    sizes = []
+    batcher = MicroBatcher(lambda items: sizes.append(len(items)) or items, max_batch_size=2, max_wait_ms=50)
+    batcher.configure(max_batch_size=8, max_producers=1)
+    assert batcher.submit_many(list(range(8))) == list(range(8))
+    assert sizes == [8]
@@ -0,0 +1,64 @@
+import io
+import random
+from datetime import datetime
+from PIL import Image
+from services.exif import extract_metadata
+from services.geohash import encode, covering_ranges
+
+
+def jpeg_with_exif(**fields):
+    exif = Image.Exif()
+    exif[0x010F] = fields.get("make", "Canon")
+    exif[0x0110] = fields.get("model", "EOS R5")
+    exif.get_ifd(0x8769)[0x9003] = fields.get("taken", "2024:05:01 10:20:30")
+    exif.get_ifd(0x8769)[0xA434] = "RF24-70mm F2.8 L IS USM"
+    if "gps" in fields:
+        (lat_ref, lat), (lon_ref, lon) = fields["gps"]
+        gps = exif.get_ifd(0x8825)
+        gps[1], gps[2], gps[3], gps[4] = lat_ref, lat, lon_ref, lon
+
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32), color="green").save(buf, format="JPEG", exif=exif.tobytes())
+    buf.seek(0)
+    return buf
+
+
+def test_extract_metadata():
+    """Test capture time, camera, lens and GPS are read from the header"""
+    buf = jpeg_with_exif(gps=(("N", (51.0, 30.0, 0.0)), ("W", (0.0, 7.0, 30.0))))
+    with Image.open(buf) as image:
+        metadata = extract_metadata(image)
+
+    assert metadata["captured_at"] == datetime(2024, 5, 1, 10, 20, 30)
+    assert (metadata["camera_make"], metadata["camera_model"]) == ("Canon", "EOS R5")
+    assert metadata["lens"] == "RF24-70mm F2.8 L IS USM"
+    assert abs(metadata["latitude"] - 51.5) < 1e-6
+    assert abs(metadata["longitude"] + 0.125) < 1e-6
+    assert metadata["geohash"] == encode(51.5, -0.125)
+
+
+def test_extract_metadata_skips_missing_and_malformed():
+    with Image.open(jpeg_with_exif(taken="not a date")) as image:
+        metadata = extract_metadata(image)
+    assert "captured_at" not in metadata and "geohash" not in metadata
+
+    buf = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buf, format="PNG")
+    assert extract_metadata(Image.open(buf)) == {}
+
+
+def test_geohash_encode_reference():
+    assert encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+def test_covering_ranges_contain_every_point_in_the_box():
+    """Test the geohash ranges for a box include every point inside it"""
+    rng = random.Random(0)
+    for _ in range(50):
+        min_lat, min_lon = rng.uniform(-80, 70), rng.uniform(-170, 160)
+        max_lat, max_lon = min_lat + rng.uniform(0, 10), min_lon + rng.uniform(0, 10)
+        ranges = covering_ranges(min_lat, min_lon, max_lat, max_lon)
+        assert len(ranges) <= 32
+        for _ in range(20):
+            point = encode(rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon))
+            assert any(start <= point and (end is None or point < end) for start, end in ranges)
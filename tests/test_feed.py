@@ -1,5 +1,6 @@
 import pytest
 from models import User, Photo, Follower, Like
+from services.storage import shard_path
 from utils import hash_password
 from auth import create_access_token
 from sqlalchemy.orm import Session
@@ -30,14 +31,14 @@ def followed_photos(db: Session, feed_users):
     # Add photos
     photo1 = Photo(
         owner_id=feed_users["photographer"].user_id,
-        file_path="fake1.jpg",
+        file_path=shard_path("1" * 64, ".jpg"),
         tags="ai-tag-1",  # Normally classified
         description="ai-description-1",  # Normally described
         average_rating=4.5
     )
     photo2 = Photo(
         owner_id=feed_users["photographer"].user_id,
-        file_path="fake2.jpg",
+        file_path=shard_path("2" * 64, ".jpg"),
         tags="ai-tag-2",
         description="ai-description-2",
         average_rating=3.8
@@ -54,8 +55,8 @@ def followed_photos(db: Session, feed_users):
 
     return [photo1, photo2]
 
-@patch("routes.photo.classify_image", return_value="mocked-nature")
-@patch("routes.photo.describe_image", return_value="mocked-description")
+@patch("services.enrichment.classify_image", return_value="mocked-nature")
+@patch("services.enrichment.describe_image", return_value="mocked-description")
 def test_get_feed_photos(mock_describe, mock_classify, client, feed_auth_headers, followed_photos):
     """Test that user receives feed photos from followed photographers"""
     response = client.get("/feed/", headers=feed_auth_headers)
@@ -68,8 +69,8 @@ def test_get_feed_photos(mock_describe, mock_classify, client, feed_auth_headers
     photo_ids = [p["photo_id"] for p in data["feed_photos"]]
     assert all(photo.photo_id in photo_ids for photo in followed_photos)
 
-@patch("routes.photo.classify_image", return_value="mocked-nature")
-@patch("routes.photo.describe_image", return_value="mocked-description")
+@patch("services.enrichment.classify_image", return_value="mocked-nature")
+@patch("services.enrichment.describe_image", return_value="mocked-description")
 def test_get_photo_of_day(mock_describe, mock_classify, client, feed_auth_headers, followed_photos):
     """Test that the photo with most likes is returned as photo_of_day"""
     response = client.get("/feed/", headers=feed_auth_headers)
@@ -81,3 +82,18 @@ def test_get_photo_of_day(mock_describe, mock_classify, client, feed_auth_header
     # Should be the photo with a like
     most_liked_photo = followed_photos[1]
     assert data["photo_of_day"]["photo_id"] == most_liked_photo.photo_id
+
+def test_feed_photos_carry_signed_urls(client, feed_auth_headers, followed_photos):
+    """Test feed entries come with signed links to the photo and its thumbnail"""
+    data = client.get("/feed/", headers=feed_auth_headers).json()
+    for photo in data["feed_photos"] + [data["photo_of_day"]]:
+        assert photo["url"].startswith(f"/photos/signed/{photo['photo_id']}/")
+        assert "signature=" in photo["thumbnail_url"] and "size=" in photo["thumbnail_url"]
+
+def test_feed_photos_from_before_content_addressing_get_no_signed_urls(client, db, feed_auth_headers, followed_photos):
+    """Test unmigrated files get no signed links, which the signed route would refuse"""
+    for photo in followed_photos:
+        photo.file_path = f"fake{photo.photo_id}.jpg"
+    db.commit()
+    response = client.get("/feed/", headers=feed_auth_headers)
+    assert all(photo["url"] is None for photo in response.json()["feed_photos"])
@@ -0,0 +1,30 @@
+import io
+from PIL import Image
+from services.image_ingest import load_image, MODEL_INPUT_SIZE
+
+
+def make_jpeg(size, mode="RGB"):
+    buf = io.BytesIO()
+    Image.new(mode, size, color="red" if mode == "RGB" else 128).save(buf, format="JPEG")
+    buf.seek(0)
+    return buf
+
+
+def test_large_jpeg_is_downsampled_to_model_size():
+    """Test a camera-sized JPEG comes back with its short side at the model input size"""
+    image = load_image(make_jpeg((4000, 3000)))
+    assert image.mode == "RGB"
+    assert min(image.size) == MODEL_INPUT_SIZE
+    assert image.size == (512, 384)
+
+
+def test_small_image_is_not_upscaled():
+    image = load_image(make_jpeg((100, 80)))
+    assert image.size == (100, 80)
+
+
+def test_grayscale_png_is_converted_to_rgb():
+    buf = io.BytesIO()
+    Image.new("L", (50, 50), color=10).save(buf, format="PNG")
+    buf.seek(0)
+    assert load_image(buf).mode == "RGB"
@@ -0,0 +1,55 @@
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from PIL import Image
+from services.ai_backends import get_backend
+
+BACKEND_KWARGS = dict(
+    categories=["portrait", "landscape", "food"],
+    clip_model_name="clip",
+    blip_model_name="blip",
+    categories_key="test"
+)
+
+
+@pytest.fixture
+def server():
+    """Inference server running the stub backend in-process"""
+    import inference_server
+    stub = get_backend("stub", **BACKEND_KWARGS)
+    with patch("services.ai_utils.backend", stub), \
+         patch.dict("services.ai_utils._state", {"status": "not_loaded"}):
+        with TestClient(inference_server.app) as test_client:
+            # Wait for the background load kicked off by the lifespan
+            for _ in range(100):
+                if test_client.get("/ready").status_code == 200:
+                    break
+            yield test_client, stub
+
+
+def test_remote_backend_matches_server_backend(server):
+    """Test the remote client returns what the server's backend computes"""
+    test_client, stub = server
+    remote = get_backend("remote", client=test_client, **BACKEND_KWARGS)
+    remote.load()
+
+    images = [Image.new("RGB", (40, 30), color=color) for color in ("red", "green", "blue")]
+    assert remote.classify_batch(images) == stub.classify_batch(images)
+    assert remote.describe(images[0]) == "a 40x30 photo"
+    assert (remote.encode_text(["a red car"]) == stub.encode_text(["a red car"])).all()
+
+
+def test_remote_backend_fails_when_server_not_ready():
+    import inference_server
+    with patch.dict("services.ai_utils._state", {"status": "loading"}), \
+         patch("services.ai_utils.start_background_load"), \
+         TestClient(inference_server.app) as test_client:
+        remote = get_backend("remote", client=test_client, **BACKEND_KWARGS)
+        with pytest.raises(RuntimeError):
+            remote.load()
+
+
+def test_server_rejects_undecodable_image(server):
+    test_client, _ = server
+    response = test_client.post("/describe", files={"image": ("bad.png", b"not an image", "image/png")})
+    assert response.status_code == 400
@@ -0,0 +1,88 @@
+import io
+import random
+from datetime import datetime, timedelta
+import numpy as np
+from PIL import Image
+from models import Photo, User
+from services.near_duplicates import HammingIndex, NearDuplicateIndex, dhash
+
+
+def textured_image(seed, size=(400, 300)):
+    rng = np.random.default_rng(seed)
+    # Smooth random blobs, so resizing keeps the structure dHash looks at
+    small = rng.integers(0, 256, (6, 8, 3), dtype=np.uint8)
+    return Image.fromarray(small).resize(size, Image.Resampling.BICUBIC)
+
+
+def distance(a, b):
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+
+def test_dhash_survives_resize_and_reencode():
+    """Test resized and re-encoded copies stay close while different images don't"""
+    original = textured_image(1)
+    buf = io.BytesIO()
+    original.resize((200, 150)).save(buf, format="JPEG", quality=60)
+    buf.seek(0)
+
+    assert distance(dhash(original), dhash(buf)) <= 6
+    assert distance(dhash(original), dhash(textured_image(2))) > 10
+
+
+def test_hamming_index_matches_brute_force():
+    """Test multi-index lookups find exactly what a linear scan finds"""
+    rng = random.Random(0)
+    hashes = {item_id: rng.getrandbits(64) for item_id in range(2000)}
+    index = HammingIndex()
+    for item_id, value in hashes.items():
+        index.add(item_id, value)
+
+    # Plant some near neighbours of a query
+    query = rng.getrandbits(64)
+    for item_id, flips in enumerate((0, 1, 3, 5, 7, 9), start=5000):
+        value = query
+        for bit in rng.sample(range(64), flips):
+            value ^= 1 << bit
+        hashes[item_id] = value
+        index.add(item_id, value)
+
+    for max_distance in (0, 3, 6, 9):
+        expected = sorted(
+            ((item_id, (value ^ query).bit_count()) for item_id, value in hashes.items()
+             if (value ^ query).bit_count() <= max_distance),
+            key=lambda match: (match[1], match[0])
+        )
+        assert index.query(query, max_distance) == expected
+
+
+def test_hamming_index_remove():
+    index = HammingIndex()
+    index.add(1, 0xFF)
+    index.add(1, 0xF0)  # Replaces the first hash
+    assert len(index) == 1
+    assert index.query(0xF0, 0) == [(1, 0)]
+    index.remove(1)
+    assert index.query(0xF0, 8) == []
+
+
+def test_sync_picks_up_late_commits_and_filled_in_hashes(db):
+    """Test rows committed out of id order and hashes written onto existing rows reach another process's index"""
+    owner = User(username="hasher", password="x", role="Photographer")
+    db.add(owner)
+    db.flush()
+    index = NearDuplicateIndex()
+    now = datetime.utcnow()
+
+    db.add(Photo(photo_id=20, owner_id=owner.user_id, file_path="b.jpg", perceptual_hash="00000000000000ff"))
+    unhashed = Photo(photo_id=30, owner_id=owner.user_id, file_path="c.jpg")
+    db.add(unhashed)
+    db.commit()
+    assert index.find(db, owner.user_id, "00000000000000ff", 0) == [(20, 0)]
+
+    # A lower id stamped earlier but committed after the last sync
+    db.add(Photo(photo_id=10, owner_id=owner.user_id, file_path="a.jpg", perceptual_hash="00000000000000ff", perceptual_hash_at=now - timedelta(seconds=5)))
+    # Enrichment filling in the hash of an older photo
+    unhashed.perceptual_hash = "00000000000000fe"
+    unhashed.perceptual_hash_at = datetime.utcnow()
+    db.commit()
+    assert index.find(db, owner.user_id, "00000000000000ff", 1) == [(10, 0), (20, 0), (30, 1)]
@@ -1,6 +1,7 @@
 import pytest
 import os
 import io
+import hashlib
 from PIL import Image
 import numpy as np
 from unittest.mock import patch, MagicMock
@@ -11,10 +12,15 @@ from auth import create_access_token
 from database import Base, engine, SessionLocal
 from settings import settings
 from sqlalchemy.orm import Session
+from services.enrichment import run_enrichment, run_enrichment_batch, store_result
+from services.vector_index import EmbeddingIndex
+from services.near_duplicates import NearDuplicateIndex
 
 # Create test directory for uploads
 TEST_UPLOAD_DIR = "test_uploaded_photos"
 os.makedirs(TEST_UPLOAD_DIR, exist_ok=True)
+TEST_RENDITION_DIR = os.path.join(TEST_UPLOAD_DIR, "renditions")
+os.makedirs(TEST_RENDITION_DIR, exist_ok=True)
 
 @pytest.fixture(scope="session", autouse=True)
 def setup_test_environment():
@@ -46,7 +52,9 @@ def db():
 def mock_dependencies():
     """Mock all external dependencies"""
     with patch("routes.photo.UPLOAD_DIR", TEST_UPLOAD_DIR), \
-         patch("settings.UPLOAD_DIR", TEST_UPLOAD_DIR):
+         patch("settings.UPLOAD_DIR", TEST_UPLOAD_DIR), \
+         patch("services.storage.UPLOAD_DIR", TEST_UPLOAD_DIR), \
+         patch("services.renditions.RENDITION_DIR", TEST_RENDITION_DIR):
         yield
 
 def create_test_image():
@@ -110,9 +118,8 @@ def test_photo(db: Session, test_user):
     if os.path.exists(photo.file_path):
         os.remove(photo.file_path)
 
-@patch("routes.photo.classify_image", return_value="nature")
-@patch("routes.photo.describe_image", return_value="A beautiful landscape")
-def test_upload_photo_as_photographer(mock_describe, mock_classify, client, auth_headers, test_user, db):
+@patch("routes.photo.enrichment_queue.submit", return_value=True)
+def test_upload_photo_as_photographer(mock_submit, client, auth_headers, test_user, db):
     """Test photo upload by photographer"""
     # Verify test directory exists and is writable
     assert os.path.exists(TEST_UPLOAD_DIR)
@@ -128,27 +135,415 @@ def test_upload_photo_as_photographer(mock_describe, mock_classify, client, auth
     )
     
     # Debug output if test fails
-    if response.status_code != 201:
+    if response.status_code != 202:
         print("ERROR RESPONSE:", response.json())
     
-    assert response.status_code == 201
+    assert response.status_code == 202
     data = response.json()
     assert "photo_id" in data
     assert "filename" in data
+    assert data["enrichment_status"] == "pending"
     
-    # Verify file was created
+    # Verify file was created under its content hash
     photo_id = data["photo_id"]
-    expected_path = os.path.join(TEST_UPLOAD_DIR, f"{photo_id}.jpg")
+    content_hash = hashlib.sha256(create_test_image().getvalue()).hexdigest()
+    expected_path = os.path.join(TEST_UPLOAD_DIR, content_hash[:2], content_hash[2:4], f"{content_hash}.jpg")
     assert os.path.exists(expected_path)
+    assert data["filename"] == os.path.relpath(expected_path, TEST_UPLOAD_DIR)
     
-    # Verify AI services were called
-    mock_classify.assert_called_once()
-    mock_describe.assert_called_once()
+    # Verify AI enrichment was handed off instead of run inline
+    mock_submit.assert_called_once_with(photo_id)
     
     # Cleanup
     if os.path.exists(expected_path):
         os.remove(expected_path)
 
+@patch("routes.photo.enrichment_queue.full", return_value=True)
+def test_upload_photo_queue_full(mock_full, client, auth_headers):
+    """Test upload is rejected when the enrichment queue is saturated"""
+    response = client.post(
+        "/photos/upload",
+        files={"file": ("test.jpg", create_test_image(), "image/jpeg")},
+        headers=auth_headers["photographer"]
+    )
+    assert response.status_code == 503
+
+def upload(client, headers, name, data, content_type="image/jpeg"):
+    return client.post("/photos/upload", files={"file": (name, data, content_type)}, headers=headers)
+
+def leftover_temp_files():
+    return [name for name in os.listdir(TEST_UPLOAD_DIR) if name.startswith(".upload-")]
+
+def reap(db):
+    """Run the file reaper the way its thread does after a delete commits"""
+    from services.reaper import FileReaper
+    return FileReaper(session_factory=lambda: db).run_once()
+
+@patch("routes.photo.enrichment_queue.submit", return_value=True)
+def test_identical_uploads_share_one_file(mock_submit, client, auth_headers, db):
+    """Test identical bytes are stored once and the file goes with its last photo"""
+    from models import StoredFile
+    headers = auth_headers["photographer"]
+    first = upload(client, headers, "a.jpg", create_test_image()).json()
+    second = upload(client, headers, "b.jpg", create_test_image()).json()
+    assert first["filename"] == second["filename"]
+    path = os.path.join(TEST_UPLOAD_DIR, first["filename"])
+    assert db.query(StoredFile).filter(StoredFile.file_path == path).one().ref_count == 2
+
+    client.delete(f"/photos/{first['photo_id']}", headers=headers)
+    reap(db)
+    assert os.path.exists(path)
+    client.delete(f"/photos/{second['photo_id']}", headers=headers)
+    reap(db)
+    assert not os.path.exists(path)
+    assert db.query(StoredFile).filter(StoredFile.file_path == path).first() is None
+
+@patch.object(settings, "MAX_UPLOAD_BYTES", 100)
+def test_upload_too_large(client, auth_headers):
+    """Test oversized uploads are rejected while streaming and leave nothing behind"""
+    response = upload(client, auth_headers["photographer"], "big.jpg", create_test_image())
+    assert response.status_code == 413
+    assert leftover_temp_files() == []
+
+def test_upload_rejects_non_image_with_image_extension(client, auth_headers):
+    """Test the file header is checked instead of trusting the extension"""
+    response = upload(client, auth_headers["photographer"], "evil.jpg", io.BytesIO(b"#!/bin/sh\necho hi\n"))
+    assert response.status_code == 400
+    assert leftover_temp_files() == []
+
+@patch.object(settings, "MAX_IMAGE_PIXELS", 50 * 50)
+def test_upload_rejects_oversized_dimensions(client, auth_headers):
+    """Test images with too many pixels are rejected before any decoding or inference"""
+    response = upload(client, auth_headers["photographer"], "wide.jpg", create_test_image())
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Image dimensions too large"
+
+@patch("routes.photo.enrichment_queue.submit", return_value=True)
+def test_upload_extension_follows_detected_format(mock_submit, client, auth_headers):
+    """Test a PNG uploaded with a .jpg name is stored as .png"""
+    buf = io.BytesIO()
+    Image.new("RGB", (20, 20), color="blue").save(buf, format="PNG")
+    buf.seek(0)
+
+    response = upload(client, auth_headers["photographer"], "actually_png.jpg", buf)
+    assert response.status_code == 202
+    assert response.json()["filename"].endswith(".png")
+    os.remove(os.path.join(TEST_UPLOAD_DIR, response.json()["filename"]))
+
+@patch("services.enrichment.classify_image", return_value={"category": "landscape"})
+@patch("services.enrichment.describe_image", return_value={"description": "A red square"})
+def test_run_enrichment(mock_describe, mock_classify, client, test_photo, auth_headers, db):
+    """Test the enrichment worker stores AI results and the status endpoint reports them"""
+    test_photo.enrichment_status = "pending"
+    db.commit()
+
+    run_enrichment(db, test_photo.photo_id)
+
+    response = client.get(f"/photos/{test_photo.photo_id}/enrichment", headers=auth_headers["photographer"])
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "done"
+    assert data["tags"] == "landscape"
+    assert data["description"] == "A red square"
+
+@patch("services.enrichment.classify_image", side_effect=RuntimeError("model exploded"))
+def test_run_enrichment_failure(mock_classify, test_photo, db):
+    """Test a failing model marks the photo as failed instead of raising"""
+    run_enrichment(db, test_photo.photo_id)
+
+    db.refresh(test_photo)
+    assert test_photo.enrichment_status == "failed"
+    assert "model exploded" in test_photo.enrichment_error
+
+def test_photo_deleted_during_enrichment(test_user, db, tmp_path):
+    """Test a photo deleted mid-inference is skipped without an error or an orphaned embedding"""
+    from sqlalchemy import delete
+    file_path = str(tmp_path / "photo.jpg")
+    (tmp_path / "photo.jpg").write_bytes(create_test_image().getvalue())
+    owner_id = test_user["photographer"].user_id
+    photo_id = 999999
+    index = EmbeddingIndex(str(tmp_path / "index"), dim=4)
+
+    def delete_then_classify(image):
+        db.execute(delete(Photo).where(Photo.photo_id == photo_id))
+        db.commit()
+        return {"category": "landscape", "embedding": np.ones(4, dtype=np.float32)}
+
+    for run in (lambda: run_enrichment(db, photo_id), lambda: run_enrichment_batch(db, [photo_id])):
+        db.add(Photo(photo_id=photo_id, owner_id=owner_id, file_path=file_path, enrichment_status="pending"))
+        db.commit()
+        with patch("services.enrichment.embedding_index", index), \
+             patch("services.enrichment.classify_image", side_effect=delete_then_classify), \
+             patch("services.enrichment.classify_images", side_effect=lambda images: [delete_then_classify(image) for image in images]), \
+             patch("services.enrichment.describe_image", return_value={"description": "A red square"}), \
+             patch("services.enrichment.describe_images", side_effect=lambda images: [{"description": "A red square"} for _ in images]):
+            run()
+        assert db.get(Photo, photo_id) is None
+        assert len(index) == 0
+
+def test_enrichment_claims_and_polling(test_photo, db):
+    """Test a photo is claimed by one worker only, stale claims are retried and the poller finds pending photos"""
+    from datetime import datetime, timedelta
+    from services.enrichment import EnrichmentQueue, claim
+    photo_id = test_photo.photo_id
+    queue = EnrichmentQueue(workers=0, maxsize=2, session_factory=lambda: db)
+    assert queue.poll_pending() == 1
+    assert queue._queue.get_nowait() == [photo_id]
+
+    assert claim(db, [photo_id]) == [photo_id]
+    assert claim(db, [photo_id]) == []
+    assert queue.poll_pending() == 0
+
+    # A worker that died mid-inference leaves the claim behind until it times out
+    db.get(Photo, photo_id).enrichment_claimed_at = datetime.utcnow() - timedelta(seconds=settings.ENRICHMENT_CLAIM_TIMEOUT + 1)
+    db.commit()
+    assert queue.poll_pending() == 1
+    assert claim(db, [photo_id]) == [photo_id]
+
+@patch("routes.photo.enrichment_queue.submit", return_value=True)
+def test_duplicate_upload_reuses_ai_result(mock_submit, client, auth_headers, db):
+    """Test re-uploading identical bytes is served from the AI result cache"""
+    image_bytes = create_test_image().getvalue()
+    content_hash = hashlib.sha256(image_bytes).hexdigest()
+    store_result(db, content_hash, "portrait", "A red square")
+    db.commit()
+
+    response = client.post(
+        "/photos/upload",
+        files={"file": ("again.jpg", io.BytesIO(image_bytes), "image/jpeg")},
+        headers=auth_headers["photographer"]
+    )
+    assert response.status_code == 202
+    data = response.json()
+    assert data["enrichment_status"] == "done"
+    mock_submit.assert_not_called()
+
+    photo = db.query(Photo).filter(Photo.photo_id == data["photo_id"]).first()
+    assert photo.content_hash == content_hash
+    assert photo.tags == "portrait"
+    os.remove(photo.file_path)
+
+@patch("routes.photo.enrichment_queue.submit_batch", return_value=True)
+def test_batch_upload(mock_submit_batch, client, auth_headers, db):
+    """Test a batch upload stores valid files, rejects bad ones individually and queues the rest together"""
+    cached_bytes = create_test_image().getvalue()
+    store_result(db, hashlib.sha256(cached_bytes).hexdigest(), "portrait", "A red square")
+    db.commit()
+
+    png = io.BytesIO()
+    Image.new("RGB", (20, 20), color="blue").save(png, format="PNG")
+    files = [
+        ("files", ("a.png", png.getvalue(), "image/png")),
+        ("files", ("bad.jpg", b"not an image", "image/jpeg")),
+        ("files", ("cached.jpg", cached_bytes, "image/jpeg")),
+    ]
+    response = client.post("/photos/upload/batch", files=files, headers=auth_headers["photographer"])
+    assert response.status_code == 202
+    data = response.json()
+    assert (data["uploaded"], data["failed"]) == (2, 1)
+
+    stored, bad, cached = data["results"]
+    assert stored["enrichment_status"] == "pending"
+    assert bad["photo_id"] is None and bad["error"] == "Invalid image format"
+    assert cached["enrichment_status"] == "done"
+    mock_submit_batch.assert_called_once_with([stored["photo_id"]])
+
+    for result in (stored, cached):
+        photo = db.query(Photo).filter(Photo.photo_id == result["photo_id"]).first()
+        assert os.path.exists(photo.file_path)
+        os.remove(photo.file_path)
+    assert leftover_temp_files() == []
+
+@patch.object(settings, "BATCH_UPLOAD_MAX_FILES", 1)
+def test_batch_upload_too_many_files(client, auth_headers):
+    files = [("files", (f"{i}.jpg", create_test_image().getvalue(), "image/jpeg")) for i in range(2)]
+    response = client.post("/photos/upload/batch", files=files, headers=auth_headers["photographer"])
+    assert response.status_code == 400
+
+def test_run_enrichment_batch_infers_duplicates_once(test_photo, test_user, db):
+    """Test identical bytes in a batch share one inference and every photo gets the result"""
+    with open(test_photo.file_path, "rb") as f:
+        test_photo.content_hash = hashlib.sha256(f.read()).hexdigest()
+    copy = Photo(owner_id=test_user["photographer"].user_id, file_path=test_photo.file_path, content_hash=test_photo.content_hash)
+    db.add(copy)
+    db.commit()
+
+    with patch("services.enrichment.classify_images", return_value=[{"category": "food"}]) as classify, \
+         patch("services.enrichment.describe_images", return_value=[{"description": "A red square"}]):
+        run_enrichment_batch(db, [test_photo.photo_id, copy.photo_id])
+
+    assert len(classify.call_args[0][0]) == 1
+    for photo in (test_photo, copy):
+        db.refresh(photo)
+        assert (photo.enrichment_status, photo.tags) == ("done", "food")
+
+@patch("services.enrichment.classify_images", side_effect=RuntimeError("batch exploded"))
+@patch("services.enrichment.classify_image", return_value={"category": "landscape"})
+@patch("services.enrichment.describe_image", return_value={"description": "A red square"})
+def test_run_enrichment_batch_falls_back_to_single(mock_describe, mock_classify, mock_classify_images, test_photo, db):
+    """Test a failed batch is retried photo by photo"""
+    run_enrichment_batch(db, [test_photo.photo_id])
+
+    db.refresh(test_photo)
+    assert test_photo.enrichment_status == "done"
+    assert test_photo.tags == "landscape"
+
+def gradient_jpeg(size, quality=90):
+    """A left-to-right gradient with a dark band, so it has a meaningful perceptual hash"""
+    pixels = np.tile(np.linspace(0, 255, size[0], dtype=np.uint8), (size[1], 1))
+    pixels[: size[1] // 3] //= 4
+    buf = io.BytesIO()
+    Image.fromarray(pixels).convert("RGB").save(buf, format="JPEG", quality=quality)
+    buf.seek(0)
+    return buf
+
+@patch("routes.photo.enrichment_queue.submit", return_value=True)
+@patch("routes.photo.near_duplicate_index", NearDuplicateIndex())
+def test_near_duplicate_lookup_and_reject(mock_submit, client, auth_headers, db):
+    """Test resized copies are found as near-duplicates and can be rejected on upload"""
+    headers = auth_headers["photographer"]
+    first = upload(client, headers, "a.jpg", gradient_jpeg((600, 400))).json()
+    copy = upload(client, headers, "b.jpg", gradient_jpeg((300, 200), quality=50)).json()
+
+    response = client.get(f"/photos/{first['photo_id']}/near-duplicates", headers=headers)
+    assert response.status_code == 200
+    assert [match["photo_id"] for match in response.json()] == [copy["photo_id"]]
+
+    with patch.object(settings, "NEAR_DUPLICATE_REJECT", True):
+        response = upload(client, headers, "c.jpg", gradient_jpeg((450, 300)))
+        assert response.status_code == 409
+        assert leftover_temp_files() == []
+
+        # Only the owner's library counts
+        response = client.get(f"/photos/{first['photo_id']}/near-duplicates", headers=auth_headers["user"])
+        assert response.status_code == 404
+
+    for data in (first, copy):
+        os.remove(os.path.join(TEST_UPLOAD_DIR, data["filename"]))
+
+@patch("routes.photo.enrichment_queue.submit", return_value=True)
+def test_lookup_and_upload_by_hash(mock_submit, client, test_photo, auth_headers, db):
+    """Test clients can find and re-use bytes they already uploaded"""
+    with open(test_photo.file_path, "rb") as f:
+        content_hash = hashlib.sha256(f.read()).hexdigest()
+    test_photo.content_hash = content_hash
+    db.commit()
+
+    response = client.head(f"/photos/hash/{content_hash}", headers=auth_headers["photographer"])
+    assert response.status_code == 200
+
+    # Other users can't probe for someone else's files
+    response = client.head(f"/photos/hash/{content_hash}", headers=auth_headers["user"])
+    assert response.status_code == 404
+
+    response = client.post(f"/photos/upload/hash/{content_hash}", headers=auth_headers["photographer"])
+    assert response.status_code == 202
+    new_photo = db.query(Photo).filter(Photo.photo_id == response.json()["photo_id"]).first()
+    assert new_photo.content_hash == content_hash
+    assert os.path.exists(new_photo.file_path)
+    mock_submit.assert_called_once_with(new_photo.photo_id)
+    os.remove(new_photo.file_path)
+
+def test_similar_photos_respects_visibility(client, test_photo, test_user, auth_headers, db, tmp_path):
+    """Test similar photos are ranked by embedding and limited to what the viewer may see"""
+    stranger = User(username="stranger", password=hash_password("testpass"), role="Photographer")
+    db.add(stranger)
+    db.commit()
+    own_match = Photo(owner_id=test_user["photographer"].user_id, file_path="own.jpg")
+    hidden_match = Photo(owner_id=stranger.user_id, file_path="hidden.jpg")
+    db.add_all([own_match, hidden_match])
+    db.commit()
+
+    index = EmbeddingIndex(str(tmp_path), dim=4)
+    index.add(test_photo.photo_id, [1, 0, 0, 0])
+    index.add(own_match.photo_id, [0.8, 0.2, 0, 0])
+    index.add(hidden_match.photo_id, [0.9, 0.1, 0, 0])
+
+    with patch("routes.photo.embedding_index", index):
+        response = client.get(f"/photos/{test_photo.photo_id}/similar", headers=auth_headers["photographer"])
+        assert response.status_code == 200
+        assert [p["photo_id"] for p in response.json()] == [own_match.photo_id]
+
+        # The regular user can't see the source photo at all
+        response = client.get(f"/photos/{test_photo.photo_id}/similar", headers=auth_headers["user"])
+        assert response.status_code == 404
+
+def test_search_photos_pages_visible_results(client, test_photo, test_user, auth_headers, db, tmp_path):
+    """Test text search ranks by embedding, hides what the viewer can't see and pages with a cursor"""
+    stranger = User(username="stranger", password=hash_password("testpass"), role="Photographer")
+    db.add(stranger)
+    db.commit()
+    owner_id = test_user["photographer"].user_id
+    own = [Photo(owner_id=owner_id, file_path=f"own{i}.jpg") for i in range(3)]
+    hidden = Photo(owner_id=stranger.user_id, file_path="hidden.jpg")
+    db.add_all(own + [hidden])
+    db.commit()
+
+    index = EmbeddingIndex(str(tmp_path), dim=4)
+    index.add(hidden.photo_id, [1, 0, 0, 0])
+    for i, photo in enumerate([test_photo] + own):
+        index.add(photo.photo_id, [1, 0.1 * (i + 1), 0, 0])
+
+    with patch("routes.photo.embedding_index", index), \
+         patch("routes.photo.encode_text", return_value=np.array([1, 0, 0, 0], dtype=np.float32)):
+        response = client.get("/photos/search?q=sunset&limit=3", headers=auth_headers["photographer"])
+        assert response.status_code == 200
+        page = response.json()
+        assert [p["photo_id"] for p in page["results"]] == [test_photo.photo_id, own[0].photo_id, own[1].photo_id]
+
+        response = client.get(f"/photos/search?q=sunset&limit=3&cursor={page['next_cursor']}", headers=auth_headers["photographer"])
+        page = response.json()
+        assert [p["photo_id"] for p in page["results"]] == [own[2].photo_id]
+        assert page["next_cursor"] is None
+
+        response = client.get("/photos/search?q=sunset&cursor=bogus", headers=auth_headers["photographer"])
+        assert response.status_code == 400
+
+@patch("routes.photo.enrichment_queue.submit", return_value=True)
+def test_upload_stores_exif_and_geo_search(mock_submit, client, test_user, auth_headers, db):
+    """Test EXIF from the upload lands in columns and drives geo and capture-date search"""
+    from tests.test_exif import jpeg_with_exif
+    headers = auth_headers["photographer"]
+    london = upload(client, headers, "london.jpg", jpeg_with_exif(gps=(("N", (51.0, 30.0, 0.0)), ("W", (0.0, 7.0, 0.0))))).json()
+    paris = upload(client, headers, "paris.jpg", jpeg_with_exif(taken="2023:01:01 08:00:00", gps=(("N", (48.0, 51.0, 0.0)), ("E", (2.0, 21.0, 0.0))))).json()
+
+    photo = db.query(Photo).filter(Photo.photo_id == london["photo_id"]).first()
+    assert photo.camera_model == "EOS R5"
+    assert photo.geohash.startswith("gcp")
+
+    response = client.get("/photos/search/geo?bbox=-1,51,1,52", headers=headers)
+    assert response.status_code == 200
+    assert [p["photo_id"] for p in response.json()["results"]] == [london["photo_id"]]
+
+    # Europe-wide box, one result per page
+    response = client.get("/photos/search/geo?bbox=-10,40,10,60&limit=1", headers=headers)
+    page = response.json()
+    assert [p["photo_id"] for p in page["results"]] == [paris["photo_id"]]
+    response = client.get(f"/photos/search/geo?bbox=-10,40,10,60&limit=1&cursor={page['next_cursor']}", headers=headers)
+    assert [p["photo_id"] for p in response.json()["results"]] == [london["photo_id"]]
+
+    # Other users only see what they're allowed to
+    response = client.get("/photos/search/geo?bbox=-10,40,10,60", headers=auth_headers["user"])
+    assert response.json()["results"] == []
+
+    response = client.get("/photos/search/date?taken_after=2024-01-01T00:00:00", headers=headers)
+    assert [p["photo_id"] for p in response.json()["results"]] == [london["photo_id"]]
+    response = client.get("/photos/search/date?limit=1", headers=headers)
+    page = response.json()
+    assert [p["photo_id"] for p in page["results"]] == [london["photo_id"]]
+    response = client.get(f"/photos/search/date?limit=1&cursor={page['next_cursor']}", headers=headers)
+    assert [p["photo_id"] for p in response.json()["results"]] == [paris["photo_id"]]
+
+    assert client.get("/photos/search/geo?bbox=1,2,3", headers=headers).status_code == 400
+
+    for data in (london, paris):
+        os.remove(os.path.join(TEST_UPLOAD_DIR, data["filename"]))
+
+def test_enrichment_status_other_user(client, test_photo, auth_headers):
+    """Test only the owner can see a photo's enrichment status"""
+    response = client.get(f"/photos/{test_photo.photo_id}/enrichment", headers=auth_headers["user"])
+    assert response.status_code == 404
+
 def test_view_photo(client, test_photo ,auth_headers):
     """Test viewing a photo"""
     response = client.get(f"/photos/{test_photo.photo_id}/view" , headers=auth_headers['photographer'])
@@ -156,6 +551,361 @@ def test_view_photo(client, test_photo ,auth_headers):
     # Verify it returns an image
     assert response.headers["content-type"] == "image/jpeg"
 
+def test_view_photo_conditional_and_range(client, test_photo, auth_headers, db):
+    """Test ETag/Last-Modified revalidation answers 304 and byte ranges are honoured"""
+    test_photo.content_hash = "ab" * 32
+    db.commit()
+    headers = auth_headers["photographer"]
+    url = f"/photos/{test_photo.photo_id}/view"
+
+    response = client.get(url, headers=headers)
+    etag = response.headers["etag"]
+    assert etag == f'"{"ab" * 32}"'
+    assert response.headers["cache-control"] == f"private, max-age={settings.PHOTO_CACHE_MAX_AGE}"
+    full = response.content
+
+    response = client.get(url, headers={**headers, "If-None-Match": f'"other", W/{etag}'})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+
+    response = client.get(url, headers={**headers, "If-Modified-Since": response.headers["last-modified"]})
+    assert response.status_code == 304
+
+    response = client.get(url, headers={**headers, "Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == full[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(full)}"
+
+    # A stale If-Range gets the whole file instead of a mismatched range
+    response = client.get(url, headers={**headers, "Range": "bytes=10-19", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == full
+
+    # Renditions get their own tag per size and format
+    response = client.get(f"{url}?size=256", headers={**headers, "Accept": "image/webp"})
+    assert response.headers["etag"] == f'"{"ab" * 32}-256.webp"'
+    response = client.get(f"{url}?size=256", headers={**headers, "Accept": "image/webp", "If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+    assert response.headers["vary"] == "Accept"
+
+    from services.renditions import delete_renditions
+    delete_renditions(test_photo.photo_id)
+
+def test_view_photo_rendition_negotiates_webp(client, test_photo, auth_headers, db):
+    """Test thumbnails are served as WebP to clients that accept it and cached on disk"""
+    response = client.get(
+        f"/photos/{test_photo.photo_id}/view?size=256",
+        headers={**auth_headers["photographer"], "Accept": "image/webp,image/*"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert response.headers["vary"] == "Accept"
+    assert Image.open(io.BytesIO(response.content)).format == "WEBP"
+    assert os.path.exists(os.path.join(TEST_RENDITION_DIR, f"{test_photo.photo_id}_256.webp"))
+
+    response = client.get(f"/photos/{test_photo.photo_id}/view?size=256", headers=auth_headers["photographer"])
+    assert response.headers["content-type"] == "image/jpeg"
+
+    # Deleting the photo removes its renditions
+    client.delete(f"/photos/{test_photo.photo_id}", headers=auth_headers["photographer"])
+    reap(db)
+    assert not os.path.exists(os.path.join(TEST_RENDITION_DIR, f"{test_photo.photo_id}_256.webp"))
+
+def test_view_photo_rendition_downscales():
+    """Test renditions fit within the requested size"""
+    from services.renditions import get_rendition
+    source = os.path.join(TEST_UPLOAD_DIR, "large.jpg")
+    Image.new("RGB", (2000, 1000), color="green").save(source, format="JPEG")
+
+    path = get_rendition(999999, source, 256, "jpeg")
+    assert Image.open(path).size == (256, 128)
+    os.remove(path)
+    os.remove(source)
+
+@patch("routes.photo.enrichment_queue.submit", return_value=True)
+def test_view_photo_rendition_applies_exif_orientation(mock_submit, client, auth_headers):
+    """Test a JPEG shot sideways (Orientation=6) gets upright renditions"""
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    buf = io.BytesIO()
+    Image.new("RGB", (400, 200), color="green").save(buf, format="JPEG", exif=exif)
+    buf.seek(0)
+    data = upload(client, auth_headers["photographer"], "sideways.jpg", buf).json()
+
+    try:
+        for accept in ("image/webp", "image/jpeg"):
+            response = client.get(f"/photos/{data['photo_id']}/view?size=256", headers={**auth_headers["photographer"], "Accept": accept})
+            assert response.status_code == 200
+            assert Image.open(io.BytesIO(response.content)).size == (128, 256)
+    finally:
+        from services.renditions import delete_renditions
+        delete_renditions(data["photo_id"])
+        os.remove(os.path.join(TEST_UPLOAD_DIR, data["filename"]))
+
+def test_view_photo_invalid_size(client, test_photo, auth_headers):
+    response = client.get(f"/photos/{test_photo.photo_id}/view?size=300", headers=auth_headers["photographer"])
+    assert response.status_code == 400
+
+@patch.object(settings, "STORAGE_SERVE", "x-accel-redirect")
+def test_view_photo_offloads_to_nginx(client, test_photo, auth_headers):
+    """Test X-Accel-Redirect hands the file to nginx after the access check"""
+    from services.storage_backends import LocalBackend
+    with patch("services.storage.backend", LocalBackend(TEST_UPLOAD_DIR)):
+        response = client.get(f"/photos/{test_photo.photo_id}/view", headers=auth_headers["photographer"])
+    assert response.status_code == 200
+    assert response.headers["x-accel-redirect"] == f"{settings.ACCEL_REDIRECT_UPLOAD_PREFIX}/1.jpg"
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "etag" in response.headers
+    assert response.content == b""
+
+    response = client.get(f"/photos/{test_photo.photo_id}/view", headers=auth_headers["user"])
+    assert response.status_code == 403
+    assert "x-accel-redirect" not in response.headers
+
+@patch("routes.photo.enrichment_queue.submit", return_value=True)
+@patch.object(settings, "STORAGE_SERVE", "redirect")
+def test_s3_storage_upload_view_and_delete(mock_submit, client, auth_headers, db):
+    """Test uploads land in the object store, views redirect to a presigned URL and deletes remove the object"""
+    from services.storage_backends import S3Backend
+    from tests.test_storage import FakeS3
+    s3 = FakeS3()
+    headers = auth_headers["photographer"]
+    with patch("services.storage.backend", S3Backend(TEST_UPLOAD_DIR, client=s3, bucket="photos", prefix="")):
+        data = upload(client, headers, "a.jpg", create_test_image()).json()
+        key = data["filename"].replace(os.sep, "/")
+        assert list(s3.objects) == [("photos", key)]
+        assert leftover_temp_files() == []
+        assert not os.path.exists(os.path.join(TEST_UPLOAD_DIR, data["filename"]))
+
+        response = client.get(f"/photos/{data['photo_id']}/view", headers=headers, follow_redirects=False)
+        assert response.status_code == 302
+        assert response.headers["location"].startswith(f"https://s3.test/photos/{key}?")
+
+        client.delete(f"/photos/{data['photo_id']}", headers=headers)
+        reap(db)
+        assert s3.objects == {}
+
+@patch("routes.photo.enrichment_queue.submit", return_value=True)
+def test_s3_storage_streams_ranges(mock_submit, client, auth_headers):
+    """Test streamed views from the object store answer Range with 206 unless If-Range no longer matches"""
+    from services.storage_backends import S3Backend
+    from tests.test_storage import FakeS3
+    headers = auth_headers["photographer"]
+    with patch("services.storage.backend", S3Backend(TEST_UPLOAD_DIR, client=FakeS3(), bucket="photos", prefix="")):
+        data = create_test_image().getvalue()
+        photo_id = upload(client, headers, "a.jpg", io.BytesIO(data)).json()["photo_id"]
+        url = f"/photos/{photo_id}/view"
+
+        response = client.get(url, headers={**headers, "Range": "bytes=0-9"})
+        assert response.status_code == 206
+        assert response.content == data[:10]
+        assert response.headers["content-range"] == f"bytes 0-9/{len(data)}"
+
+        response = client.get(url, headers={**headers, "Range": "bytes=-4", "If-Range": response.headers["etag"]})
+        assert (response.status_code, response.content) == (206, data[-4:])
+
+        response = client.get(url, headers={**headers, "Range": "bytes=0-9", "If-Range": '"stale"'})
+        assert (response.status_code, response.content) == (200, data)
+
+@patch("routes.photo.enrichment_queue.submit", return_value=True)
+def test_signed_photo_url(mock_submit, client, auth_headers):
+    """Test signed URLs serve without a token or any DB access and reject tampering and expiry"""
+    from sqlalchemy import event
+    data = upload(client, auth_headers["photographer"], "a.jpg", create_test_image()).json()
+    photo_id = data["photo_id"]
+    try:
+        response = client.get(f"/photos/{photo_id}/url?size=256", headers=auth_headers["photographer"])
+        assert response.status_code == 200
+        url = response.json()["url"]
+        assert client.get(f"/photos/{photo_id}/url", headers=auth_headers["user"]).status_code == 403
+
+        queries = []
+        def count(conn, cursor, statement, *args):
+            queries.append(statement)
+        event.listen(engine, "before_cursor_execute", count)
+        try:
+            response = client.get(url, headers={"Accept": "image/webp"})
+        finally:
+            event.remove(engine, "before_cursor_execute", count)
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/webp"
+        assert queries == []
+
+        # Same window, same URL, so browsers reuse what they cached
+        listed = client.get("/photos/", headers=auth_headers["photographer"]).json()
+        mine = next(p for p in listed if p["photo_id"] == photo_id)
+        assert mine["thumbnail_url"].split("?")[1] == url.split("?")[1]
+        assert client.get(mine["url"]).status_code == 200
+
+        assert client.get(url.replace("size=256", "size=1024")).status_code == 403
+        assert client.get(url.replace(f"/signed/{photo_id}/", "/signed/999999/")).status_code == 403
+        from services.signed_urls import signed_photo_url
+        from services.storage import storage_path
+        key = url.split("?")[0].split(f"/signed/{photo_id}/")[1]
+        expired = signed_photo_url(photo_id, storage_path(key), expires=1)
+        assert client.get(expired).status_code == 403
+    finally:
+        from services.renditions import delete_renditions
+        delete_renditions(photo_id)
+        os.remove(os.path.join(TEST_UPLOAD_DIR, data["filename"]))
+
+def test_signed_photo_url_only_serves_stored_keys(client, test_photo, auth_headers):
+    """Test legacy files get no signed URL and keys outside the store are refused even when signed"""
+    from urllib.parse import quote
+    from services.signed_urls import _signature
+    response = client.get(f"/photos/{test_photo.photo_id}/url", headers=auth_headers["photographer"])
+    assert response.status_code == 404
+
+    for key in ("1.jpg", "../settings.py", "ab/cd/../../../settings.py", "ab/cd/" + "ef" * 32 + ".jpg"):
+        signature = _signature(test_photo.photo_id, key, None, 2 ** 40)
+        response = client.get(f"/photos/signed/{test_photo.photo_id}/{quote(key, safe='')}?expires={2 ** 40}&signature={signature}")
+        assert response.status_code == 403
+
+def test_signing_without_secret_key_fails_only_when_used():
+    """Test a missing SECRET_KEY leaves the app importable and only refuses to sign"""
+    from services import signed_urls
+    signed_urls._signing_key.cache_clear()
+    try:
+        with patch("services.signed_urls.SECRET_KEY", None):
+            with pytest.raises(RuntimeError):
+                signed_urls.signed_photo_url(1, os.path.join(TEST_UPLOAD_DIR, "ef", "ef", "ef" * 32 + ".jpg"))
+    finally:
+        signed_urls._signing_key.cache_clear()
+
+def test_view_photo_access_cached_and_invalidated(client, test_photo, auth_headers, test_user):
+    """Test repeat views skip the access query and follow/unfollow/share/revoke apply at once"""
+    from sqlalchemy import event
+    access_queries = []
+    def count(conn, cursor, statement, *args):
+        if "followers" in statement:
+            access_queries.append(statement)
+    event.listen(engine, "before_cursor_execute", count)
+    url = f"/photos/{test_photo.photo_id}/view"
+    viewer = auth_headers["user"]
+    photographer_id = test_user["photographer"].user_id
+    user_id = test_user["user"].user_id
+
+    try:
+        assert client.get(url, headers=viewer).status_code == 403
+        assert client.get(url, headers=viewer).status_code == 403
+        assert len(access_queries) == 1
+
+        client.post(f"/follow/{photographer_id}", headers=viewer)
+        assert client.get(url, headers=viewer).status_code == 200
+        client.delete(f"/follow/{photographer_id}", headers=viewer)
+        assert client.get(url, headers=viewer).status_code == 403
+
+        client.post(f"/photos/share/{test_photo.photo_id}/{user_id}?hours=1", headers=auth_headers["photographer"])
+        assert client.get(url, headers=viewer).status_code == 200
+        access_queries.clear()
+        for _ in range(3):
+            assert client.get(url, headers=viewer).status_code == 200
+        assert access_queries == []
+        client.delete(f"/photos/share/{test_photo.photo_id}/{user_id}", headers=auth_headers["photographer"])
+        assert client.get(url, headers=viewer).status_code == 403
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+def test_bulk_share(client, db, test_photo, test_user, auth_headers):
+    """Test many photos are shared with many users in one upsert, extending existing shares"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import event
+    from models import SharePhoto
+    photographer = test_user["photographer"]
+    photos = [test_photo] + [Photo(owner_id=photographer.user_id, file_path=f"{i}.jpg") for i in range(2)]
+    viewers = [test_user["user"]] + [User(username=f"team{i}", password="x", role="User") for i in range(2)]
+    db.add_all(photos + viewers)
+    db.flush()
+    db.add(SharePhoto(photo_id=test_photo.photo_id, user_id=test_user["user"].user_id, expires_at=datetime.utcnow() + timedelta(minutes=5)))
+    db.commit()
+    url = f"/photos/{test_photo.photo_id}/view"
+    body = {"photo_ids": [photo.photo_id for photo in photos], "user_ids": [viewer.user_id for viewer in viewers], "hours": 48}
+    team_headers = {"Authorization": f"Bearer {create_access_token(data={'sub': 'team0'})}"}
+    assert client.get(url, headers=team_headers).status_code == 403  # Cached denial
+
+    writes = []
+    def count(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("INSERT"):
+            writes.append(statement)
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        # Cache invalidation is per viewer or per photo, never per pair
+        with patch("routes.photo.access_cache.invalidate", side_effect=AssertionError("invalidated a single pair")):
+            response = client.post("/photos/share", json=body, headers=auth_headers["photographer"])
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert response.status_code == 200
+    assert response.json()["shared"] == 9
+    assert len(writes) == 1
+
+    shares = db.query(SharePhoto).filter(SharePhoto.photo_id.in_(body["photo_ids"])).all()
+    assert len(shares) == 9
+    assert all(share.expires_at > datetime.utcnow() + timedelta(hours=47) for share in shares)
+    assert client.get(url, headers=auth_headers["user"]).status_code == 200
+    assert client.get(url, headers=team_headers).status_code == 200
+
+    # More users than photos invalidates by photo instead of by viewer
+    extra = Photo(owner_id=photographer.user_id, file_path=test_photo.file_path)
+    db.add(extra)
+    db.commit()
+    extra_url = f"/photos/{extra.photo_id}/view"
+    assert client.get(extra_url, headers=team_headers).status_code == 403
+    response = client.post("/photos/share", json={**body, "photo_ids": [extra.photo_id]}, headers=auth_headers["photographer"])
+    assert response.json()["shared"] == 3
+    assert client.get(extra_url, headers=team_headers).status_code == 200
+
+    other = User(username="rival", password="x", role="Photographer")
+    db.add(other)
+    db.flush()
+    db.add(Photo(owner_id=other.user_id, file_path="rival.jpg", photo_id=999))
+    db.commit()
+    forbidden = {**body, "photo_ids": [test_photo.photo_id, 999]}
+    assert client.post("/photos/share", json=forbidden, headers=auth_headers["photographer"]).status_code == 403
+    missing = {**body, "user_ids": [123456]}
+    assert client.post("/photos/share", json=missing, headers=auth_headers["photographer"]).status_code == 404
+    assert client.post("/photos/share", json=body, headers=auth_headers["user"]).status_code == 403
+
+def test_expired_shares_swept_in_batches(db, test_photo, test_user):
+    """Test the sweeper deletes only expired shares, a batch at a time"""
+    from datetime import datetime, timedelta
+    from models import SharePhoto
+    from services.share_utils import clean_expired_shares
+    now = datetime.utcnow()
+    viewers = [User(username=f"client{i}", password="x", role="User") for i in range(5)]
+    db.add_all(viewers)
+    db.flush()
+    expiries = [now - timedelta(hours=1)] * 3 + [now + timedelta(hours=1), None]
+    db.add_all(
+        SharePhoto(photo_id=test_photo.photo_id, user_id=viewer.user_id, expires_at=expires_at)
+        for viewer, expires_at in zip(viewers, expiries)
+    )
+    db.commit()
+
+    assert clean_expired_shares(db, batch_size=2, now=now) == 3
+    remaining = db.query(SharePhoto).filter(SharePhoto.photo_id == test_photo.photo_id).all()
+    assert sorted(share.user_id for share in remaining) == [viewers[3].user_id, viewers[4].user_id]
+
+def test_access_cache_expiry_and_eviction():
+    """Test entries expire with their TTL and the least recently used are evicted"""
+    from services.access import AccessCache, PhotoAccess
+    cache = AccessCache(ttl=60, maxsize=2)
+    access = PhotoAccess(True, 1, "a.jpg", None)
+    cache.put(1, 10, access)
+    cache.put(1, 11, access, ttl=0)  # e.g. a share expiring right now
+    assert cache.get(1, 11) is None
+    cache.put(2, 10, access)
+    cache.get(1, 10)
+    cache.put(3, 12, access)
+    assert cache.get(2, 10) is None
+    assert cache.get(1, 10) == access
+
+    cache.invalidate_photo(10)
+    assert cache.get(1, 10) is None
+    assert cache.get(3, 12) == access
+    cache.invalidate_viewer(3)
+    assert cache.get(3, 12) is None
+
 def test_list_photos(client, test_photo , auth_headers):
     """Test listing photos"""
     response = client.get("/photos/",headers=auth_headers["photographer"])
@@ -178,7 +928,9 @@ def test_delete_own_photo(client, test_photo, auth_headers, db):
     deleted_photo = db.query(Photo).filter(Photo.photo_id == test_photo.photo_id).first()
     assert deleted_photo is None
     
-    # Verify file was deleted
+    # The file goes once the reaper works off the journal, not during the request
+    assert os.path.exists(test_photo.file_path)
+    assert reap(db) == 1
     assert not os.path.exists(test_photo.file_path)
 
 def test_delete_other_users_photo(client, test_photo, auth_headers):
@@ -0,0 +1,241 @@
+import hashlib
+import io
+import os
+from datetime import datetime, timezone
+from unittest.mock import patch
+import pytest
+from PIL import Image
+from models import PendingDeletion, Photo, StoredFile, User
+from services.reaper import FileReaper, OrphanSweep
+from services.storage import StorageMigration, release_photos
+from services.storage_backends import LocalBackend, S3Backend, get_storage_backend
+from settings import settings
+
+
+def test_migration_moves_legacy_files_and_merges_duplicates(db, tmp_path):
+    """Test flat files move into the sharded store, identical ones collapse and reruns are no-ops"""
+    owner = User(username="migrator", password="x", role="Photographer")
+    db.add(owner)
+    db.flush()
+
+    paths = []
+    for name, color in (("1.jpg", "red"), ("2.jpg", "red"), ("3.png", "blue")):
+        path = str(tmp_path / name)
+        Image.new("RGB", (16, 16), color=color).save(path, format="PNG" if name.endswith(".png") else "JPEG")
+        paths.append(path)
+    photos = [Photo(owner_id=owner.user_id, file_path=path) for path in paths]
+    photos.append(Photo(owner_id=owner.user_id, file_path=str(tmp_path / "missing.jpg")))
+    db.add_all(photos)
+    db.commit()
+    ids = [photo.photo_id for photo in photos]
+
+    with patch("services.storage.UPLOAD_DIR", str(tmp_path)):
+        stats = StorageMigration(session_factory=lambda: db, page_size=2, grace=0).run()
+        assert stats == {"migrated": 3, "missing": 1, "removed": 3}
+
+        first, second, third, missing = (db.get(Photo, photo_id) for photo_id in ids)
+        red_hash = hashlib.sha256(open(first.file_path, "rb").read()).hexdigest()
+        assert first.file_path == second.file_path == str(tmp_path / red_hash[:2] / red_hash[2:4] / f"{red_hash}.jpg")
+        assert first.content_hash == red_hash
+        assert third.file_path.endswith(".png") and os.path.exists(third.file_path)
+        assert db.get(StoredFile, red_hash).ref_count == 2
+        assert not any(os.path.exists(path) for path in paths)
+        assert missing.file_path == str(tmp_path / "missing.jpg")
+
+        assert StorageMigration(session_factory=lambda: db, grace=0).run()["migrated"] == 0
+
+
+class FakeS3:
+    """
+    In-memory stand-in for an S3-compatible server (MinIO, R2, ...), speaking the boto3 client calls S3Backend uses
+    """
+
+    def __init__(self):
+        self.objects = {}
+
+    def _object(self, Bucket, Key):
+        from botocore.exceptions import ClientError
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return self.objects[(Bucket, Key)]
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        with open(Filename, "rb") as f:
+            self.objects[(Bucket, Key)] = {"data": f.read(), "ContentType": (ExtraArgs or {}).get("ContentType"), "LastModified": datetime.now(timezone.utc)}
+
+    def head_object(self, Bucket, Key):
+        obj = self._object(Bucket, Key)
+        return {"ContentLength": len(obj["data"]), "LastModified": obj["LastModified"], "ContentType": obj["ContentType"]}
+
+    def get_object(self, Bucket, Key, Range=None):
+        from botocore.exceptions import ClientError
+        data = self._object(Bucket, Key)["data"]
+        obj = self.head_object(Bucket, Key)
+        if Range:
+            start, end = Range.removeprefix("bytes=").split("-")
+            start, end = (len(data) - int(end), len(data) - 1) if not start else (int(start), min(int(end or len(data) - 1), len(data) - 1))
+            if start >= len(data):
+                raise ClientError({"Error": {"Code": "InvalidRange"}}, "GetObject")
+            obj["ContentRange"] = f"bytes {start}-{end}/{len(data)}"
+            data = data[start:end + 1]
+        return {**obj, "ContentLength": len(data), "Body": io.BytesIO(data)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn):
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?X-Amz-Expires={ExpiresIn}"
+
+
+def test_s3_backend_round_trip(tmp_path):
+    """Test files are stored under prefixed keys, read back, stat'ed and deleted"""
+    s3 = FakeS3()
+    backend = S3Backend(str(tmp_path), client=s3, bucket="photos", prefix="originals/")
+    stored_path = str(tmp_path / "ab" / "cd" / "abcd.png")
+    local = tmp_path / "upload.part"
+    Image.new("RGB", (8, 8), color="red").save(local, format="PNG")
+    data = local.read_bytes()
+
+    backend.put(str(local), stored_path)
+    assert not local.exists()
+    assert s3.objects[("photos", "originals/ab/cd/abcd.png")]["ContentType"] == "image/png"
+    assert backend.exists(stored_path)
+    assert backend.stat(stored_path).st_size == len(data)
+    with backend.open(stored_path) as f:
+        assert Image.open(f).size == (8, 8)
+
+    backend.delete(stored_path)
+    assert not backend.exists(stored_path)
+    with pytest.raises(FileNotFoundError):
+        backend.open(stored_path)
+
+
+def test_s3_backend_responses(tmp_path):
+    """Test views redirect to a presigned URL or stream the object through"""
+    s3 = FakeS3()
+    backend = S3Backend(str(tmp_path), client=s3, bucket="photos", prefix="")
+    stored_path = str(tmp_path / "ab" / "abcd.jpg")
+    local = tmp_path / "a.jpg"
+    local.write_bytes(b"jpeg bytes")
+    backend.import_file(str(local), stored_path)
+    assert local.exists()
+
+    with patch.object(settings, "STORAGE_SERVE", "redirect"):
+        response = backend.response(stored_path, {"ETag": '"x"'})
+    assert response.status_code == 302
+    assert response.headers["location"] == f"https://s3.test/photos/ab/abcd.jpg?X-Amz-Expires={settings.S3_PRESIGN_EXPIRES}"
+    assert response.headers["etag"] == '"x"'
+
+    response = backend.response(stored_path, {})
+    assert response.headers["content-length"] == str(len(b"jpeg bytes"))
+    assert response.media_type == "image/jpeg"
+
+    response = backend.response(stored_path, {}, byte_range="bytes=5-")
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 5-9/10"
+    assert response.headers["content-length"] == "5"
+
+    response = backend.response(stored_path, {}, byte_range="bytes=20-")
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */10"
+
+
+
+def test_storage_backend_rejects_unsupported_serve_mode():
+    with patch.object(settings, "STORAGE_SERVE", "x-accel-redirect"):
+        with pytest.raises(ValueError):
+            get_storage_backend("s3", root="uploads")
+        assert get_storage_backend("local", root="uploads").name == "local"
+    with pytest.raises(ValueError):
+        get_storage_backend("ftp", root="uploads")
+
+
+@pytest.fixture
+def local_store(tmp_path):
+    rendition_dir = tmp_path / "renditions"
+    rendition_dir.mkdir()
+    with patch("services.storage.UPLOAD_DIR", str(tmp_path)), \
+         patch("services.storage.backend", LocalBackend(str(tmp_path))), \
+         patch("services.renditions.RENDITION_DIR", str(rendition_dir)):
+        yield tmp_path
+
+
+def stored_file(db, root, content_hash, ref_count, age=0):
+    path = root / content_hash[:2] / content_hash[2:4] / f"{content_hash}.jpg"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content_hash.encode())
+    if age:
+        os.utime(path, (path.stat().st_mtime - age,) * 2)
+    db.add(StoredFile(content_hash=content_hash, file_path=str(path), ref_count=ref_count))
+    return path
+
+
+def test_release_journals_files_for_the_reaper(db, local_store):
+    """Test releasing photos only journals their files, and the reaper keeps files other photos still use"""
+    owner = User(username="leaving", password="x", role="Photographer")
+    other = User(username="staying", password="x", role="Photographer")
+    db.add_all([owner, other])
+    db.flush()
+    shared = stored_file(db, local_store, "a" * 64, 2)
+    own = stored_file(db, local_store, "b" * 64, 2)
+    legacy = local_store / "7.jpg"
+    legacy.write_bytes(b"old")
+    photos = [
+        Photo(owner_id=owner.user_id, file_path=str(shared), content_hash="a" * 64),
+        Photo(owner_id=other.user_id, file_path=str(shared), content_hash="a" * 64),
+        Photo(owner_id=owner.user_id, file_path=str(own), content_hash="b" * 64),
+        Photo(owner_id=owner.user_id, file_path=str(own), content_hash="b" * 64),
+        Photo(owner_id=owner.user_id, file_path=str(legacy)),
+    ]
+    db.add_all(photos)
+    db.commit()
+    rendition = local_store / "renditions" / f"{photos[0].photo_id}_256.jpg"
+    rendition.write_bytes(b"small")
+
+    photo_ids = [photo.photo_id for photo in photos if photo.owner_id == owner.user_id]
+    release_photos(db, Photo.owner_id == owner.user_id)
+    db.query(Photo).filter(Photo.owner_id == owner.user_id).delete()
+    db.commit()
+    assert db.get(StoredFile, "a" * 64).ref_count == 1
+    assert db.get(StoredFile, "b" * 64).ref_count == 0
+    assert db.query(PendingDeletion).count() == 4
+    assert shared.exists() and own.exists() and legacy.exists() and rendition.exists()
+
+    with patch("services.reaper.embedding_index") as index:
+        assert FileReaper(session_factory=lambda: db).run_once() == 4
+    assert sorted(index.remove_many.call_args[0][0]) == sorted(photo_ids)
+    assert shared.exists() and not own.exists() and not legacy.exists() and not rendition.exists()
+    assert db.get(StoredFile, "a" * 64).ref_count == 1
+    assert db.get(StoredFile, "b" * 64) is None
+    assert db.query(PendingDeletion).count() == 0
+
+
+def test_orphan_sweep_reconciles_store_with_photos(db, local_store):
+    """Test the sweep journals unused files, repairs low counts and leaves fresh files alone"""
+    owner = User(username="sweeper", password="x", role="Photographer")
+    db.add(owner)
+    db.flush()
+    used = stored_file(db, local_store, "c" * 64, 0, age=7200)
+    tombstone = stored_file(db, local_store, "d" * 64, 0, age=7200)
+    db.add(Photo(owner_id=owner.user_id, file_path=str(used), content_hash="c" * 64))
+    db.commit()
+
+    orphan = local_store / "ee" / "ee" / f"{'e' * 64}.jpg"
+    fresh = local_store / "ff" / "ff" / f"{'f' * 64}.jpg"
+    temp = local_store / ".upload-abc.part"
+    rendition = local_store / "renditions" / "999999_256.jpg"
+    for path in (orphan, fresh, temp, rendition):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x")
+        if path != fresh:
+            os.utime(path, (path.stat().st_mtime - 7200,) * 2)
+
+    stats = OrphanSweep(session_factory=lambda: db, min_age=3600).run()
+    assert stats == {"repaired": 1, "orphans": 2, "renditions": 1, "temp_files": 1}
+    assert db.get(StoredFile, "c" * 64).ref_count == 1
+    assert not temp.exists() and not rendition.exists()
+
+    FileReaper(session_factory=lambda: db).run_once()
+    assert used.exists() and fresh.exists()
+    assert not orphan.exists() and not tombstone.exists()
+    assert db.get(StoredFile, "d" * 64) is None
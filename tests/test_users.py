@@ -81,4 +81,38 @@ def test_delete_user(client, auth_headers):
     
     # Verify user is deleted
     get_resp = client.get(f"/users/{user_id}")
-    assert get_resp.status_code == 401
\ No newline at end of file
+    assert get_resp.status_code == 401
+def test_delete_user_statements_do_not_grow_with_photos(client, db):
+    """Test deleting a photographer runs the same statements for 1 or 20 photos, and the cascade still removes their rows"""
+    from sqlalchemy import event
+    from models import Like, PendingDeletion, Photo, SharePhoto
+    fan = User(username="fan", password="x", role="User")
+    db.add(fan)
+    db.flush()
+
+    def delete_photographer(name, photo_count):
+        photographer = User(username=name, password="x", role="Photographer")
+        db.add(photographer)
+        db.flush()
+        photos = [Photo(owner_id=photographer.user_id, file_path=f"{name}-{i}.jpg") for i in range(photo_count)]
+        db.add_all(photos)
+        db.flush()
+        db.add_all(Like(user_id=fan.user_id, photo_id=photo.photo_id) for photo in photos)
+        db.add_all(SharePhoto(photo_id=photo.photo_id, user_id=fan.user_id) for photo in photos)
+        db.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(data={'sub': name})}"}
+
+        statements = []
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+        event.listen(db.get_bind().engine, "before_cursor_execute", count)
+        try:
+            assert client.delete(f"/users/{photographer.user_id}", headers=headers).status_code == 204
+        finally:
+            event.remove(db.get_bind().engine, "before_cursor_execute", count)
+        return statements
+
+    assert len(delete_photographer("few", 1)) == len(delete_photographer("many", 20))
+    assert db.query(Photo).count() == 0
+    assert db.query(Like).count() == db.query(SharePhoto).count() == 0
+    assert db.query(PendingDeletion).count() == 21
@@ -0,0 +1,107 @@
+import os
+import numpy as np
+from services.vector_index import EmbeddingIndex
+
+
+def unit(*values, dim=8):
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[:len(values)] = values
+    return vector
+
+
+def test_add_get_and_search(tmp_path):
+    index = EmbeddingIndex(str(tmp_path), dim=8)
+    index.add(1, unit(1, 0))
+    index.add(2, unit(0.9, 0.1))
+    index.add(3, unit(0, 1))
+
+    assert len(index) == 3
+    assert np.allclose(index.get(1), unit(1, 0), atol=1e-3)
+
+    results = index.search(unit(1, 0), k=2)
+    assert [photo_id for photo_id, _ in results] == [1, 2]
+    assert results[0][1] > results[1][1]
+
+
+def test_search_excludes_and_skips_removed(tmp_path):
+    index = EmbeddingIndex(str(tmp_path), dim=8)
+    for photo_id in range(1, 6):
+        index.add(photo_id, unit(1, photo_id / 10))
+
+    index.remove(2)
+    results = index.search(unit(1, 0), k=10, exclude_ids=[1])
+    assert {photo_id for photo_id, _ in results} == {3, 4, 5}
+    assert index.get(2) is None
+
+
+def test_replacing_an_embedding_keeps_one_row(tmp_path):
+    index = EmbeddingIndex(str(tmp_path), dim=8)
+    index.add(7, unit(1, 0))
+    index.add(7, unit(0, 1))
+
+    assert len(index) == 1
+    assert np.allclose(index.get(7), unit(0, 1), atol=1e-3)
+
+
+def test_search_across_chunks_and_reopen(tmp_path):
+    """Test top-k merging over several chunks and that a fresh instance sees the same data"""
+    rng = np.random.default_rng(0)
+    index = EmbeddingIndex(str(tmp_path), dim=8)
+    index.SEARCH_CHUNK_ROWS = 16
+    vectors = rng.standard_normal((100, 8)).astype(np.float32)
+    for photo_id, vector in enumerate(vectors, start=1):
+        index.add(photo_id, vector)
+
+    query = vectors[41]
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = list(np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5] + 1)
+
+    reopened = EmbeddingIndex(str(tmp_path), dim=8)
+    reopened.SEARCH_CHUNK_ROWS = 16
+    assert [photo_id for photo_id, _ in reopened.search(query, k=5)] == expected
+
+
+def test_search_pages_with_after(tmp_path):
+    """Test paging with `after` walks the full ranking once, ties ordered by id"""
+    index = EmbeddingIndex(str(tmp_path), dim=8)
+    index.SEARCH_CHUNK_ROWS = 4
+    for photo_id in range(1, 11):
+        # Pairs of identical vectors give tied scores
+        index.add(photo_id, unit(1, (photo_id + 1) // 2 / 10))
+
+    full = index.search(unit(1, 0), k=10)
+    pages, after = [], None
+    while True:
+        page = index.search(unit(1, 0), k=3, after=after)
+        if not page:
+            break
+        pages.extend(page)
+        after = (page[-1][1], page[-1][0])
+
+    assert pages == full
+    assert [photo_id for photo_id, _ in full][:4] == [1, 2, 3, 4]
+
+
+def test_compact_drops_tombstoned_rows(tmp_path):
+    """Test compaction shrinks the files and that other instances and later writes see the compacted index"""
+    index = EmbeddingIndex(str(tmp_path), dim=8)
+    other = EmbeddingIndex(str(tmp_path), dim=8)
+    for photo_id in range(1, 6):
+        index.add(photo_id, unit(1, photo_id / 10))
+    index.add(2, unit(0, 1))
+    other.remove(4)
+    assert other.search(unit(1, 0), k=1)[0][0] == 1
+
+    assert index.compact() == 2
+    assert index.compact() == 0
+    assert os.path.getsize(tmp_path / "ids.i64") == 4 * 8
+
+    assert len(other) == 4
+    assert np.allclose(other.get(2), unit(0, 1), atol=1e-3)
+    assert other.get(4) is None
+
+    # The other instance's row map predates the compaction and must not tombstone by stale rows
+    other.add(3, unit(0, 0, 1))
+    assert {photo_id for photo_id, _ in index.search(unit(1, 0), k=10)} == {1, 2, 3, 5}
+    assert np.allclose(index.get(5), unit(1, 0.5) / np.linalg.norm(unit(1, 0.5)), atol=1e-3)
+    assert len(index) == 4